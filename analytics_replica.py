@@ -0,0 +1,164 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from connection_pool import ConnectionPool, create_pooled_connection
+from query_cache import QueryCache
+from query_workers import QueryWorkers
+
+# Seconds between refreshes of the analytics copy. A refresh copies the whole
+# database (about 2s for 400 MiB), but is skipped while nothing was committed.
+DEFAULT_REFRESH_SECONDS = 300
+
+# A copy older than this many refresh intervals is flagged on the report pages,
+# since refreshes are evidently failing or falling behind
+STALE_INTERVALS = 2
+
+# Pages whose reads are served from the copy instead of the live database
+ANALYTICS_PAGES = ["Query Section", "Delivery Performance", "Order Heatmap"]
+
+
+def replica_path(db_file):
+    root, extension = os.path.splitext(db_file)
+    return f"{root}.analytics{extension or '.db'}"
+
+
+class AnalyticsReplica:
+    """
+    Read-only copy of the database for the report pages, refreshed in the
+    background with the online backup API so their long scans never hold
+    locks or evict pages on the database that order entry writes to.
+
+    The copy is kept in WAL mode and refreshed in place: readers that are
+    mid-query finish on the copy they started with, and their next query
+    sees the new one, so connections, compiled statements and workers on the
+    copy are kept across refreshes. Results read from it have a cache of
+    their own, cleared on every refresh rather than by writes.
+    """
+
+    def __init__(self, db_file, path=None, interval=DEFAULT_REFRESH_SECONDS, profiler=None):
+        self.db_file = db_file
+        self.path = path or replica_path(db_file)
+        self.interval = interval
+        self.pool = ConnectionPool(self.path, profiler=profiler)
+        self.cache = QueryCache()
+        self.workers = QueryWorkers(self.path, profiler=profiler, cache=self.cache)
+        # When the copy was last known to match the live database, as a Unix time
+        self.current_at = None
+        self.refreshes = 0
+        self.skipped = 0
+        self.last_duration = 0.0
+        self.error = None
+        self._source = None
+        self._data_version = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.current_at is not None
+
+    @property
+    def age(self):
+        """
+        Seconds since the copy was last known to be current, or None before the first refresh.
+        """
+        return None if self.current_at is None else max(0.0, time.time() - self.current_at)
+
+    @property
+    def stale(self):
+        return self.age is None or self.age > self.interval * STALE_INTERVALS
+
+    def refresh(self, force=False):
+        """
+        Bring the copy up to date with the live database. The copy is skipped
+        when nothing has been committed since the last one, unless force=True.
+        Returns True if the database was copied.
+        """
+        with self._lock:
+            if self._source is None:
+                self._source = create_pooled_connection(self.db_file, read_only=True)
+            checked_at = time.time()
+            # data_version changes whenever another connection commits
+            version = self._source.execute("PRAGMA data_version").fetchone()[0]
+            if not force and self.ready and version == self._data_version:
+                self.current_at = checked_at
+                self.skipped += 1
+                return False
+
+            started = time.perf_counter()
+            # Copied in one step, so the copy is a single read transaction on
+            # the live database. In WAL mode that does not hold up its writer,
+            # whereas a stepped copy restarts whenever a write lands between steps.
+            with self.pool.writer() as target:
+                self._source.backup(target)
+                # Move the copied pages out of the WAL into the file; readers still
+                # on the previous copy only keep their part of the WAL from being reused
+                target.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+            self.last_duration = time.perf_counter() - started
+            self._data_version = version
+            self.current_at = checked_at
+            self.refreshes += 1
+            self.error = None
+        self.cache.clear()
+        return True
+
+    def request_refresh(self):
+        """
+        Ask the background thread to refresh now, e.g. after a write from a report page.
+        """
+        self._wake.set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="analytics-replica", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                self.refresh()
+            except sqlite3.Error as e:
+                self.error = str(e)
+                print(f"Error: analytics replica refresh failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def stats(self):
+        return {
+            "refreshes": self.refreshes,
+            "skipped": self.skipped,
+            "last_duration": self.last_duration,
+            "size_mb": os.path.getsize(self.path) / 2 ** 20 if os.path.exists(self.path) else 0.0,
+        }
+
+    def close(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.workers.shutdown()
+        self.pool.close()
+        with self._lock:
+            if self._source is not None:
+                self._source.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh the read-only analytics copy of the database.")
+    parser.add_argument("--db", default="food_delivery.db", help="SQLite database file")
+    parser.add_argument("--path", default=None, help="analytics copy (default: <db>.analytics.db)")
+    args = parser.parse_args()
+
+    replica = AnalyticsReplica(args.db, args.path)
+    replica.refresh(force=True)
+    stats = replica.stats()
+    print(f"Copied {args.db} to {replica.path} ({stats['size_mb']:.1f} MiB) in {stats['last_duration']:.2f}s.")
+    replica.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,120 @@
 import streamlit as st
-import sqlite3
+from contextlib import nullcontext
+from analytics_replica import ANALYTICS_PAGES, AnalyticsReplica
+from approximate import ApproximateSummary
+from connection_pool import ConnectionPool, PoolTimeout
+from database import initialize_database
 from manager import DatabaseManager  # Import the class from manager.py
+from order_snapshot import OrderSnapshot
+from profiling import QueryProfiler
+from queries import CATALOG
+from query_cache import QueryCache
+from query_workers import QueryWorkers
+from schema_catalog import SchemaCatalog
+from write_queue import WriteQueue
 
 DATABASE_FILE = 'food_delivery.db'
 
+# Statement and page timings for the Performance page, shared by every session
+@st.cache_resource
+def get_profiler():
+    return QueryProfiler()
+
+# One connection pool per process, shared by every session and rerun.
+# The query catalog is checked against the schema once, when the pool opens.
+@st.cache_resource
+def get_connection_pool():
+    initialize_database(DATABASE_FILE)
+    pool = ConnectionPool(DATABASE_FILE, profiler=get_profiler())
+    with pool.reader() as conn:
+        for problem in CATALOG.validate(conn):
+            print(f"Error: {problem}")
+    return pool
+
+# Query results shared across sessions, invalidated by DatabaseManager writes
+@st.cache_resource
+def get_query_cache():
+    return QueryCache()
+
+# Columnar copy of orders for the Query Section aggregates, refreshed by order_id watermark
+@st.cache_resource
+def get_order_snapshot():
+    return OrderSnapshot()
+
+# Background threads for long Query Section queries, with their own read connections
+@st.cache_resource
+def get_query_workers():
+    return QueryWorkers(DATABASE_FILE, profiler=get_profiler(), cache=get_query_cache())
+
+# Single writer that commits CRUD writes from every session in groups
+@st.cache_resource
+def get_write_queue():
+    return WriteQueue(get_connection_pool())
+
+# Tables, columns and indexes shared by every page, reloaded when schema_version changes
+@st.cache_resource
+def get_schema_catalog():
+    return SchemaCatalog()
+
+# Reservoir sample and sketches behind approximate Query Section answers, built in the background
+@st.cache_resource
+def get_approximate_summary():
+    return ApproximateSummary(db_file=DATABASE_FILE)
+
+# Read-only copy of the database for the report pages, refreshed in the background
+@st.cache_resource
+def get_analytics_replica():
+    replica = AnalyticsReplica(DATABASE_FILE, profiler=get_profiler())
+    replica.start()
+    return replica
+
 def main():
     st.title("Zomato - Food Delivery Data Management")
 
-    # Database Connection
-    conn = sqlite3.connect(DATABASE_FILE)
+    # Database Connection: a warm read connection checked out for this rerun
+    # Every connection busy (e.g. held by sessions waiting on long queries)
+    # shows an error for this rerun instead of hanging it
+    pool = get_connection_pool()
+    try:
+        with pool.reader() as conn:
+            render_page(conn, pool, get_query_cache(), get_order_snapshot(), get_query_workers(),
+                        get_write_queue(), get_schema_catalog(), get_approximate_summary(), get_analytics_replica())
+    except PoolTimeout as e:
+        st.error(f"Error: {e}")
 
+def render_page(conn, pool, cache, snapshot=None, workers=None, writes=None, catalog=None, approximate=None,
+                replica=None):
     st.sidebar.title("Navigation")
     menu = st.sidebar.radio(
         "Menu",
-        ["Home", "Manage Customers", "Manage Restaurants", "Manage Orders", "Manage Deliveries", "Column Management", "Query Section", "Table Management"]
+        ["Home", "Manage Customers", "Manage Restaurants", "Manage Orders", "Manage Deliveries", "Column Management", "Query Section", "Table Management", "Delivery Performance", "Order Heatmap", "Performance"]
     )
 
-    # Create an instance of the DatabaseManager class
-    manager = DatabaseManager(conn)
+    # Report pages read from the analytics copy once it has been made, so their
+    # scans stay off the database that order entry writes to
+    on_replica = replica is not None and replica.ready and menu in ANALYTICS_PAGES
+    if replica is not None and not replica.ready and menu in ANALYTICS_PAGES:
+        st.caption("The analytics copy is still being made; this page reads the live database meanwhile.")
+
+    with replica.pool.reader() if on_replica else nullcontext(conn) as page_conn:
+        # Create an instance of the DatabaseManager class
+        if on_replica:
+            manager = DatabaseManager(page_conn, pool, cache, snapshot, replica.workers, writes, catalog,
+                                      approximate, replica)
+        else:
+            manager = DatabaseManager(page_conn, pool, cache, snapshot, workers, writes, catalog, approximate)
+
+        if on_replica:
+            manager.replica_status()
+
+        # Time the page and tag its statements; the Performance page is not measured itself
+        if menu == "Performance":
+            manager.performance()
+        else:
+            with pool.profiler.track_page(menu):
+                render_menu(manager, menu)
 
+def render_menu(manager, menu):
     if menu == "Manage Customers":
         manager.manage_customers()
     elif menu == "Manage Restaurants":
@@ -33,10 +129,12 @@ def main():
         manager.query_section()
     elif menu == "Table Management":
         manager.manage_tables()
+    elif menu == "Delivery Performance":
+        manager.delivery_performance()
+    elif menu == "Order Heatmap":
+        manager.order_heatmap()
     else:
         st.write("Welcome to the Food Delivery Management App!")
-    
-    conn.close()
 
 if __name__ == "__main__":
     main()
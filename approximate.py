@@ -0,0 +1,448 @@
+import argparse
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+import numpy as np
+from connection_pool import create_pooled_connection
+from order_snapshot import as_number, orders_version, sqlite_epoch
+from queries import CATALOG, SINCE_DAYS
+
+# Orders kept in the reservoir sample. Sampled means are within a few percent
+# of the exact ones at any table size, since the error depends on the sample
+# size and not on the number of orders.
+SAMPLE_SIZE = 10_000
+
+# Rows pulled per fetchmany call while streaming new rows into the summary
+REFRESH_BATCH_SIZE = 100_000
+
+# HyperLogLog registers are 2 ** precision: 16,384 one-byte registers give a
+# standard error of 1.04 / sqrt(16384), about 0.8%
+HLL_PRECISION = 14
+
+# Count-min sketches overcount a value by at most e / width of all rows, with
+# probability 1 - e ** -depth (about 0.13% of the rows, 99.3% of the time)
+CM_WIDTH = 2048
+CM_DEPTH = 5
+
+# Distinct values remembered per counted column, to list their frequencies
+MAX_TRACKED_VALUES = 1000
+
+# Updates and deletes are not streamed into the summary; once the orders
+# changed since it was built exceed this fraction of them, it is rebuilt
+REBUILD_FRACTION = 0.05
+
+# Two-sided 95% normal quantile for the confidence intervals of sampled estimates
+Z_95 = 1.96
+
+# Sample columns, all held as float64 with NULL as NaN
+SAMPLE_COLUMNS = ["customer_id", "order_date", "total_amount", "discount_applied"]
+ORDERS_QUERY = (
+    "SELECT order_id, status, customer_id, CAST(strftime('%s', order_date) AS INTEGER), total_amount, discount_applied "
+    "FROM orders WHERE order_id > ? ORDER BY order_id"
+)
+CUSTOMERS_QUERY = "SELECT customer_id, preferred_cuisine FROM customers WHERE customer_id > ? ORDER BY customer_id"
+
+
+def mix64(values):
+    """
+    SplitMix64 finalizer over an array of 64-bit integers, spreading sequential
+    ids evenly over all 64 bits.
+    """
+    with np.errstate(over="ignore"):
+        z = np.asarray(values).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+# Stable 64-bit key of a column value (text, number or NULL) for the count-min sketches
+def value_key(value):
+    return int.from_bytes(hashlib.blake2b(repr(value).encode(), digest_size=8).digest(), "little")
+
+
+class Reservoir:
+    """
+    Uniform sample of a stream of rows (Algorithm R): the i-th row replaces a
+    random slot with probability size / i, so every row seen so far is in the
+    sample with the same probability however the stream was batched.
+    """
+
+    def __init__(self, size, width, rng):
+        self.size = size
+        self.rng = rng
+        self.rows = np.empty((size, width))
+        self.filled = 0
+        self.seen = 0
+
+    @property
+    def sample(self):
+        return self.rows[:self.filled]
+
+    def add(self, rows):
+        count = len(rows)
+        fill = min(count, self.size - self.filled)
+        self.rows[self.filled:self.filled + fill] = rows[:fill]
+        self.filled += fill
+        positions = np.arange(self.seen + fill, self.seen + count)
+        self.seen += count
+        if not len(positions):
+            return
+        slots = self.rng.integers(0, positions + 1)
+        chosen = np.flatnonzero(slots < self.size)
+        # A later row overwrites an earlier one of the batch that drew the same slot
+        last = len(chosen) - 1 - np.unique(slots[chosen][::-1], return_index=True)[1]
+        self.rows[slots[chosen[last]]] = rows[fill + chosen[last]]
+
+
+class HyperLogLog:
+    """
+    Distinct-count sketch: each value is hashed to a register, which keeps the
+    longest run of leading zero bits seen among its hashes.
+    """
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, values):
+        hashes = mix64(values)
+        bits = 64 - self.precision
+        index = (hashes >> np.uint64(bits)).astype(np.int64)
+        # Below 2 ** 50 the float conversion is exact, so frexp gives the bit length
+        rest = (hashes & np.uint64((1 << bits) - 1)).astype(np.float64)
+        rank = (bits + 1 - np.frexp(rest)[1]).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        # Linear counting is more accurate while many registers are still empty
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return raw
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+class CountMinSketch:
+    """
+    Frequency sketch: every value adds its count to one cell per row, and its
+    estimate is the smallest of its cells, so it never undercounts.
+    """
+
+    def __init__(self, width=CM_WIDTH, depth=CM_DEPTH):
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+
+    def _cells(self, keys):
+        keys = np.asarray(keys, dtype=np.uint64)
+        width = np.uint64(self.table.shape[1])
+        with np.errstate(over="ignore"):
+            return [(mix64(keys + np.uint64(row) * np.uint64(0x632BE59BD9B4E019)) % width).astype(np.int64)
+                    for row in range(self.table.shape[0])]
+
+    def add(self, keys, counts):
+        for row, cells in enumerate(self._cells(keys)):
+            np.add.at(self.table[row], cells, counts)
+        self.total += int(np.sum(counts))
+
+    def estimate(self, keys):
+        return np.min([self.table[row][cells] for row, cells in enumerate(self._cells(keys))], axis=0)
+
+    @property
+    def error_bound(self):
+        return math.e / self.table.shape[1] * self.total
+
+
+def count_values(sketch, tracked, values):
+    """
+    Add a batch of column values to a count-min sketch, remembering up to
+    MAX_TRACKED_VALUES distinct ones so their frequencies can be listed.
+    """
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    for value in counts:
+        if value not in tracked and len(tracked) < MAX_TRACKED_VALUES:
+            tracked[value] = value_key(value)
+    sketch.add([value_key(value) for value in counts], list(counts.values()))
+
+
+def sampled_mean(values, population):
+    """
+    Mean of the non-NULL sampled values as (estimate, 95% margin), with the
+    finite population correction for a sample drawn without replacement.
+    """
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return None, None
+    if len(values) < 2:
+        return values.mean(), None
+    correction = math.sqrt(max(0.0, 1 - len(values) / max(population, 1)))
+    return values.mean(), Z_95 * values.std(ddof=1) / math.sqrt(len(values)) * correction
+
+
+def sampled_total(values, sample_size, population):
+    """
+    Population total of values (NULL counting as 0) scaled up from the sample,
+    as (estimate, 95% margin).
+    """
+    values = np.nan_to_num(values)
+    if not sample_size:
+        return None, None
+    estimate = population * values.mean()
+    if sample_size < 2:
+        return estimate, None
+    correction = math.sqrt(max(0.0, 1 - sample_size / max(population, 1)))
+    return estimate, Z_95 * population * values.std(ddof=1) / math.sqrt(sample_size) * correction
+
+
+class ApproximateSummary:
+    """
+    Reservoir sample and sketches of orders and customers for approximate
+    Query Section answers. refresh() streams rows past the id watermarks into
+    them; order updates and deletes are counted by the snapshot version
+    triggers and only trigger a rebuild past REBUILD_FRACTION, so answers may
+    lag them until then. Customer updates and deletes show at the next rebuild.
+    """
+
+    def __init__(self, sample_size=SAMPLE_SIZE, seed=None, db_file=None):
+        self.sample_size = sample_size
+        self.seed = seed
+        # With db_file, full builds run on a background thread (see available)
+        self.db_file = db_file
+        self.error = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._reset(None)
+
+    def _reset(self, version):
+        self.orders = Reservoir(self.sample_size, len(SAMPLE_COLUMNS), np.random.default_rng(self.seed))
+        self.order_watermark = 0
+        self.statuses = CountMinSketch()
+        self.status_values = {}
+        self.customers = HyperLogLog()
+        self.customer_watermark = 0
+        self.cuisines = CountMinSketch()
+        self.cuisine_values = {}
+        self.version = version
+        self.changed = 0
+        self.built_at = None
+        # True once a refresh has streamed in every order and customer
+        self.complete = False
+
+    @property
+    def order_count(self):
+        return self.orders.seen
+
+    def column(self, name):
+        return self.orders.sample[:, SAMPLE_COLUMNS.index(name)]
+
+    # Start over at the next refresh, e.g. for a fresh sample
+    def invalidate(self):
+        with self._lock:
+            self._reset(None)
+
+    # Whether the orders changed since the summary was built call for a rebuild
+    def stale(self, conn):
+        version = orders_version(conn)
+        if version is None or self.version is None:
+            return False
+        self.changed = version - self.version
+        return self.changed > REBUILD_FRACTION * max(self.order_count, 1)
+
+    def _refresh(self, conn, batch_size):
+        version = orders_version(conn)
+        if self.stale(conn):
+            self._reset(None)
+        if self.built_at is None:
+            self.version = version
+            self.changed = 0
+            self.built_at = time.time()
+
+        added = 0
+        cursor = conn.execute(ORDERS_QUERY, (self.order_watermark,))
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            self.orders.add(np.array([row[2:] for row in batch], dtype=np.float64))
+            count_values(self.statuses, self.status_values, [row[1] for row in batch])
+            self.order_watermark = batch[-1][0]
+            added += len(batch)
+
+        cursor = conn.execute(CUSTOMERS_QUERY, (self.customer_watermark,))
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            ids = np.array([row[0] for row in batch], dtype=np.int64)
+            self.customers.add(ids)
+            count_values(self.cuisines, self.cuisine_values, [row[1] for row in batch])
+            self.customer_watermark = int(ids[-1])
+            added += len(batch)
+        self.complete = True
+        return added
+
+    def refresh(self, conn, batch_size=REFRESH_BATCH_SIZE):
+        """
+        Bring the summary up to date with orders and customers. Returns the number of rows streamed in.
+        """
+        with self._lock:
+            return self._refresh(conn, batch_size)
+
+    def available(self, conn):
+        """
+        Whether answers can be given now without a full scan. A summary that is
+        not built yet, or that order changes made stale, is built on a
+        background thread meanwhile, like the analytics copy; callers answer
+        exactly until it is done. Without db_file answers build it inline.
+        """
+        if self.db_file is None:
+            return True
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        if self.complete and not self.stale(conn):
+            return True
+        self._thread = threading.Thread(target=self._build, name="approximate-summary", daemon=True)
+        self._thread.start()
+        return False
+
+    def _build(self):
+        conn = create_pooled_connection(self.db_file, read_only=True)
+        try:
+            self.refresh(conn)
+            self.error = None
+        except sqlite3.Error as e:
+            self.error = str(e)
+            print(f"Error: approximate summary build failed: {e}")
+        finally:
+            conn.close()
+
+    def answer(self, conn, label, arguments=None):
+        """
+        Refresh, then answer a Query Section query for its bound arguments as
+        (columns, rows), each row ending with the error bound of its estimate.
+        """
+        with self._lock:
+            self._refresh(conn, REFRESH_BATCH_SIZE)
+            return APPROXIMATE_QUERIES[label](self, conn, **(arguments or {}))
+
+
+def with_bound(estimate, margin, digits=2):
+    if estimate is None:
+        return None, None
+    return round(float(estimate), digits), as_number(margin)
+
+
+def approximate_customer_count(summary, conn):
+    estimate = summary.customers.estimate()
+    count, bound = with_bound(estimate, Z_95 * summary.customers.relative_error * estimate, 0)
+    return ["COUNT(*)", "error_bound"], [(int(count), bound)]
+
+
+def approximate_average_order_value(summary, conn):
+    estimate, margin = sampled_mean(summary.column("total_amount"), summary.order_count)
+    return ["AVG(total_amount)", "error_bound"], [with_bound(estimate, margin)]
+
+
+def approximate_average_discount(summary, conn):
+    estimate, margin = sampled_mean(summary.column("discount_applied"), summary.order_count)
+    return ["AVG(discount_applied)", "error_bound"], [with_bound(estimate, margin)]
+
+
+def approximate_premium_order_value(summary, conn):
+    # Only the sampled orders' customers are looked up, by primary key
+    customer_ids = summary.column("customer_id")
+    known = np.unique(customer_ids[~np.isnan(customer_ids)]).astype(np.int64).tolist()
+    premium = [row[0] for row in conn.execute(
+        "SELECT customer_id FROM customers WHERE is_premium = 1 AND customer_id IN (SELECT value FROM json_each(?))",
+        (json.dumps(known),))]
+    is_premium = np.isin(customer_ids, premium)
+    amounts = summary.column("total_amount")[is_premium]
+    # The population the sample stands for is the premium orders, estimated
+    # from their share of the sample, not all orders
+    premium_orders = summary.order_count * np.count_nonzero(is_premium) / max(summary.orders.filled, 1)
+    estimate, margin = sampled_mean(amounts, premium_orders)
+    return ["AVG(total_amount)", "error_bound"], [with_bound(estimate, margin)]
+
+
+def approximate_cancelled_orders(summary, conn):
+    estimate = int(summary.statuses.estimate([value_key("Cancelled")])[0])
+    return ["COUNT(*)", "error_bound"], [(estimate, round(summary.statuses.error_bound))]
+
+
+def approximate_popular_cuisines(summary, conn, limit):
+    values = list(summary.cuisine_values)
+    estimates = summary.cuisines.estimate(list(summary.cuisine_values.values())) if values else []
+    bound = round(summary.cuisines.error_bound)
+    rows = sorted(((value, int(estimate), bound) for value, estimate in zip(values, estimates)), key=lambda row: -row[1])
+    return ["preferred_cuisine", "frequency", "error_bound"], rows[:limit]
+
+
+def approximate_revenue_last_30_days(summary, conn, days):
+    recent = summary.column("order_date") >= sqlite_epoch(conn, SINCE_DAYS, {"days": days})
+    if not recent.any():
+        return ["SUM(total_amount)", "error_bound"], [(None, None)]
+    amounts = np.where(recent, summary.column("total_amount"), 0.0)
+    estimate, margin = sampled_total(amounts, summary.orders.filled, summary.order_count)
+    return ["SUM(total_amount)", "error_bound"], [with_bound(estimate, margin)]
+
+
+# Query Section queries with an approximate answer, by label. Each takes the
+# query's bound arguments as keywords and returns the columns of the exact
+# query plus error_bound: the 95% confidence margin of a sampled or
+# HyperLogLog estimate, or the most a count-min frequency overcounts (99% of
+# the time; it never undercounts).
+APPROXIMATE_QUERIES = {
+    "1. Get the total number of customers": approximate_customer_count,
+    "3. Get the average order value for all customers": approximate_average_order_value,
+    "11. Get the average discount applied for all orders": approximate_average_discount,
+    "12. Get the average order amount for premium customers": approximate_premium_order_value,
+    "13. Get the total number of canceled orders": approximate_cancelled_orders,
+    "15. Get the most common cuisine types ordered by customers": approximate_popular_cuisines,
+    "20. Get the total revenue for the last 30 days": approximate_revenue_last_30_days,
+}
+
+
+# Indexed counts whose exact answer takes well under a millisecond; their
+# approximate answer is offered but the exact one is the default
+EXACT_BY_DEFAULT = {
+    "1. Get the total number of customers",
+    "13. Get the total number of canceled orders",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the approximate query summary and compare its answers.")
+    parser.add_argument("--db", default="food_delivery.db", help="SQLite database file")
+    parser.add_argument("--sample-size", type=int, default=SAMPLE_SIZE, help="orders kept in the reservoir sample")
+    parser.add_argument("--compare", action="store_true", help="also run each exact query, with its time")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    summary = ApproximateSummary(args.sample_size)
+    started = time.perf_counter()
+    added = summary.refresh(conn)
+    print(f"Summarized {added} rows in {time.perf_counter() - started:.2f}s")
+    for label in APPROXIMATE_QUERIES:
+        query = CATALOG[label]
+        started = time.perf_counter()
+        _, rows = summary.answer(conn, label, query.defaults)
+        print(f"{label}: {rows} ({(time.perf_counter() - started) * 1000:.1f}ms)")
+        if args.compare:
+            started = time.perf_counter()
+            rows = conn.execute(query.sql, query.defaults).fetchall()
+            print(f"    exact: {rows} ({(time.perf_counter() - started) * 1000:.1f}ms)")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
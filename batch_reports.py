@@ -0,0 +1,362 @@
+import argparse
+import csv
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from connection_pool import create_pooled_connection
+from partitions import is_partitioned, order_tables
+from queries import CATALOG, SINCE_MONTHS
+from rollups import rollups_installed
+
+DEFAULT_OUTPUT_DIR = "reports"
+
+# Expressions a shard of orders can be cut on, as used in the partial queries
+# (orders is aliased o, customers c). The expression ones match the expression indexes in
+# database.py, so each shard is a range seek on the same index the whole query uses.
+SHARD_COLUMNS = {
+    "order_id": "o.order_id",
+    "customer": "c.customer_id",
+    "restaurant": "o.restaurant_id",
+    "order_date": "o.order_date",
+    "day": "DATE(o.order_date)",
+    "month": "strftime('%Y-%m', o.order_date)",
+    "hour": "strftime('%H', o.order_date)",
+}
+
+
+class ShardedReport:
+    """
+    A catalog query rewritten as a partial aggregate over one shard of orders.
+    partial returns the key columns followed by the partial aggregates, one
+    column per "sum" or "count" and two (sum, count) per "avg". Without
+    aggregates the shards' rows are simply concatenated.
+    """
+
+    def __init__(self, partial, shard_by, columns, keys=0, aggregates=(), order_by=None, descending=False, limit=None):
+        self.partial = partial
+        self.shard_by = shard_by
+        self.columns = columns
+        self.keys = keys
+        self.aggregates = aggregates
+        self.order_by = order_by
+        self.descending = descending
+        self.limit = limit
+
+
+# Catalog queries over orders worth splitting, keyed by catalog name. Each is cut
+# on the column or expression whose index already serves it. The remaining
+# queries read small tables, seek a few days of orders or a handful of index
+# keys, and run whole.
+SHARDED_REPORTS = {
+    "avg_delivery_time": ShardedReport(
+        "SELECT r.name, SUM(d.delivery_time), COUNT(d.delivery_time) FROM restaurants r "
+        "JOIN orders o ON r.restaurant_id = o.restaurant_id JOIN deliveries d ON o.order_id = d.order_id "
+        "WHERE {shard} GROUP BY r.name",
+        "restaurant", ["name", "avg_delivery_time"], keys=1, aggregates=("avg",), order_by=1),
+    "peak_order_times": ShardedReport(
+        "SELECT strftime('%H', o.order_date) AS hour, COUNT(*) FROM orders o WHERE {shard} GROUP BY hour",
+        "hour", ["hour", "order_count"], keys=1, aggregates=("count",), order_by=1, descending=True),
+    "delayed_deliveries": ShardedReport(
+        "SELECT o.order_id, c.name AS customer_name, r.name AS restaurant_name, d.estimated_time, d.delivery_time "
+        "FROM orders o JOIN customers c ON o.customer_id = c.customer_id "
+        "JOIN restaurants r ON o.restaurant_id = r.restaurant_id JOIN deliveries d ON o.order_id = d.order_id "
+        "WHERE d.delivery_time > d.estimated_time AND {shard}",
+        "order_id", ["order_id", "customer_name", "restaurant_name", "estimated_time", "delivery_time"]),
+    "3. Get the average order value for all customers": ShardedReport(
+        "SELECT SUM(o.total_amount), COUNT(o.total_amount) FROM orders o WHERE {shard}",
+        "order_date", ["AVG(total_amount)"], aggregates=("avg",)),
+    "4. Get the total number of orders for each restaurant": ShardedReport(
+        "SELECT o.restaurant_id, COUNT(*) FROM orders o WHERE {shard} GROUP BY o.restaurant_id",
+        "restaurant", ["restaurant_id", "total_orders"], keys=1, aggregates=("count",)),
+    "5. Get the total revenue for each restaurant": ShardedReport(
+        "SELECT o.restaurant_id, SUM(o.total_amount) FROM orders o WHERE {shard} GROUP BY o.restaurant_id",
+        "restaurant", ["restaurant_id", "total_revenue"], keys=1, aggregates=("sum",)),
+    "6. Get the number of orders placed each month in the last year": ShardedReport(
+        "SELECT strftime('%Y-%m', o.order_date) AS month, COUNT(*) FROM orders o "
+        f"WHERE o.order_date >= {SINCE_MONTHS} AND {{shard}} GROUP BY month",
+        "month", ["month", "total_orders"], keys=1, aggregates=("count",), order_by=0, descending=True),
+    "7. Get the most popular restaurant by total orders": ShardedReport(
+        "SELECT o.restaurant_id, COUNT(*) FROM orders o WHERE {shard} GROUP BY o.restaurant_id",
+        "restaurant", ["restaurant_id", "total_orders"], keys=1, aggregates=("count",), order_by=1, descending=True,
+        limit=1),
+    "8. Get the total number of canceled orders per restaurant": ShardedReport(
+        "SELECT o.restaurant_id, COUNT(*) FROM orders o WHERE o.status = 'Cancelled' AND {shard} GROUP BY o.restaurant_id",
+        "restaurant", ["restaurant_id", "canceled_orders"], keys=1, aggregates=("count",)),
+    "9. Get the total revenue generated for each month": ShardedReport(
+        "SELECT strftime('%Y-%m', o.order_date) AS month, SUM(o.total_amount) FROM orders o WHERE {shard} GROUP BY month",
+        "month", ["month", "total_revenue"], keys=1, aggregates=("sum",), order_by=0, descending=True),
+    "11. Get the average discount applied for all orders": ShardedReport(
+        "SELECT SUM(o.discount_applied), COUNT(o.discount_applied) FROM orders o WHERE {shard}",
+        "order_id", ["AVG(discount_applied)"], aggregates=("avg",)),
+    "12. Get the average order amount for premium customers": ShardedReport(
+        "SELECT SUM(o.total_amount), COUNT(o.total_amount) FROM orders o "
+        "WHERE o.customer_id IN (SELECT c.customer_id FROM customers c WHERE c.is_premium = 1 AND {shard})",
+        "customer", ["AVG(total_amount)"], aggregates=("avg",)),
+    "13. Get the total number of canceled orders": ShardedReport(
+        "SELECT COUNT(*) FROM orders o WHERE o.status = 'Cancelled' AND {shard}",
+        "restaurant", ["COUNT(*)"], aggregates=("count",)),
+    "19. Get the total number of orders placed per day": ShardedReport(
+        "SELECT DATE(o.order_date) AS order_day, COUNT(*) FROM orders o WHERE {shard} GROUP BY order_day",
+        "day", ["order_day", "total_orders"], keys=1, aggregates=("count",), order_by=0, descending=True),
+}
+
+
+def balanced_boundaries(counts, shards):
+    """
+    Split points for shards ranges of roughly equal row counts, from (value, rows)
+    pairs sorted by value. A value is never split, so heavy values may leave
+    fewer shards than asked for.
+    """
+    total = sum(rows for _, rows in counts)
+    boundaries = []
+    seen = 0
+    for value, rows in counts:
+        if seen >= total * (len(boundaries) + 1) / shards and len(boundaries) < shards - 1:
+            boundaries.append(value)
+        seen += rows
+    return boundaries
+
+
+# Ids are dense, so equal id ranges hold about equal numbers of rows
+def dense_boundaries(bounds, shards):
+    bounds = [bound for bound in bounds if bound[0] is not None]
+    if not bounds:
+        return []
+    low, high = min(bound[0] for bound in bounds), max(bound[1] for bound in bounds)
+    return sorted({low + (high - low + 1) * i // shards for i in range(1, shards)})
+
+
+# Row counts per restaurant, day or month: from the rollups when they are
+# installed, otherwise from the orders indexes
+COUNT_QUERIES = {
+    "restaurant": ("SELECT restaurant_id, SUM(order_count) FROM restaurant_monthly_stats "
+                   "WHERE restaurant_id != 0 GROUP BY restaurant_id ORDER BY restaurant_id",
+                   "SELECT restaurant_id, COUNT(*) FROM orders WHERE restaurant_id IS NOT NULL "
+                   "GROUP BY restaurant_id ORDER BY restaurant_id"),
+    "day": ("SELECT day, order_count FROM order_daily_stats WHERE day != '' ORDER BY day",
+            "SELECT DATE(order_date) AS day, COUNT(*) FROM orders WHERE day IS NOT NULL GROUP BY day ORDER BY day"),
+    "month": ("SELECT substr(day, 1, 7) AS month, SUM(order_count) FROM order_daily_stats WHERE day != '' "
+              "GROUP BY month ORDER BY month",
+              "SELECT strftime('%Y-%m', order_date) AS month, COUNT(*) FROM orders WHERE month IS NOT NULL "
+              "GROUP BY month ORDER BY month"),
+}
+
+
+def shard_boundaries(conn, shard_by, shards):
+    if shards <= 1:
+        return []
+    if shard_by == "order_id":
+        return dense_boundaries([conn.execute(f"SELECT MIN(order_id), MAX(order_id) FROM {table}").fetchone()
+                                 for table in order_tables(conn)], shards)
+    if shard_by == "customer":
+        return dense_boundaries([conn.execute("SELECT MIN(customer_id), MAX(customer_id) FROM customers").fetchone()],
+                                shards)
+    if shard_by == "hour":
+        return sorted({f"{24 * i // shards:02d}" for i in range(1, shards)} - {"00"})
+    # order_date shards split on day boundaries: '2024-03-05' sorts before every time that day
+    source = "day" if shard_by == "order_date" else shard_by
+    from_rollups, from_orders = COUNT_QUERIES[source]
+    counts = conn.execute(from_rollups if rollups_installed(conn) else from_orders).fetchall()
+    return balanced_boundaries(counts, shards)
+
+
+def shard_predicates(column, boundaries):
+    """
+    (clause, params) per shard, with named parameters so they combine with the
+    report's own arguments. Together the shards cover every row exactly once;
+    NULLs get a shard of their own, since OR-ing them into a range clause would
+    turn its index seek into a full scan.
+    """
+    if not boundaries:
+        return [("1 = 1", {})]
+    predicates = [(f"{column} IS NULL", {}), (f"{column} < :shard_high", {"shard_high": boundaries[0]})]
+    for low, high in zip(boundaries, boundaries[1:]):
+        predicates.append((f"{column} >= :shard_low AND {column} < :shard_high", {"shard_low": low, "shard_high": high}))
+    predicates.append((f"{column} >= :shard_low", {"shard_low": boundaries[-1]}))
+    return predicates
+
+
+# True when every shard reads orders with an index or rowid seek. Without one,
+# each shard would scan all of orders, so the report is better run whole.
+def shards_seek(conn, query, predicates, arguments):
+    for clause, params in predicates:
+        for *_, detail in conn.execute(f"EXPLAIN QUERY PLAN {query.format(shard=clause)}", {**arguments, **params}):
+            if re.match(r"SCAN o\b", detail):
+                return False
+    return True
+
+
+def plan_tasks(conn, shards):
+    """
+    The work for a full report run as (name, shard, query, params) tasks:
+    one per shard for the sharded reports, one per query for the rest.
+    When orders is partitioned, each month partition is a shard.
+    """
+    partitioned = is_partitioned(conn)
+    boundaries = {}
+    tasks = []
+    for query in CATALOG:
+        name, arguments = query.name, query.defaults
+        report = SHARDED_REPORTS.get(name)
+        if report is None:
+            tasks.append((name, 0, query.sql, arguments))
+            continue
+        if partitioned:
+            for shard, table in enumerate(order_tables(conn)):
+                partial = re.sub(r"\borders o\b", f"{table} o", report.partial)
+                tasks.append((name, shard, partial.format(shard="1 = 1"), arguments))
+            continue
+        column = SHARD_COLUMNS[report.shard_by]
+        # Plans depend on the shape of the clauses, not the boundary values
+        if shards_seek(conn, report.partial, shard_predicates(column, [0, 1]), arguments):
+            if report.shard_by not in boundaries:
+                boundaries[report.shard_by] = shard_boundaries(conn, report.shard_by, shards)
+            predicates = shard_predicates(column, boundaries[report.shard_by])
+        else:
+            predicates = shard_predicates(column, [])
+        for shard, (clause, params) in enumerate(predicates):
+            tasks.append((name, shard, report.partial.format(shard=clause), {**arguments, **params}))
+    # Shards first, so the long reports start early and the small ones fill in the gaps
+    return sorted(tasks, key=lambda task: task[0] not in SHARDED_REPORTS)
+
+
+# Each worker process keeps one read-only connection for all of its tasks
+_worker_conn = None
+
+
+def open_worker_connection(db_file):
+    global _worker_conn
+    _worker_conn = create_pooled_connection(db_file, read_only=True)
+
+
+def run_task(task):
+    name, shard, query, params = task
+    started = time.perf_counter()
+    cursor = _worker_conn.execute(query, params)
+    rows = cursor.fetchall()
+    columns = [description[0] for description in cursor.description]
+    return name, shard, columns, rows, time.perf_counter() - started
+
+
+def combine(aggregates, left, right):
+    merged = []
+    position = 0
+    for kind in aggregates:
+        width = 2 if kind == "avg" else 1
+        for a, b in zip(left[position:position + width], right[position:position + width]):
+            # SUM over no rows is NULL; COUNT is never NULL
+            merged.append(b if a is None else a if b is None else a + b)
+        position += width
+    return merged
+
+
+def finish(aggregates, state):
+    values = []
+    position = 0
+    for kind in aggregates:
+        if kind == "avg":
+            total, count = state[position:position + 2]
+            values.append(total / count if count else None)
+            position += 2
+        else:
+            values.append(state[position])
+            position += 1
+    return tuple(values)
+
+
+# Sort key that places NULL before every value, as SQLite does
+def null_first(value):
+    return (value is not None, value)
+
+
+def merge_partials(report, partials):
+    """
+    Merge the shards' partial rows into the rows the original query returns.
+    """
+    if not report.aggregates:
+        rows = [row for part in partials for row in part]
+    else:
+        groups = {}
+        for part in partials:
+            for row in part:
+                key = tuple(row[:report.keys])
+                state = groups.get(key)
+                groups[key] = list(row[report.keys:]) if state is None else combine(report.aggregates, state, row[report.keys:])
+        rows = [key + finish(report.aggregates, state) for key, state in groups.items()]
+        if report.order_by is None:
+            rows.sort(key=lambda row: [null_first(value) for value in row[:report.keys]])
+    if report.order_by is not None:
+        rows.sort(key=lambda row: null_first(row[report.order_by]), reverse=report.descending)
+    if report.limit is not None:
+        rows = rows[:report.limit]
+    return report.columns, rows
+
+
+def generate_reports(db_file, workers=None, shards=None):
+    """
+    Run every catalog query and return ({name: (columns, rows)}, seconds per report
+    summed over its shards). Tasks run in a pool of worker processes, each with
+    its own WAL read connection; workers=1 runs them in this process.
+    """
+    workers = workers or os.cpu_count() or 1
+    shards = shards or workers
+    conn = create_pooled_connection(db_file, read_only=True)
+    try:
+        tasks = plan_tasks(conn, shards)
+    finally:
+        conn.close()
+
+    if workers == 1:
+        open_worker_connection(db_file)
+        try:
+            results = [run_task(task) for task in tasks]
+        finally:
+            _worker_conn.close()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=open_worker_connection, initargs=(db_file,)) as pool:
+            results = list(pool.map(run_task, tasks))
+
+    partials, timings, reports = {}, {}, {}
+    for name, shard, columns, rows, elapsed in sorted(results, key=lambda result: result[1]):
+        partials.setdefault(name, (columns, []))[1].append(rows)
+        timings[name] = timings.get(name, 0.0) + elapsed
+    for name in (query.name for query in CATALOG):
+        columns, parts = partials[name]
+        reports[name] = merge_partials(SHARDED_REPORTS[name], parts) if name in SHARDED_REPORTS else (columns, parts[0])
+    return reports, timings
+
+
+# File name for a report: catalog names as-is, Query Section labels by their number
+def report_file_name(name):
+    number = re.match(r"(\d+)\.", name)
+    return f"query_{number.group(1)}.csv" if number else f"{name}.csv"
+
+
+def write_reports(reports, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    for name, (columns, rows) in reports.items():
+        with open(os.path.join(output_dir, report_file_name(name)), "w", newline="") as handle:
+            writer = csv.writer(handle)
+            writer.writerow(columns)
+            writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate every catalog report in parallel worker processes.")
+    parser.add_argument("--db", default="food_delivery.db", help="SQLite database file")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU core)")
+    parser.add_argument("--shards", type=int, help="shards per large report (default: one per worker)")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="directory for the report CSV files")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    reports, timings = generate_reports(args.db, args.workers, args.shards)
+    write_reports(reports, args.output_dir)
+    for name, seconds in sorted(timings.items(), key=lambda item: -item[1]):
+        print(f"{seconds:8.2f}s  {name}")
+    print(f"{len(reports)} reports written to {args.output_dir} in {time.perf_counter() - started:.2f}s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import date, datetime, timezone
+from connection_pool import create_pooled_connection
+from data_generation import generate_bulk_data
+from database import initialize_database
+from queries import CATALOG
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Orders per scale factor; the other tables are sized in proportion
+SCALE_FACTORS = {
+    "10k": 10_000,
+    "1m": 1_000_000,
+    "10m": 10_000_000,
+}
+
+DEFAULT_SEED = 42
+DEFAULT_REPEAT = 5
+DEFAULT_DATA_DIR = "bench_data"
+DEFAULT_OUTPUT = "benchmark_results.json"
+
+# Fixed so that the same seed always generates the same order dates. The
+# catalog's windows count back from today, so the benchmark widens them by the
+# time since this date (see window_arguments)
+DATA_END_DATE = datetime(2024, 1, 1)
+
+# A query regresses when its warm latency grows by more than this fraction and
+# by at least MIN_REGRESSION_MS, or when its VM steps grow by more than STEPS_TOLERANCE
+DEFAULT_TOLERANCE = 0.25
+MIN_REGRESSION_MS = 2.0
+STEPS_TOLERANCE = 0.10
+
+# The progress handler fires every PROGRESS_INTERVAL SQLite VM instructions
+PROGRESS_INTERVAL = 100
+
+
+def row_counts_for(orders):
+    return {
+        "customers": max(20, orders // 100),
+        "restaurants": max(10, orders // 5000),
+        "delivery_persons": max(10, orders // 2000),
+        "orders": orders,
+        "deliveries": orders * 9 // 10,
+    }
+
+
+def build_database(data_dir, scale, seed=DEFAULT_SEED, rebuild=False):
+    """
+    Return the path of the benchmark database for scale, generating it with the
+    given seed first if needed. Generation writes to a temporary file that is
+    renamed once complete, so an interrupted build is never reused.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"food_delivery_{scale}_seed{seed}.db")
+    if os.path.exists(path) and not rebuild:
+        return path
+    partial = path + ".partial"
+    for stale in (partial, partial + "-wal", partial + "-shm"):
+        if os.path.exists(stale):
+            os.remove(stale)
+    print(f"Generating {scale} database at {path} ...")
+    initialize_database(partial)
+    generate_bulk_data(partial, row_counts_for(SCALE_FACTORS[scale]), seed=seed, end_date=DATA_END_DATE)
+    conn = sqlite3.connect(partial)
+    conn.execute("ANALYZE")
+    conn.close()
+    os.replace(partial, path)
+    return path
+
+
+# Peak resident set size of this process so far, in MiB. benchmark_query runs
+# in a process of its own, so this is the peak of one query
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def benchmark_catalog():
+    """
+    Every catalog query as (name, sql, params) with its default arguments: the
+    named queries, the Query Section queries, and their rollup- and
+    heatmap-backed variants.
+    """
+    return [(query.name, query.sql, query.defaults) for query in CATALOG.statements()]
+
+
+def window_arguments(params, today=None):
+    """
+    params with the days and months windows (SINCE_DAYS, SINCE_MONTHS) widened
+    by the time between DATA_END_DATE and today, so that they reach back into
+    the generated data and cover its last days or months whenever the
+    benchmark runs. Day windows cover the same orders on every run; month
+    windows start on today's day of the month, so their oldest month may be
+    partial.
+    """
+    today = today or date.today()
+    end = DATA_END_DATE.date()
+    widened = dict(params)
+    if "days" in widened:
+        widened["days"] += max(0, (today - end).days)
+    if "months" in widened:
+        widened["months"] += max(0, (today.year - end.year) * 12 + today.month - end.month)
+    return widened
+
+
+def run_timed(conn, query, params=()):
+    started = time.perf_counter()
+    rows = conn.execute(query, params).fetchall()
+    return (time.perf_counter() - started) * 1000, len(rows)
+
+
+# SQLite VM instructions executed by query, counted in PROGRESS_INTERVAL steps.
+# Python's sqlite3 does not expose sqlite3_stmt_status, so this stands in for rows scanned.
+def count_vm_steps(conn, query, params=()):
+    steps = [0]
+
+    def tick():
+        steps[0] += 1
+        return 0
+
+    conn.set_progress_handler(tick, PROGRESS_INTERVAL)
+    try:
+        conn.execute(query, params).fetchall()
+    finally:
+        conn.set_progress_handler(None, PROGRESS_INTERVAL)
+    return steps[0] * PROGRESS_INTERVAL
+
+
+def benchmark_query(db_file, name, query, params=(), repeat=DEFAULT_REPEAT):
+    """
+    Time query cold (first run on a freshly opened connection, so SQLite's page
+    cache is empty and the statement is compiled) and warm (median of repeat
+    further runs on the same connection). Meant to run in a fresh process (see
+    isolated), where rss_growth_mb is the memory the query itself added.
+    """
+    rss_before = peak_rss_mb()
+    conn = create_pooled_connection(db_file, read_only=True)
+    try:
+        cold_ms, rows = run_timed(conn, query, params)
+        warm = [run_timed(conn, query, params)[0] for _ in range(repeat)]
+        vm_steps = count_vm_steps(conn, query, params)
+    finally:
+        conn.close()
+    peak = peak_rss_mb()
+    return {
+        "query": name,
+        "rows": rows,
+        "cold_ms": round(cold_ms, 3),
+        "warm_ms": round(statistics.median(warm), 3),
+        "warm_max_ms": round(max(warm), 3),
+        "vm_steps": vm_steps,
+        "peak_rss_mb": peak,
+        "rss_growth_mb": None if peak is None else round(peak - rss_before, 1),
+    }
+
+
+# Run benchmark_query in a fresh process, so that ru_maxrss is its own peak and
+# not the largest of every query run before it
+def isolated(db_file, name, query, params, repeat):
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(benchmark_query, (db_file, name, query, params, repeat))
+
+
+def run_benchmarks(scales, data_dir=DEFAULT_DATA_DIR, seed=DEFAULT_SEED, repeat=DEFAULT_REPEAT, rebuild=False,
+                   only=None):
+    results = []
+    today = date.today()
+    for scale in scales:
+        db_file = build_database(data_dir, scale, seed, rebuild)
+        for name, query, params in benchmark_catalog():
+            if only and not any(pattern.lower() in name.lower() for pattern in only):
+                continue
+            try:
+                result = isolated(db_file, name, query, window_arguments(params, today), repeat)
+            except sqlite3.Error as e:
+                result = {"query": name, "error": str(e)}
+            result["scale"] = scale
+            results.append(result)
+            if "error" in result:
+                print(f"[{scale}] {name}: error {result['error']}")
+            else:
+                print(f"[{scale}] {name}: cold {result['cold_ms']:.1f} ms, warm {result['warm_ms']:.1f} ms, "
+                      f"{result['rows']} rows, {result['vm_steps']:,} VM steps")
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "seed": seed,
+            "data_end_date": DATA_END_DATE.date().isoformat(),
+            "repeat": repeat,
+            "scales": {scale: row_counts_for(SCALE_FACTORS[scale]) for scale in scales},
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare a run against a baseline run and return the regressions as a list of
+    dicts. Queries missing from the baseline, or that errored in it, are skipped.
+    """
+    previous = {(r["scale"], r["query"]): r for r in baseline["results"] if "error" not in r}
+    regressions = []
+    for result in results["results"]:
+        before = previous.get((result["scale"], result["query"]))
+        if before is None:
+            continue
+        if "error" in result:
+            regressions.append({"scale": result["scale"], "query": result["query"], "reason": result["error"]})
+            continue
+        slower = result["warm_ms"] - before["warm_ms"]
+        if slower > MIN_REGRESSION_MS and result["warm_ms"] > before["warm_ms"] * (1 + tolerance):
+            regressions.append({
+                "scale": result["scale"], "query": result["query"],
+                "reason": f"warm {before['warm_ms']:.1f} ms -> {result['warm_ms']:.1f} ms",
+            })
+        elif result["vm_steps"] > before["vm_steps"] * (1 + STEPS_TOLERANCE) + PROGRESS_INTERVAL:
+            regressions.append({
+                "scale": result["scale"], "query": result["query"],
+                "reason": f"VM steps {before['vm_steps']:,} -> {result['vm_steps']:,}",
+            })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the query catalog on synthetic databases.")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALE_FACTORS), default=["10k"], help="scale factors to run")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="random seed for the generated data")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="warm runs per query")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="directory for the generated databases")
+    parser.add_argument("--rebuild", action="store_true", help="regenerate the databases even if they exist")
+    parser.add_argument("--only", nargs="+", help="run only queries whose name contains one of these strings")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON results file")
+    parser.add_argument("--baseline", help="baseline results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed fractional increase in warm latency before a query counts as regressed")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.scales, args.data_dir, args.seed, args.repeat, args.rebuild, args.only)
+    with open(args.output, "w") as handle:
+        json.dump(results, handle, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION [{regression['scale']}] {regression['query']}: {regression['reason']}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
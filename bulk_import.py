@@ -0,0 +1,244 @@
+import argparse
+import csv
+import hashlib
+import os
+import time
+from database import create_connection
+from rollups import drop_rollup_triggers, install_rollups, rollups_installed
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+CREATE_IMPORT_PROGRESS_TABLE = """
+CREATE TABLE IF NOT EXISTS import_progress (
+    source TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    rows_done INTEGER NOT NULL DEFAULT 0,
+    completed BOOLEAN NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (source, table_name)
+);
+"""
+
+
+class BulkImportError(Exception):
+    pass
+
+
+def to_integer(value):
+    if isinstance(value, str) and value.lower() in ("true", "false"):
+        return int(value.lower() == "true")
+    number = float(value)
+    if not number.is_integer():
+        raise ValueError(value)
+    return int(number) if abs(number) < 2 ** 53 else int(value)
+
+
+# Column name -> (declared type, NOT NULL without default) from PRAGMA table_info
+def table_schema(conn, table):
+    schema = {}
+    for _, name, declared_type, not_null, default, pk in conn.execute(f"PRAGMA table_info({table})"):
+        required = bool(not_null) and default is None and not (pk and declared_type.upper() == "INTEGER")
+        schema[name.lower()] = (declared_type.upper(), required)
+    if not schema:
+        raise BulkImportError(f"Table '{table}' does not exist.")
+    return schema
+
+
+# Converter for a column following SQLite's type affinity rules
+def converter_for(declared_type):
+    if "INT" in declared_type or declared_type == "BOOLEAN":
+        return to_integer
+    if any(name in declared_type for name in ("REAL", "FLOA", "DOUB")):
+        return float
+    return str
+
+
+def validate_header(columns, schema, table):
+    unknown = [column for column in columns if column.lower() not in schema]
+    if unknown:
+        raise BulkImportError(f"Columns {unknown} do not exist in table '{table}'.")
+    missing = [name for name, (_, required) in schema.items() if required and name not in {c.lower() for c in columns}]
+    if missing:
+        raise BulkImportError(f"Required columns {missing} of table '{table}' are missing from the file.")
+
+
+def convert_chunk(rows, converters, first_row_number):
+    """
+    Apply the column converters to a chunk of raw rows. Empty strings become NULL.
+    Raises BulkImportError with the file row number of the first bad value.
+    """
+    converted = []
+    for offset, row in enumerate(rows):
+        values = []
+        for value, convert in zip(row, converters):
+            if value is None or value == "":
+                values.append(None)
+                continue
+            try:
+                values.append(convert(value))
+            except (TypeError, ValueError):
+                raise BulkImportError(f"Row {first_row_number + offset}: cannot convert {value!r} with {convert.__name__}.")
+        converted.append(tuple(values))
+    return converted
+
+
+# Header and successive chunks of row tuples from a CSV file, read lazily
+def read_csv_chunks(path, chunk_size, skip_rows=0):
+    with open(path, newline="", encoding="utf-8") as handle:
+        reader = csv.reader(handle)
+        header = next(reader)
+        yield header
+        for _ in range(skip_rows):
+            if next(reader, None) is None:
+                return
+        chunk = []
+        for row in reader:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+# Header and successive chunks of row tuples from a Parquet file, one record batch at a time
+def read_parquet_chunks(path, chunk_size, skip_rows=0):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise BulkImportError("Parquet import requires the 'pyarrow' package.")
+    parquet_file = pq.ParquetFile(path)
+    yield parquet_file.schema_arrow.names
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        if skip_rows >= batch.num_rows:
+            skip_rows -= batch.num_rows
+            continue
+        batch = batch.slice(skip_rows)
+        skip_rows = 0
+        columns = [column.to_pylist() for column in batch.columns]
+        yield list(zip(*columns))
+
+
+def file_format_for(path, file_format=None):
+    file_format = (file_format or os.path.splitext(path)[1].lstrip(".")).lower()
+    if file_format not in ("csv", "parquet"):
+        raise BulkImportError(f"Unsupported file format '{file_format}'; use csv or parquet.")
+    return file_format
+
+
+# Identifies the file contents closely enough to notice a replaced feed, from
+# its size and a hash of its first and last blocks (so a re-uploaded copy of the
+# same file still resumes)
+def file_fingerprint(path, block_size=65536):
+    size = os.path.getsize(path)
+    digest = hashlib.sha1()
+    with open(path, "rb") as handle:
+        digest.update(handle.read(block_size))
+        handle.seek(max(0, size - block_size))
+        digest.update(handle.read(block_size))
+    return f"{size}:{digest.hexdigest()}"
+
+
+def import_file(conn, table, path, chunk_size=DEFAULT_CHUNK_SIZE, file_format=None, resume=True, progress=None,
+                defer_rollups=False):
+    """
+    Stream a CSV or Parquet file into table in chunks of chunk_size rows. Each
+    chunk is inserted with executemany in its own transaction together with the
+    import_progress row, so an interrupted import resumes after the last
+    committed chunk. progress(rows_done, elapsed_seconds) is called per chunk.
+    With defer_rollups, the order rollup triggers are dropped for the import and
+    the rollups rebuilt once at the end, also when the import fails part way.
+    Returns (rows_imported, elapsed_seconds).
+    """
+    file_format = file_format_for(path, file_format)
+    source = os.path.abspath(path)
+    fingerprint = file_fingerprint(path)
+    conn.execute(CREATE_IMPORT_PROGRESS_TABLE)
+    conn.commit()
+
+    skip_rows = 0
+    state = conn.execute(
+        "SELECT fingerprint, rows_done, completed FROM import_progress WHERE source = ? AND table_name = ?",
+        (source, table),
+    ).fetchone()
+    if resume and state and state[0] == fingerprint:
+        if state[2]:
+            print(f"{path} was already imported into {table}.")
+            return 0, 0.0
+        skip_rows = state[1]
+        print(f"Resuming {path} after {skip_rows} rows.")
+
+    reader = read_csv_chunks if file_format == "csv" else read_parquet_chunks
+    chunks = reader(path, chunk_size, skip_rows)
+    header = next(chunks)
+    schema = table_schema(conn, table)
+    validate_header(header, schema, table)
+    converters = [converter_for(schema[column.lower()][0]) for column in header]
+    insert = f"INSERT INTO {table} ({', '.join(header)}) VALUES ({', '.join('?' for _ in header)})"
+
+    defer_rollups = defer_rollups and table.lower() == "orders" and rollups_installed(conn)
+    if defer_rollups:
+        drop_rollup_triggers(conn)
+
+    started = time.perf_counter()
+    rows_done = skip_rows
+    imported = 0
+    try:
+        for chunk in chunks:
+            rows = convert_chunk(chunk, converters, rows_done + 1)
+            with conn:
+                conn.executemany(insert, rows)
+                rows_done += len(rows)
+                conn.execute(
+                    "INSERT INTO import_progress (source, table_name, fingerprint, rows_done) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (source, table_name) DO UPDATE SET fingerprint = excluded.fingerprint, "
+                    "rows_done = excluded.rows_done, completed = 0, updated_at = CURRENT_TIMESTAMP",
+                    (source, table, fingerprint, rows_done),
+                )
+            imported += len(rows)
+            elapsed = time.perf_counter() - started
+            if progress:
+                progress(rows_done, elapsed)
+            else:
+                print(f"{table}: {rows_done} rows ({imported / max(elapsed, 1e-9):,.0f} rows/sec)")
+
+        with conn:
+            conn.execute(
+                "INSERT INTO import_progress (source, table_name, fingerprint, rows_done, completed) VALUES (?, ?, ?, ?, 1) "
+                "ON CONFLICT (source, table_name) DO UPDATE SET completed = 1, updated_at = CURRENT_TIMESTAMP",
+                (source, table, fingerprint, rows_done),
+            )
+    finally:
+        # Committed chunks must reach the rollups even if a later one fails
+        if defer_rollups:
+            install_rollups(conn, rebuild=True)
+    elapsed = time.perf_counter() - started
+    return imported, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a CSV or Parquet file into a table.")
+    parser.add_argument("table", help="destination table, e.g. orders or deliveries")
+    parser.add_argument("path", help="CSV or Parquet file with a header matching the table's columns")
+    parser.add_argument("--db", default="food_delivery.db", help="SQLite database file")
+    parser.add_argument("--format", choices=["csv", "parquet"], help="file format (default: from the extension)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per transaction")
+    parser.add_argument("--restart", action="store_true", help="ignore saved progress and import from the first row")
+    parser.add_argument("--defer-rollups", action="store_true",
+                        help="rebuild the order rollups once at the end instead of maintaining them per row")
+    args = parser.parse_args()
+
+    conn = create_connection(args.db)
+    try:
+        imported, elapsed = import_file(conn, args.table, args.path, args.chunk_size, args.format,
+                                        resume=not args.restart, defer_rollups=args.defer_rollups)
+        print(f"Imported {imported} rows into {args.table} in {elapsed:.2f}s ({imported / max(elapsed, 1e-9):,.0f} rows/sec)")
+    except BulkImportError as e:
+        print(f"Error: {e}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
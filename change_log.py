@@ -0,0 +1,376 @@
+import argparse
+import sqlite3
+import time
+from partitions import column_names, create_orders_view, is_partitioned, object_type
+from query_cache import register_derived_tables
+
+# Change data capture for orders and deliveries, as table -> key column.
+# Triggers append one change_log entry per inserted, updated or deleted row:
+# its table and key, the operation and, for updates, the columns whose values
+# changed. Partitioned orders are logged by the orders view's triggers, so
+# rows moved between partitions are not reported as changes.
+CHANGE_TABLES = {
+    "orders": "order_id",
+    "deliveries": "delivery_id",
+}
+
+INSERT = "insert"
+UPDATE = "update"
+DELETE = "delete"
+# The table was reloaded without logging its rows (e.g. by data generation);
+# consumers read it in full again instead
+RESET = "reset"
+
+# Entries read per poll
+DEFAULT_BATCH_SIZE = 1000
+
+# Entries deleted per transaction by compaction, so writers keep getting turns,
+# and entries it coalesces at a time, so its memory stays bounded
+COMPACT_BATCH_SIZE = 10_000
+
+# seq is AUTOINCREMENT, so it keeps growing even after compaction empties the
+# log. Entries name rows rather than carry their values: a consumer reads the
+# row by key, which makes seeing an entry twice harmless.
+CREATE_CHANGE_LOG_TABLE = """
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_key INTEGER,
+    operation TEXT NOT NULL,
+    changed_columns TEXT,
+    changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+CREATE_CONSUMERS_TABLE = """
+CREATE TABLE IF NOT EXISTS change_consumers (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+for _table in CHANGE_TABLES:
+    register_derived_tables(_table, ["change_log"])
+
+
+def change_statements(table, columns, event, new_key=None):
+    """
+    Trigger statements that log one row event on table. new_key is the
+    inserted row's key, for INSTEAD OF triggers whose NEW row has none yet.
+    A changed key is logged as the old row deleted and the new one inserted.
+    """
+    key = CHANGE_TABLES[table]
+    log = "INSERT INTO change_log (table_name, row_key, operation, changed_columns)"
+    if event == INSERT:
+        return [f"{log} VALUES ('{table}', {new_key or f'NEW.{key}'}, '{INSERT}', NULL);"]
+    if event == DELETE:
+        return [f"{log} VALUES ('{table}', OLD.{key}, '{DELETE}', NULL);"]
+    tracked = [column for column in columns if column.lower() != key.lower()]
+    changed = " || ".join(f"CASE WHEN NEW.{column} IS NOT OLD.{column} THEN ',{column}' ELSE '' END"
+                          for column in tracked) or "''"
+    differs = " OR ".join([f"NEW.{key} IS NOT OLD.{key}"] + [f"NEW.{column} IS NOT OLD.{column}" for column in tracked])
+    return [
+        f"{log} SELECT '{table}', OLD.{key}, '{DELETE}', NULL WHERE NEW.{key} IS NOT OLD.{key};",
+        f"{log} SELECT '{table}', NEW.{key}, CASE WHEN NEW.{key} IS NOT OLD.{key} THEN '{INSERT}' ELSE '{UPDATE}' END, "
+        f"NULLIF(substr({changed}, 2), '') WHERE {differs};",
+    ]
+
+
+def trigger_names(table):
+    return [f"{table}_change_{event}" for event in (INSERT, UPDATE, DELETE)]
+
+
+def trigger_statements(conn, table):
+    columns = column_names(conn, table)
+    return {
+        name: f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event.upper()} ON {table} BEGIN\n    "
+              + "\n    ".join(change_statements(table, columns, event)) + "\nEND;"
+        for name, event in zip(trigger_names(table), (INSERT, UPDATE, DELETE))
+    }
+
+
+def change_log_installed(conn):
+    return object_type(conn, "change_log") == "table"
+
+
+# Tables logged by row triggers of their own; partitioned orders is logged by its view
+def trigger_tables(conn):
+    if not change_log_installed(conn):
+        return []
+    return [table for table in CHANGE_TABLES
+            if object_type(conn, table) == "table" and not (table == "orders" and is_partitioned(conn))]
+
+
+def create_change_triggers(conn, table, refresh=False):
+    """
+    Create the triggers logging changes to table, without committing.
+    refresh=True replaces them, e.g. after the table's columns changed.
+    """
+    for name, statement in trigger_statements(conn, table).items():
+        if refresh:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute(statement)
+
+
+def install_change_log(conn):
+    conn.execute(CREATE_CHANGE_LOG_TABLE)
+    conn.execute(CREATE_CONSUMERS_TABLE)
+    for table in trigger_tables(conn):
+        create_change_triggers(conn, table)
+    # The orders view logs changes once it is recreated with the log in place
+    if is_partitioned(conn):
+        view_trigger = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'orders_partition_insert'").fetchone()
+        if view_trigger and "change_log" not in view_trigger[0]:
+            create_orders_view(conn)
+    conn.commit()
+
+
+# Drop the row triggers for a bulk load; resume_change_log recreates them
+def drop_change_triggers(conn, tables):
+    for table in tables:
+        for name in trigger_names(table):
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.commit()
+
+
+def resume_change_log(conn, tables):
+    """
+    Recreate the row triggers after a bulk load and log a reset of each
+    table, so consumers read the tables in full instead of the unlogged rows.
+    """
+    for table in trigger_tables(conn):
+        create_change_triggers(conn, table)
+    conn.executemany("INSERT INTO change_log (table_name, operation) VALUES (?, ?)",
+                     [(table, RESET) for table in tables])
+    conn.commit()
+
+
+class Change:
+    """
+    One change_log entry. columns lists the changed columns of an update.
+    """
+
+    def __init__(self, seq, table, key, operation, columns=None, changed_at=None):
+        self.seq = seq
+        self.table = table
+        self.key = key
+        self.operation = operation
+        self.columns = list(columns or [])
+        self.changed_at = changed_at
+
+    @classmethod
+    def from_row(cls, row):
+        seq, table, key, operation, columns, changed_at = row
+        return cls(seq, table, key, operation, columns.split(",") if columns else [], changed_at)
+
+    def merge(self, later):
+        """
+        This change followed by a later one of the same row, as one entry at
+        the later one's position.
+        """
+        if later.operation == DELETE:
+            operation = DELETE
+        elif INSERT in (self.operation, later.operation):
+            operation = INSERT
+        else:
+            operation = UPDATE
+        columns = self.columns + [column for column in later.columns if column not in self.columns]
+        return Change(later.seq, later.table, later.key, operation, columns if operation == UPDATE else [],
+                      later.changed_at)
+
+
+# Highest seq handed out so far; unlike MAX(seq), compaction never lowers it
+def log_head(conn):
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row[0] if row else 0
+
+
+def read_changes(conn, after, limit=DEFAULT_BATCH_SIZE, tables=None, through=None):
+    """
+    Entries after seq after (up to through), oldest first. A range scan of
+    the log's rowid, so it costs the number of entries read, not the log size.
+    """
+    query = "SELECT seq, table_name, row_key, operation, changed_columns, changed_at FROM change_log WHERE seq > ?"
+    params = [after]
+    if through is not None:
+        query += " AND seq <= ?"
+        params.append(through)
+    if tables:
+        query += f" AND table_name IN ({', '.join('?' for _ in tables)})"
+        params += list(tables)
+    query += " ORDER BY seq"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    return [Change.from_row(row) for row in conn.execute(query, params)]
+
+
+def coalesce(changes):
+    """
+    The latest entry per row, merged with that row's earlier ones, in log
+    order. A reset of a table supersedes all of its earlier entries.
+    """
+    resets = {change.table: change.seq for change in changes if change.operation == RESET}
+    latest = {}
+    for change in changes:
+        if change.seq < resets.get(change.table, 0):
+            continue
+        row = (change.table, None if change.operation == RESET else change.key)
+        previous = latest.pop(row, None)
+        latest[row] = change if previous is None or change.operation == RESET else previous.merge(change)
+    return sorted(latest.values(), key=lambda change: change.seq)
+
+
+def register_consumer(conn, name):
+    """
+    Position of consumer name, registering it at the head of the log if it is
+    new. A new consumer should read the tables in full before it first polls.
+    """
+    conn.execute("INSERT OR IGNORE INTO change_consumers (name, position) VALUES (?, ?)", (name, log_head(conn)))
+    conn.commit()
+    return conn.execute("SELECT position FROM change_consumers WHERE name = ?", (name,)).fetchone()[0]
+
+
+# Forget a consumer, so its position no longer holds back compaction
+def drop_consumer(conn, name):
+    conn.execute("DELETE FROM change_consumers WHERE name = ?", (name,))
+    conn.commit()
+
+
+class ChangeConsumer:
+    """
+    A named reader of the change log that keeps its position in
+    change_consumers. poll() reads the entries after the position and
+    commit() moves it on. Committing in the same transaction as the
+    consumer's own writes to this database handles every change exactly
+    once; otherwise a crash in between repeats a batch, which is harmless
+    since rows are read back by key.
+    """
+
+    def __init__(self, conn, name, tables=None):
+        self.conn = conn
+        self.name = name
+        self.tables = list(tables) if tables else None
+        self.position = register_consumer(conn, name)
+
+    def poll(self, batch_size=DEFAULT_BATCH_SIZE, through=None):
+        return read_changes(self.conn, self.position, batch_size, self.tables, through)
+
+    def commit(self, seq):
+        """
+        Save seq as read, without committing the connection's transaction.
+        """
+        self.conn.execute("UPDATE change_consumers SET position = ?, updated_at = CURRENT_TIMESTAMP "
+                          "WHERE name = ? AND position < ?", (seq, self.name, seq))
+        self.position = max(self.position, seq)
+
+    def batches(self, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Successive batches of the entries logged so far. Each batch is committed
+        as read when the next one is asked for, and the position then moves to
+        the head, past entries of tables this consumer does not read.
+        """
+        head = log_head(self.conn)
+        while True:
+            changes = self.poll(batch_size, head)
+            if not changes:
+                break
+            yield changes
+            self.commit(changes[-1].seq)
+            self.conn.commit()
+        self.commit(head)
+        self.conn.commit()
+
+
+def compact_log(conn, batch_size=COMPACT_BATCH_SIZE):
+    """
+    Delete the entries every consumer has read (all of them when there are no
+    consumers), then collapse the rest to one entry per row. Superseded entries
+    are safe to drop whatever a consumer's position, since the entry kept for
+    the row comes after them. The rest is read batch_size entries at a time and
+    each window coalesced on its own, so memory stays bounded however far the
+    slowest consumer lags; a row changed in several windows keeps one entry per
+    window. Returns (entries read by all, entries superseded).
+    """
+    low = conn.execute("SELECT MIN(position) FROM change_consumers").fetchone()[0]
+    head = log_head(conn)
+    if low is None:
+        low = head
+    read = 0
+    while True:
+        with conn:
+            deleted = conn.execute("DELETE FROM change_log WHERE seq IN "
+                                   "(SELECT seq FROM change_log WHERE seq <= ? ORDER BY seq LIMIT ?)",
+                                   (low, batch_size)).rowcount
+        read += deleted
+        if deleted < batch_size:
+            break
+
+    superseded = 0
+    after = low
+    while True:
+        pending = read_changes(conn, after, limit=batch_size, through=head)
+        if not pending:
+            break
+        kept = coalesce(pending)
+        kept_seqs = {change.seq for change in kept}
+        stale = [(change.seq,) for change in pending if change.seq not in kept_seqs]
+        originals = {change.seq: change for change in pending}
+        merged = [(change.operation, ",".join(change.columns) or None, change.seq) for change in kept
+                  if (change.operation, change.columns) != (originals[change.seq].operation, originals[change.seq].columns)]
+        with conn:
+            conn.executemany("DELETE FROM change_log WHERE seq = ?", stale)
+            conn.executemany("UPDATE change_log SET operation = ?, changed_columns = ? WHERE seq = ?", merged)
+        superseded += len(stale)
+        after = pending[-1].seq
+    return read, superseded
+
+
+def log_status(conn):
+    """
+    Head of the log, its entry count and (name, position, lag, updated_at) per consumer.
+    """
+    head = log_head(conn)
+    entries = conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0]
+    consumers = [(name, position, head - position, updated_at) for name, position, updated_at in conn.execute(
+        "SELECT name, position, updated_at FROM change_consumers ORDER BY name")]
+    return head, entries, consumers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, consume and compact the order and delivery change log.")
+    parser.add_argument("command", choices=["install", "status", "compact", "drop-consumer"],
+                        help="create the log and its triggers, show consumers and their lag, "
+                             "shrink the log, or forget a consumer")
+    parser.add_argument("--db", default="food_delivery.db", help="SQLite database file")
+    parser.add_argument("--consumer", help="consumer name for drop-consumer")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    conn.execute("PRAGMA busy_timeout = 5000")
+    try:
+        if args.command == "install":
+            install_change_log(conn)
+            print("Change log and triggers installed.")
+        elif args.command == "status":
+            head, entries, consumers = log_status(conn)
+            print(f"Head at {head}, {entries} entries in the log.")
+            for name, position, lag, updated_at in consumers:
+                print(f"{name}: at {position}, {lag} behind (updated {updated_at})")
+        elif args.command == "compact":
+            started = time.perf_counter()
+            read, superseded = compact_log(conn)
+            print(f"Removed {read} entries read by every consumer and {superseded} superseded entries "
+                  f"in {time.perf_counter() - started:.2f}s.")
+        else:
+            if not args.consumer:
+                parser.error("drop-consumer needs --consumer")
+            drop_consumer(conn, args.consumer)
+            print(f"Consumer {args.consumer} dropped.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import re
+import numpy as np
+import pandas as pd
+
+# Points drawn per line; longer series are reduced to this many with LTTB,
+# which keeps their peaks, dips and overall shape
+MAX_CHART_POINTS = 500
+
+# Bars drawn per category chart; the remaining categories share one bar
+TOP_CATEGORIES = 20
+
+OTHER_LABEL = "Other"
+
+# Cells of a result sent to the browser as a table. Streamlit serializes the
+# whole DataFrame it is given, so results past this show their first rows and
+# are downloaded in full instead.
+MAX_TABLE_CELLS = 50_000
+
+# Values named with these words are averages or ratios, which cannot be summed
+# into an "Other" bar; their chart shows the top categories alone
+NON_ADDITIVE_WORDS = {"avg", "average", "ratio", "rating", "rate"}
+
+# Rows sampled when checking whether a text column holds dates
+DATE_SAMPLE_SIZE = 20
+
+
+def lttb_indices(x, y, threshold=MAX_CHART_POINTS):
+    """
+    Positions of the points Largest-Triangle-Three-Buckets keeps out of a
+    series sorted by x: the first and last point, and from each of
+    threshold - 2 equal buckets in between the point forming the largest
+    triangle with the point kept before it and the next bucket's average.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_x = x[end:edges[bucket + 2]].mean()
+            next_y = y[end:edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        # Twice the triangle areas, which is enough to compare them
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def downsample_series(frame, x, columns, threshold=MAX_CHART_POINTS):
+    """
+    Rows of frame (sorted by x) that LTTB keeps for any of columns, so no
+    line loses its extremes. NaN values count as 0 for picking the rows.
+    """
+    if len(frame) <= threshold:
+        return frame
+    positions = frame[x].astype(np.int64) if pd.api.types.is_datetime64_any_dtype(frame[x]) else frame[x]
+    kept = np.unique(np.concatenate([
+        lttb_indices(positions.to_numpy(), frame[column].fillna(0).to_numpy(), threshold) for column in columns
+    ]))
+    return frame.iloc[kept]
+
+
+def is_additive(column):
+    return NON_ADDITIVE_WORDS.isdisjoint(re.split(r"[^a-z]+", str(column).lower()))
+
+
+def top_categories(frame, label, value, limit=TOP_CATEGORIES):
+    """
+    The limit categories with the largest value, largest first, and for an
+    additive value one more bar with the rest of them summed.
+    """
+    frame = frame[[label, value]].dropna(subset=[value])
+    top = frame.nlargest(limit, value)
+    top = top.assign(**{label: top[label].astype(str)})
+    rest = frame.drop(top.index)
+    if len(rest) and is_additive(value):
+        other = pd.DataFrame({label: [f"{OTHER_LABEL} ({len(rest):,})"], value: [rest[value].sum()]})
+        top = pd.concat([top, other], ignore_index=True)
+    return top.reset_index(drop=True)
+
+
+def parse_dates(series):
+    """
+    series as datetimes if it holds dates or ISO date strings, otherwise None.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    if series.dtype != object and not pd.api.types.is_string_dtype(series):
+        return None
+    sample = series.dropna().head(DATE_SAMPLE_SIZE)
+    if not len(sample) or not all(isinstance(value, str) for value in sample):
+        return None
+    if pd.to_datetime(sample, format="ISO8601", errors="coerce").isna().any():
+        return None
+    return pd.to_datetime(series, format="ISO8601", errors="coerce")
+
+
+class ChartPlan:
+    """
+    A chart of a query result: kind is "line" or "bar", data the rows to
+    draw, x and y its columns. per_day names the date column whose rows
+    were counted per day, if the chart is such a count.
+    """
+
+    def __init__(self, kind, data, x, y, note="", per_day=None):
+        self.kind = kind
+        self.data = data
+        self.x = x
+        self.y = y
+        self.note = note
+        self.per_day = per_day
+
+
+def plan_chart(frame):
+    """
+    The chart for a query result, or None when it has no obvious one. The
+    data drawn has at most MAX_CHART_POINTS rows per line or TOP_CATEGORIES + 1
+    bars, whatever the size of frame:
+
+    - a date column first with numbers after it is a time series, downsampled with LTTB;
+    - rows with a date column repeating across them are counted per day first;
+    - a label and a number are the largest categories plus an "Other" bar.
+    """
+    if len(frame) < 2:
+        return None
+    columns = list(frame.columns)
+    numeric = [column for column in columns if pd.api.types.is_numeric_dtype(frame[column])
+               and not pd.api.types.is_bool_dtype(frame[column])]
+    first = columns[0]
+    dates = parse_dates(frame[first])
+
+    if dates is not None and dates.is_unique and numeric:
+        series = frame[numeric].assign(**{first: dates}).dropna(subset=[first]).sort_values(first)
+        data = downsample_series(series, first, numeric)
+        return ChartPlan("line", data, first, numeric, sampled_note(len(data), len(series)))
+
+    for column in columns:
+        dates = parse_dates(frame[column])
+        if dates is None:
+            continue
+        days = dates.dropna().dt.floor("D")
+        if days.nunique() == len(days):
+            break
+        counts = days.value_counts(sort=False).sort_index()
+        series = pd.DataFrame({"day": counts.index, "rows": counts.to_numpy()})
+        data = downsample_series(series, "day", ["rows"])
+        note = f"Rows per day of {column}. {sampled_note(len(data), len(series))}"
+        return ChartPlan("line", data, "day", ["rows"], note.strip(), per_day=column)
+
+    if len(columns) == 2 and columns[1] in numeric and frame[first].is_unique:
+        return category_chart(frame, first, columns[1])
+    return None
+
+
+def category_chart(frame, label, value, limit=TOP_CATEGORIES):
+    data = top_categories(frame, label, value, limit)
+    shown = min(limit, len(data))
+    note = "" if shown == len(frame) else f"The {shown} largest {value} of {len(frame):,} {label} values."
+    return ChartPlan("bar", data, label, [value], note)
+
+
+# query as a FROM-clause subquery, without a trailing semicolon
+def subquery(query):
+    return f"(\n{query.strip().rstrip(';')}\n)"
+
+
+def limited_query(query, limit):
+    return f"SELECT * FROM {subquery(query)} LIMIT {int(limit)}"
+
+
+# A column name as a Vega-Lite field, where dots and brackets would otherwise address nested data
+def vega_field(column):
+    return re.sub(r"([.\[\]\\])", r"\\\1", str(column))
+
+
+def quoted(column):
+    return '"' + str(column).replace('"', '""') + '"'
+
+
+def plan_full_chart(fetch, query, sample):
+    """
+    The chart of the full result of query, of which sample holds the first
+    rows, without fetching all of it: rows counted per day are counted in
+    SQL, and other charts read only the columns they draw. fetch(sql)
+    returns (columns, rows), or None if the query did not finish.
+    """
+    plan = plan_chart(sample)
+    if plan is None:
+        return None
+    if plan.per_day:
+        sql = (f"SELECT date({quoted(plan.per_day)}) AS day, COUNT(*) AS rows FROM {subquery(query)} "
+               f"WHERE day IS NOT NULL GROUP BY day ORDER BY day")
+    else:
+        sql = f"SELECT {', '.join(quoted(column) for column in [plan.x] + plan.y)} FROM {subquery(query)}"
+    outcome = fetch(sql)
+    if outcome is None:
+        return None
+    full = plan_chart(pd.DataFrame(outcome[1], columns=outcome[0]))
+    if full is not None and plan.per_day:
+        full.note = f"Rows per day of {plan.per_day}. {full.note}".strip()
+        full.per_day = plan.per_day
+    return full
+
+
+def sampled_note(drawn, total):
+    return "" if drawn == total else f"Drawn from {drawn:,} of {total:,} points (LTTB downsampling)."
+
+
+# Rows of a result with this many columns that fit in MAX_TABLE_CELLS
+def table_row_limit(column_count, max_cells=MAX_TABLE_CELLS):
+    return max(1, max_cells // max(1, column_count))
@@ -0,0 +1,116 @@
+import queue
+import threading
+from contextlib import contextmanager
+from database import create_connection
+from profiling import ProfiledConnection
+
+# PRAGMAs applied to every pooled connection. WAL lets readers run alongside
+# the single writer, and the larger page cache and memory map keep hot pages
+# warm across Streamlit reruns.
+CONNECTION_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -65536,        # 64 MiB page cache (negative = KiB)
+    "mmap_size": 268435456,      # 256 MiB memory-mapped I/O
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+    "foreign_keys": "ON",
+}
+
+DEFAULT_POOL_SIZE = 8
+
+# Seconds a session waits for a free read connection. Sessions hold theirs for
+# a whole rerun, including while they wait on a background query, so with every
+# connection out a rerun would otherwise block until one of those finishes.
+READER_TIMEOUT_SECONDS = 30
+
+# Statements kept compiled per connection by the sqlite3 module
+STATEMENT_CACHE_SIZE = 256
+
+
+# Open a connection usable from any Streamlit script thread and apply the tuned PRAGMAs.
+# With a profiler, every statement run on the connection is timed and recorded.
+def create_pooled_connection(db_file, read_only=False, profiler=None):
+    conn = create_connection(db_file, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE,
+                             factory=ProfiledConnection)
+    if conn is None:
+        raise ConnectionError(f"Unable to connect to the database '{db_file}'.")
+    conn.profiler = profiler
+    for name, value in CONNECTION_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    if read_only:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+class PoolTimeout(ConnectionError):
+    pass
+
+
+class ConnectionPool:
+    """
+    Process-wide pool of SQLite connections: a bounded set of read-only
+    connections handed out per session, and one writer connection guarded
+    by a lock so that writes are serialized.
+    """
+
+    def __init__(self, db_file, size=DEFAULT_POOL_SIZE, profiler=None):
+        self.db_file = db_file
+        self.size = size
+        self.profiler = profiler
+        self._readers = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._writer = create_pooled_connection(db_file, profiler=profiler)
+
+    def acquire(self, timeout=None):
+        """
+        Check out a read connection, opening a new one while the pool is below
+        its size. Raises PoolTimeout if none is free within timeout seconds.
+        """
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return create_pooled_connection(self.db_file, read_only=True, profiler=self.profiler)
+        try:
+            return self._readers.get(timeout=timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"All {self.size} database connections are busy; try again in a moment.")
+
+    def release(self, conn):
+        # Roll back anything a caller left open so the next session starts clean
+        if conn.in_transaction:
+            conn.rollback()
+        self._readers.put(conn)
+
+    @contextmanager
+    def reader(self, timeout=READER_TIMEOUT_SECONDS):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def writer(self):
+        """
+        Serialize access to the writer connection. The block runs in a single
+        transaction that is committed on success and rolled back on error.
+        """
+        with self._write_lock:
+            with self._writer:
+                yield self._writer
+
+    def close(self):
+        with self._write_lock:
+            self._writer.close()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
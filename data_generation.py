@@ -1,46 +1,311 @@
 from faker import Faker
+import argparse
 import random
-from database import create_connection, execute_query
+import time
+from datetime import datetime, timedelta
+from change_log import drop_change_triggers, resume_change_log, trigger_tables
+from database import create_connection, execute_many, initialize_database
+from rollups import drop_rollup_triggers, install_rollups, rollups_installed
+from search_index import drop_search_triggers, install_search, search_installed
 
 fake = Faker()
 
+CUISINES = ["Indian", "Chinese", "Italian", "Mexican", "Thai"]
+ORDER_STATUSES = ["Pending", "Delivered", "Cancelled"]
+ORDER_STATUS_WEIGHTS = [5, 85, 10]
+PAYMENT_MODES = ["Credit Card", "Cash", "UPI"]
+DELIVERY_STATUSES = ["On the way", "Delivered"]
+VEHICLE_TYPES = ["Bike", "Car"]
+
+# Default number of rows generated per table by populate_sample_data
+DEFAULT_ROW_COUNTS = {
+    "customers": 20,
+    "restaurants": 10,
+    "delivery_persons": 0,
+    "orders": 0,
+    "deliveries": 0,
+}
+
+# Rows handed to executemany per transaction in bulk mode
+DEFAULT_BATCH_SIZE = 50_000
+
+# Faker is far too slow to call once per row at millions of rows, so bulk mode
+# draws from pools of pre-generated values instead
+FAKER_POOL_SIZE = 1_000
+
+INSERT_CUSTOMER = """
+INSERT INTO customers (customer_id, name, email, phone, location, signup_date, is_premium, preferred_cuisine)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+INSERT_RESTAURANT = """
+INSERT INTO restaurants (restaurant_id, name, cuisine_type, location, owner_name, average_delivery_time, contact_number, rating)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+INSERT_DELIVERY_PERSON = """
+INSERT INTO delivery_persons (delivery_person_id, name, contact_number, vehicle_type, location)
+VALUES (?, ?, ?, ?, ?);
+"""
+
+INSERT_ORDER = """
+INSERT INTO orders (order_id, customer_id, restaurant_id, order_date, delivery_time, status, total_amount, payment_mode, discount_applied, feedback_rating)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+INSERT_DELIVERY = """
+INSERT INTO deliveries (order_id, delivery_person_id, delivery_status, distance, delivery_time, estimated_time, delivery_fee, vehicle_type)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+
+# Pre-generated Faker values shared by all bulk row generators
+class FakerPools:
+    def __init__(self, size=FAKER_POOL_SIZE):
+        self.names = [fake.name() for _ in range(size)]
+        self.companies = [fake.company() for _ in range(size)]
+        self.phones = [fake.phone_number() for _ in range(size)]
+        self.addresses = [fake.address() for _ in range(size)]
+        self.domains = [fake.free_email_domain() for _ in range(20)]
+
+
+# Next free primary key of a table, so generated rows can reference each other
+def next_id(conn, table, key):
+    row = conn.execute(f"SELECT MAX({key}) FROM {table}").fetchone()
+    return (row[0] or 0) + 1
+
+
+# Existing primary key range of a table, or None when the table is empty
+def id_range(conn, table, key):
+    low, high = conn.execute(f"SELECT MIN({key}), MAX({key}) FROM {table}").fetchone()
+    return (low, high) if low is not None else None
+
+
+def generate_customers(rng, pools, first_id, count):
+    start = datetime.now() - timedelta(days=3 * 365)
+    for customer_id in range(first_id, first_id + count):
+        name = rng.choice(pools.names)
+        yield (
+            customer_id,
+            name,
+            f"{name.split()[0].lower()}.{customer_id}@{rng.choice(pools.domains)}",
+            rng.choice(pools.phones),
+            rng.choice(pools.addresses),
+            (start + timedelta(days=rng.randrange(3 * 365))).strftime("%Y-%m-%d"),
+            rng.choice([0, 1]),
+            rng.choice(CUISINES),
+        )
+
+
+def generate_restaurants(rng, pools, first_id, count):
+    for restaurant_id in range(first_id, first_id + count):
+        yield (
+            restaurant_id,
+            rng.choice(pools.companies),
+            rng.choice(CUISINES),
+            rng.choice(pools.addresses),
+            rng.choice(pools.names),
+            rng.randint(15, 45),
+            rng.choice(pools.phones),
+            round(rng.uniform(3.0, 5.0), 1),
+        )
+
+
+def generate_delivery_persons(rng, pools, first_id, count):
+    for delivery_person_id in range(first_id, first_id + count):
+        yield (
+            delivery_person_id,
+            rng.choice(pools.names),
+            rng.choice(pools.phones),
+            rng.choice(VEHICLE_TYPES),
+            rng.choice(pools.addresses),
+        )
+
+
+def generate_orders(rng, first_id, count, customer_ids, restaurant_ids, days=2 * 365, end=None):
+    start = (end or datetime.now()) - timedelta(days=days)
+    span = days * 24 * 60 * 60
+    for order_id in range(first_id, first_id + count):
+        order_date = start + timedelta(seconds=rng.randrange(span))
+        status = rng.choices(ORDER_STATUSES, ORDER_STATUS_WEIGHTS)[0]
+        delivered_at = order_date + timedelta(minutes=rng.randint(15, 90))
+        yield (
+            order_id,
+            rng.randint(*customer_ids),
+            rng.randint(*restaurant_ids),
+            order_date.strftime("%Y-%m-%d %H:%M:%S"),
+            delivered_at.strftime("%Y-%m-%d %H:%M:%S") if status == "Delivered" else None,
+            status,
+            round(rng.uniform(100.0, 2000.0), 2),
+            rng.choice(PAYMENT_MODES),
+            round(rng.choice([0.0, 0.0, 5.0, 10.0, 15.0, 20.0]), 2),
+            rng.randint(1, 5) if status == "Delivered" else None,
+        )
+
+
+# Deliveries walk the order id range in sequence, so each order gets at most
+# one delivery as long as there are no more deliveries than orders
+def generate_deliveries(rng, count, order_ids, delivery_person_ids):
+    first_order, last_order = order_ids
+    order_span = last_order - first_order + 1
+    for i in range(count):
+        estimated_time = rng.randint(20, 60)
+        yield (
+            first_order + i % order_span,
+            rng.randint(*delivery_person_ids) if delivery_person_ids else None,
+            rng.choices(DELIVERY_STATUSES, [1, 9])[0],
+            round(rng.uniform(0.5, 15.0), 2),
+            max(5, int(rng.gauss(estimated_time, 10))),
+            estimated_time,
+            round(rng.uniform(10.0, 80.0), 2),
+            rng.choice(VEHICLE_TYPES),
+        )
+
+
+# Take successive lists of at most batch_size rows from a row generator
+def batched(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Insert generated rows in batches, one transaction per batch, and report throughput
+def load_rows(conn, table, query, rows, batch_size=DEFAULT_BATCH_SIZE):
+    started = time.perf_counter()
+    inserted = 0
+    for batch in batched(rows, batch_size):
+        inserted += execute_many(conn, query, batch)
+    elapsed = time.perf_counter() - started
+    if inserted:
+        print(f"{table}: {inserted} rows in {elapsed:.2f}s ({inserted / max(elapsed, 1e-9):,.0f} rows/sec)")
+    return inserted
+
+
+# Generate row_counts rows per table with executemany in large transactions.
+# Orders are dated in the two years before end_date (default: now).
+def generate_bulk_data(db_file, row_counts, batch_size=DEFAULT_BATCH_SIZE, seed=None, end_date=None):
+    conn = create_connection(db_file)
+    if not conn:
+        print("Error: Unable to populate data.")
+        return {}
+
+    rng = random.Random(seed)
+    if seed is not None:
+        Faker.seed(seed)
+    pools = FakerPools()
+    counts = dict(DEFAULT_ROW_COUNTS, **row_counts)
+    inserted = {}
+
+    # Durability is not needed while loading synthetic data; the setting
+    # only lasts for this connection
+    conn.execute("PRAGMA synchronous = OFF")
+    started = time.perf_counter()
+
+    # Indexing each customer and restaurant for search as it is inserted makes
+    # the load several times slower, so the indexes are rebuilt once after it
+    rebuild_search = (counts["customers"] or counts["restaurants"]) and search_installed(conn)
+    if rebuild_search:
+        drop_search_triggers(conn)
+
+    # A failed batch stops the load, but the triggers dropped for it are put
+    # back and their tables rebuilt either way
+    rebuild_rollups = logged = False
+    reset_tables = []
+    try:
+        inserted["customers"] = load_rows(
+            conn, "customers", INSERT_CUSTOMER,
+            generate_customers(rng, pools, next_id(conn, "customers", "customer_id"), counts["customers"]),
+            batch_size,
+        )
+        inserted["restaurants"] = load_rows(
+            conn, "restaurants", INSERT_RESTAURANT,
+            generate_restaurants(rng, pools, next_id(conn, "restaurants", "restaurant_id"), counts["restaurants"]),
+            batch_size,
+        )
+        inserted["delivery_persons"] = load_rows(
+            conn, "delivery_persons", INSERT_DELIVERY_PERSON,
+            generate_delivery_persons(rng, pools, next_id(conn, "delivery_persons", "delivery_person_id"), counts["delivery_persons"]),
+            batch_size,
+        )
+
+        # Maintaining the rollups row by row would dominate the load time, so the
+        # triggers are dropped for the load and the rollups rebuilt in one pass after
+        rebuild_rollups = counts["orders"] and rollups_installed(conn)
+        if rebuild_rollups:
+            drop_rollup_triggers(conn)
+
+        # Logging every generated order and delivery would double the load as well,
+        # so the change log records one reset per table instead
+        reset_tables = [table for table in ("orders", "deliveries") if counts[table]]
+        logged = reset_tables and trigger_tables(conn)
+        if logged:
+            drop_change_triggers(conn, reset_tables)
+
+        customer_ids = id_range(conn, "customers", "customer_id")
+        restaurant_ids = id_range(conn, "restaurants", "restaurant_id")
+        first_order = next_id(conn, "orders", "order_id")
+        if counts["orders"] and customer_ids and restaurant_ids:
+            inserted["orders"] = load_rows(
+                conn, "orders", INSERT_ORDER,
+                generate_orders(rng, first_order, counts["orders"], customer_ids, restaurant_ids, end=end_date),
+                batch_size,
+            )
+        elif counts["orders"]:
+            print("Error: orders need at least one customer and one restaurant.")
+
+        # Deliveries go to the orders generated in this run, or to existing orders
+        # when no new orders were requested
+        if inserted.get("orders"):
+            order_ids = (first_order, first_order + inserted["orders"] - 1)
+        else:
+            order_ids = id_range(conn, "orders", "order_id")
+        if counts["deliveries"] and order_ids:
+            inserted["deliveries"] = load_rows(
+                conn, "deliveries", INSERT_DELIVERY,
+                generate_deliveries(rng, counts["deliveries"], order_ids, id_range(conn, "delivery_persons", "delivery_person_id")),
+                batch_size,
+            )
+        elif counts["deliveries"]:
+            print("Error: deliveries need at least one order.")
+    finally:
+        if rebuild_rollups:
+            install_rollups(conn, rebuild=True)
+        if logged:
+            resume_change_log(conn, reset_tables)
+        if rebuild_search:
+            install_search(conn, rebuild=True)
+        conn.close()
+
+    total = sum(inserted.values())
+    elapsed = time.perf_counter() - started
+    print(f"Total: {total} rows in {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f} rows/sec)")
+    return inserted
+
+
 # Insert sample data into the database
 def populate_sample_data(db_file):
-    conn = create_connection(db_file)
+    return generate_bulk_data(db_file, DEFAULT_ROW_COUNTS)
 
-    if conn:
-        # Populate Customers
-        for _ in range(20):
-            query = f"""
-            INSERT INTO customers (name, email, phone, location, signup_date, is_premium, preferred_cuisine)
-            VALUES (
-                '{fake.name()}',
-                '{fake.email()}',
-                '{fake.phone_number()}',
-                '{fake.address()}',
-                '{fake.date()}',
-                {random.choice([0, 1])},
-                '{random.choice(["Indian", "Chinese", "Italian", "Mexican", "Thai"])}'
-            );
-            """
-            execute_query(conn, query)
-
-        # Populate Restaurants
-        for _ in range(10):
-            query = f"""
-            INSERT INTO restaurants (name, cuisine_type, location, owner_name, average_delivery_time, contact_number, rating)
-            VALUES (
-                '{fake.company()}',
-                '{random.choice(["Indian", "Chinese", "Italian", "Mexican", "Thai"])}',
-                '{fake.address()}',
-                '{fake.name()}',
-                {random.randint(15, 45)},
-                '{fake.phone_number()}',
-                {round(random.uniform(3.0, 5.0), 1)}
-            );
-            """
-            execute_query(conn, query)
-
-        print("Sample data populated successfully.")
-    else:
-        print("Error: Unable to populate data.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic food delivery data.")
+    parser.add_argument("--db", default="food_delivery.db", help="SQLite database file")
+    for table in DEFAULT_ROW_COUNTS:
+        parser.add_argument(f"--{table.replace('_', '-')}", type=int, default=DEFAULT_ROW_COUNTS[table],
+                            dest=table, help=f"number of {table} rows to generate")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rows per transaction")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for reproducible data")
+    args = parser.parse_args()
+
+    initialize_database(args.db)
+    generate_bulk_data(args.db, {table: getattr(args, table) for table in DEFAULT_ROW_COUNTS},
+                       batch_size=args.batch_size, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
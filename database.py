@@ -1,23 +1,42 @@
 import sqlite3
 from sqlite3 import Error
+from change_log import install_change_log
+from order_snapshot import install_snapshot_triggers
+from partitions import ensure_partitions, is_partitioned
+from rollups import install_rollups
+from search_index import install_search
 
 # Function to create a database connection
-def create_connection(db_file):
+def create_connection(db_file, **kwargs):
     try:
-        conn = sqlite3.connect(db_file)
+        conn = sqlite3.connect(db_file, **kwargs)
         return conn
     except Error as e:
         print(f"Error: {e}")
     return None
 
 # Execute a general query
-def execute_query(conn, query):
+def execute_query(conn, query, commit=True):
     try:
         c = conn.cursor()
         c.execute(query)
-        conn.commit()
+        if commit:
+            conn.commit()
+    except Error as e:
+        print(f"Error: {e}")
+
+# Execute a parameterized statement for many rows inside a single transaction.
+# The transaction is rolled back on error and the error re-raised, so a failed
+# batch is never mistaken for an empty one
+def execute_many(conn, query, rows):
+    try:
+        c = conn.cursor()
+        with conn:
+            c.executemany(query, rows)
+        return c.rowcount
     except Error as e:
         print(f"Error: {e}")
+        raise
 
 # Execute a read query
 def execute_read_query(conn, query):
@@ -104,14 +123,52 @@ CREATE TABLE IF NOT EXISTS delivery_persons (
 );
 """
 
+# Secondary indexes for the query catalog in queries.py. Composite keys are
+# chosen so the aggregates can be answered from the index alone (covering),
+# and the expression indexes match the strftime/DATE buckets used in
+# GROUP BY clauses exactly so SQLite can use them.
+CREATE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_orders_restaurant ON orders (restaurant_id, total_amount);",
+    "CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status, restaurant_id);",
+    "CREATE INDEX IF NOT EXISTS idx_orders_order_date ON orders (order_date, total_amount);",
+    "CREATE INDEX IF NOT EXISTS idx_orders_month ON orders (strftime('%Y-%m', order_date), total_amount);",
+    "CREATE INDEX IF NOT EXISTS idx_orders_day ON orders (DATE(order_date));",
+    "CREATE INDEX IF NOT EXISTS idx_orders_hour ON orders (strftime('%H', order_date));",
+    "CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders (customer_id, total_amount);",
+    "CREATE INDEX IF NOT EXISTS idx_orders_payment_mode ON orders (payment_mode, feedback_rating);",
+    "CREATE INDEX IF NOT EXISTS idx_deliveries_order ON deliveries (order_id, delivery_time, estimated_time);",
+    "CREATE INDEX IF NOT EXISTS idx_customers_total_orders ON customers (total_orders);",
+    "CREATE INDEX IF NOT EXISTS idx_customers_premium ON customers (is_premium);",
+    "CREATE INDEX IF NOT EXISTS idx_customers_cuisine ON customers (preferred_cuisine);",
+    "CREATE INDEX IF NOT EXISTS idx_restaurants_total_orders ON restaurants (total_orders);",
+    "CREATE INDEX IF NOT EXISTS idx_restaurants_active ON restaurants (is_active);",
+    "CREATE INDEX IF NOT EXISTS idx_delivery_persons_rating ON delivery_persons (average_rating);",
+]
+
 # Initialize database with all tables
 def initialize_database(db_file):
     conn = create_connection(db_file)
     if conn:
-        execute_query(conn, CREATE_CUSTOMERS_TABLE)
-        execute_query(conn, CREATE_RESTAURANTS_TABLE)
-        execute_query(conn, CREATE_ORDERS_TABLE)
-        execute_query(conn, CREATE_DELIVERIES_TABLE)
-        execute_query(conn, CREATE_DELIVERY_PERSONS_TABLE)
+        # Create the schema in one transaction rather than committing each statement
+        conn.execute("BEGIN")
+        execute_query(conn, CREATE_CUSTOMERS_TABLE, commit=False)
+        execute_query(conn, CREATE_RESTAURANTS_TABLE, commit=False)
+        execute_query(conn, CREATE_ORDERS_TABLE, commit=False)
+        execute_query(conn, CREATE_DELIVERIES_TABLE, commit=False)
+        execute_query(conn, CREATE_DELIVERY_PERSONS_TABLE, commit=False)
+        partitioned = is_partitioned(conn)
+        for create_index in CREATE_INDEXES:
+            # Each partition carries its own copy of the orders indexes
+            if partitioned and " ON orders " in create_index:
+                continue
+            execute_query(conn, create_index, commit=False)
+        conn.commit()
+        # Refresh planner statistics for any index that needs them
+        execute_query(conn, "PRAGMA optimize;")
+        install_rollups(conn)
+        install_snapshot_triggers(conn)
+        install_change_log(conn)
+        install_search(conn)
+        ensure_partitions(conn)
     else:
         print("Error: Unable to connect to the database.")
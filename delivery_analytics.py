@@ -0,0 +1,241 @@
+import numpy as np
+import pandas as pd
+
+# Delivery distance buckets in km; the last bucket is open-ended
+DISTANCE_BUCKETS = [0, 2, 5, 10, 15]
+
+DELAY_PERCENTILES = [50, 75, 90, 95, 99]
+
+# Rows pulled per fetchmany call while loading the arrays
+LOAD_BATCH_SIZE = 100_000
+
+# NULL ids load as MISSING_ID, NULL numbers as NaN and NULL labels as code -1
+MISSING_ID = -1
+
+DELIVERY_COLUMNS_QUERY = f"""
+SELECT COALESCE(d.delivery_person_id, {MISSING_ID}),
+       COALESCE(o.restaurant_id, {MISSING_ID}),
+       d.distance,
+       d.delivery_time,
+       d.estimated_time,
+       o.feedback_rating,
+       d.vehicle_type,
+       d.delivery_status
+FROM deliveries d
+LEFT JOIN orders o ON o.order_id = d.order_id;
+"""
+
+# Tables whose writes make a loaded DeliveryArrays stale
+SOURCE_TABLES = ("deliveries", "orders")
+
+
+class LabelEncoder:
+    """
+    Maps text labels to small integer codes, growing as new labels are seen.
+    """
+
+    def __init__(self):
+        self.labels = []
+        self._codes = {}
+
+    def encode(self, values):
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+        mapping = np.array([self._code(label) for label in uniques] + [MISSING_ID], dtype=np.int16)
+        return mapping[codes]  # factorize marks NULL as -1, which indexes the trailing MISSING_ID
+
+    def _code(self, label):
+        if label not in self._codes:
+            self._codes[label] = len(self.labels)
+            self.labels.append(label)
+        return self._codes[label]
+
+
+class DeliveryArrays:
+    """
+    One typed NumPy array per delivery column, loaded once with fetchmany so
+    every metric below is a vectorized pass over memory instead of a SQL scan.
+    """
+
+    def __init__(self, courier_id, restaurant_id, distance, delivery_time, estimated_time, rating,
+                 vehicle_code, vehicle_types, status_code, statuses):
+        self.courier_id = courier_id
+        self.restaurant_id = restaurant_id
+        self.distance = distance
+        self.delivery_time = delivery_time
+        self.estimated_time = estimated_time
+        self.rating = rating
+        self.vehicle_code = vehicle_code
+        self.vehicle_types = vehicle_types
+        self.status_code = status_code
+        self.statuses = statuses
+
+    def __len__(self):
+        return len(self.delivery_time)
+
+    @property
+    def delay(self):
+        # Minutes past the estimate; negative when early, NaN when either time is missing
+        return self.delivery_time - self.estimated_time
+
+    @property
+    def nbytes(self):
+        return sum(value.nbytes for value in vars(self).values() if isinstance(value, np.ndarray))
+
+
+def load_delivery_arrays(conn, batch_size=LOAD_BATCH_SIZE):
+    cursor = conn.execute(DELIVERY_COLUMNS_QUERY)
+    vehicles, statuses = LabelEncoder(), LabelEncoder()
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        columns = list(zip(*rows))
+        chunks.append((
+            np.array(columns[0], dtype=np.int64),
+            np.array(columns[1], dtype=np.int64),
+            np.array(columns[2], dtype=np.float64),  # None becomes NaN
+            np.array(columns[3], dtype=np.float64),
+            np.array(columns[4], dtype=np.float64),
+            np.array(columns[5], dtype=np.float32),
+            vehicles.encode(columns[6]),
+            statuses.encode(columns[7]),
+        ))
+    if chunks:
+        arrays = [np.concatenate(parts) for parts in zip(*chunks)]
+    else:
+        arrays = [np.empty(0, dtype) for dtype in (np.int64, np.int64, np.float64, np.float64, np.float64,
+                                                  np.float32, np.int16, np.int16)]
+    return DeliveryArrays(*arrays[:6], arrays[6], vehicles.labels, arrays[7], statuses.labels)
+
+
+def delay_percentiles(arrays, percentiles=DELAY_PERCENTILES):
+    delay = arrays.delay
+    delay = delay[~np.isnan(delay)]
+    if not len(delay):
+        return {f"p{p}": None for p in percentiles}
+    return {f"p{p}": float(value) for p, value in zip(percentiles, np.percentile(delay, percentiles))}
+
+
+def group_percentiles(codes, values, groups, percentile):
+    """
+    Per-group percentile of values for codes in range(groups), from a single
+    sort by (code, value) instead of one pass per group. Uses the nearest-rank
+    value at or below the percentile position; empty groups get NaN.
+    """
+    order = np.lexsort((values, codes))
+    counts = np.bincount(codes, minlength=groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    positions = starts + np.floor((counts - 1).clip(min=0) * percentile / 100).astype(np.int64)
+    result = np.full(groups, np.nan)
+    present = counts > 0
+    result[present] = values[order][positions[present]]
+    return result
+
+
+def grouped_lateness(codes, delay, labels):
+    """
+    Deliveries, late deliveries, late ratio and delay statistics per group code.
+    Deliveries without both times are left out.
+    """
+    valid = ~np.isnan(delay) & (codes >= 0)
+    codes, delay = codes[valid], delay[valid]
+    groups = len(labels)
+    deliveries = np.bincount(codes, minlength=groups)
+    late = np.bincount(codes, weights=delay > 0, minlength=groups)
+    total_delay = np.bincount(codes, weights=delay, minlength=groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        frame = pd.DataFrame({
+            "group": labels,
+            "deliveries": deliveries,
+            "late": late.astype(np.int64),
+            "late_ratio": late / deliveries,
+            "avg_delay": total_delay / deliveries,
+            "p90_delay": group_percentiles(codes, delay, groups, 90),
+        })
+    return frame[frame["deliveries"] > 0].sort_values("late_ratio", ascending=False, ignore_index=True)
+
+
+def distance_bucket_labels(buckets=DISTANCE_BUCKETS):
+    return [f"{low}-{high} km" for low, high in zip(buckets, buckets[1:])] + [f"{buckets[-1]}+ km"]
+
+
+def lateness_by(arrays, dimension):
+    """
+    Lateness per restaurant, vehicle_type or distance bucket.
+    """
+    if dimension == "restaurant":
+        labels, codes = np.unique(arrays.restaurant_id, return_inverse=True)
+        codes = np.where(labels[codes] == MISSING_ID, -1, codes)
+        frame = grouped_lateness(codes, arrays.delay, labels.tolist())
+        return frame.rename(columns={"group": "restaurant_id"})
+    if dimension == "vehicle_type":
+        frame = grouped_lateness(arrays.vehicle_code.astype(np.int64), arrays.delay, arrays.vehicle_types)
+        return frame.rename(columns={"group": "vehicle_type"})
+    if dimension == "distance":
+        codes = np.digitize(arrays.distance, DISTANCE_BUCKETS) - 1
+        codes[np.isnan(arrays.distance) | (codes < 0)] = -1  # NaN and negative distances have no bucket
+        frame = grouped_lateness(codes, arrays.delay, distance_bucket_labels())
+        return frame.rename(columns={"group": "distance_bucket"})
+    raise ValueError(f"Unknown dimension '{dimension}'")
+
+
+def courier_throughput(arrays):
+    """
+    Per delivery person: deliveries, completed deliveries, distance and time on
+    the road, deliveries and km per hour of delivery time, late ratio and the
+    average feedback rating of the orders they delivered.
+    """
+    couriers, codes = np.unique(arrays.courier_id, return_inverse=True)
+    keep = couriers[codes] != MISSING_ID
+    codes = codes[keep]
+    groups = len(couriers)
+
+    def total(values):
+        values = values[keep]
+        present = ~np.isnan(values)
+        return np.bincount(codes[present], weights=values[present], minlength=groups), \
+            np.bincount(codes[present], minlength=groups)
+
+    delivered = arrays.statuses.index("Delivered") if "Delivered" in arrays.statuses else -2
+    completed = np.bincount(codes, weights=arrays.status_code[keep] == delivered, minlength=groups)
+    distance, _ = total(arrays.distance)
+    minutes, timed = total(arrays.delivery_time)
+    delay = arrays.delay[keep]
+    late = np.bincount(codes[~np.isnan(delay)], weights=delay[~np.isnan(delay)] > 0, minlength=groups)
+    rating_sum, rated = total(arrays.rating.astype(np.float64))
+    deliveries = np.bincount(codes, minlength=groups)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        hours = minutes / 60
+        frame = pd.DataFrame({
+            "delivery_person_id": couriers,
+            "deliveries": deliveries,
+            "completed": completed.astype(np.int64),
+            "total_distance_km": distance,
+            "hours_on_road": hours,
+            "deliveries_per_hour": timed / hours,
+            "km_per_hour": distance / hours,
+            "late_ratio": late / timed,
+            "average_rating": rating_sum / rated,
+        })
+    frame = frame[(frame["delivery_person_id"] != MISSING_ID) & (frame["deliveries"] > 0)]
+    return frame.sort_values("deliveries_per_hour", ascending=False, ignore_index=True)
+
+
+def refresh_courier_counters(conn, throughput):
+    """
+    Write completed deliveries and average rating from courier_throughput back
+    to delivery_persons.total_deliveries/average_rating, which nothing else maintains.
+    Returns the number of rows updated.
+    """
+    rows = [
+        (int(row.completed), None if np.isnan(row.average_rating) else round(float(row.average_rating), 2),
+         int(row.delivery_person_id))
+        for row in throughput.itertuples(index=False)
+    ]
+    cursor = conn.executemany(
+        "UPDATE delivery_persons SET total_deliveries = ?, average_rating = COALESCE(?, 0.0) WHERE delivery_person_id = ?",
+        rows,
+    )
+    return cursor.rowcount
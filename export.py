@@ -0,0 +1,205 @@
+import argparse
+import csv
+import sys
+import time
+from change_log import CHANGE_TABLES, RESET, ChangeConsumer, log_head
+from chart_data import quoted, subquery
+from database import create_connection
+from partitions import column_names
+from queries import CATALOG
+
+# Rows pulled from the cursor per fetchmany call, and per Parquet row group
+DEFAULT_BATCH_SIZE = 50_000
+
+# Largest file offered as a download in the app. Streamlit's download_button
+# holds the whole file in the server's memory until the session ends, so larger
+# results are exported with this script instead.
+MAX_DOWNLOAD_BYTES = 200 * 1024 * 1024
+
+
+# Successive lists of rows from a cursor, batch_size at a time
+def iter_batches(cursor, batch_size=DEFAULT_BATCH_SIZE):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def write_csv(cursor, handle, batch_size=DEFAULT_BATCH_SIZE):
+    writer = csv.writer(handle)
+    writer.writerow([description[0] for description in cursor.description])
+    written = 0
+    for rows in iter_batches(cursor, batch_size):
+        writer.writerows(rows)
+        written += len(rows)
+    return written
+
+
+def column_types(conn, query, params=()):
+    """
+    The storage classes (typeof) each column of query holds across its whole
+    result, as a set per column. SQLite columns are not typed, so one column
+    can hold integers in its first rows and reals or text further on. Reading
+    them costs one more pass over the result but no memory.
+    """
+    columns = [description[0] for description in conn.execute(f"SELECT * FROM {subquery(query)} LIMIT 0", params)
+               .description]
+    if not columns:
+        return []
+    seen = ", ".join(f"group_concat(DISTINCT typeof({quoted(column)}))" for column in columns)
+    row = conn.execute(f"SELECT {seen} FROM {subquery(query)}", params).fetchone()
+    return [set((kinds or "").split(",")) - {"null", ""} for kinds in row]
+
+
+# The Arrow type that holds every value of a column with these storage classes
+def arrow_type(pa, kinds):
+    if kinds == {"integer"}:
+        return pa.int64()
+    if kinds and kinds <= {"integer", "real"}:
+        return pa.float64()
+    if kinds == {"blob"}:
+        return pa.binary()
+    return pa.string()
+
+
+# values as the Python objects the Arrow type takes, e.g. numbers as text in a mixed column
+def conform(pa, values, arrow):
+    if pa.types.is_string(arrow):
+        return [value if value is None or isinstance(value, str) else
+                value.hex() if isinstance(value, bytes) else str(value) for value in values]
+    if pa.types.is_floating(arrow):
+        return [None if value is None else float(value) for value in values]
+    return list(values)
+
+
+def write_parquet(cursor, path, batch_size=DEFAULT_BATCH_SIZE, types=None):
+    """
+    Write each fetched batch as its own Parquet row group. The schema comes
+    from types, the storage classes of each column from column_types, so that
+    it fits every batch: integer columns are int64, columns mixing integers
+    and reals float64, blob columns binary, and anything else, including text
+    mixed with numbers and columns that are all NULL, string.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires the 'pyarrow' package.")
+    columns = [description[0] for description in cursor.description]
+    schema = pa.schema([(column, arrow_type(pa, kinds)) for column, kinds in zip(columns, types or [set()] * len(columns))])
+    written = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in iter_batches(cursor, batch_size):
+            arrays = [pa.array(conform(pa, values, field.type), type=field.type)
+                      for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            written += len(rows)
+    return written
+
+
+def export_query(conn, query, path, file_format="csv", params=(), batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Stream the result of query to a CSV or Parquet file without holding more
+    than batch_size rows in memory. Returns the number of rows written.
+    """
+    if file_format == "parquet":
+        types = column_types(conn, query, params)
+        return write_parquet(conn.execute(query, params), path, batch_size, types)
+    cursor = conn.execute(query, params)
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        return write_csv(cursor, handle, batch_size)
+
+
+def export_table(conn, table, path, file_format="csv", batch_size=DEFAULT_BATCH_SIZE):
+    return export_query(conn, f"SELECT * FROM {table}", path, file_format, batch_size=batch_size)
+
+
+def export_changes(conn, consumer, table, path, file_format="csv", batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Export the rows of table changed since consumer's last export, read from
+    the change log: the current row of every key inserted or updated, marked
+    "upsert", and the key of every deleted one, marked "delete". The first
+    export, and the first after the table was reset, has the whole table,
+    marked "reset". Saves the consumer's position once the file is written;
+    returns (rows written, whether it was a full export).
+    """
+    key = CHANGE_TABLES[table]
+    columns = [column for column in column_names(conn, table) if column.lower() != key]
+    new = conn.execute("SELECT 1 FROM change_consumers WHERE name = ?", (consumer,)).fetchone() is None
+    reader = ChangeConsumer(conn, consumer, [table])
+    head = log_head(conn)
+    window = (reader.position, head, table)
+    full = new or conn.execute("SELECT 1 FROM change_log WHERE seq > ? AND seq <= ? AND table_name = ? AND operation = ?",
+                               window + (RESET,)).fetchone() is not None
+    if full:
+        query = f"SELECT '{RESET}' AS change, {key}, {', '.join(columns)} FROM {table}"
+        params = ()
+    else:
+        # The current row of every changed key, then the keys no longer there.
+        # Filtering by IN rather than joining lets SQLite seek each partition
+        # of partitioned orders by key instead of scanning the view.
+        changed = "SELECT row_key FROM change_log WHERE seq > ? AND seq <= ? AND table_name = ?"
+        query = (f"SELECT 'upsert' AS change, {key}, {', '.join(columns)} FROM {table} WHERE {key} IN ({changed}) "
+                 f"UNION ALL SELECT 'delete', k.row_key, {', '.join('NULL' for _ in columns)} "
+                 f"FROM (SELECT DISTINCT row_key FROM ({changed})) k "
+                 f"WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.{key} = k.row_key)")
+        params = window + window
+    written = export_query(conn, query, path, file_format, params, batch_size)
+    reader.commit(head)
+    conn.commit()
+    return written, full
+
+
+# Arguments given as name=value pairs on the command line
+def parse_arguments(pairs):
+    arguments = {}
+    for pair in pairs or []:
+        name, separator, value = pair.partition("=")
+        if not separator:
+            raise ValueError(f"Expected name=value, got '{pair}'")
+        arguments[name] = value
+    return arguments
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a table or catalog query to CSV or Parquet.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--table", help="table to export")
+    source.add_argument("--query", help="catalog query name (e.g. delayed_deliveries) or Query Section number")
+    parser.add_argument("--param", action="append", help="argument for a query parameter as name=value (e.g. days=14)")
+    parser.add_argument("--changes", metavar="CONSUMER",
+                        help=f"with --table ({', '.join(CHANGE_TABLES)}), export only the rows changed since "
+                             "this consumer's last export")
+    parser.add_argument("--output", required=True, help="output file")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="output format")
+    parser.add_argument("--db", default="food_delivery.db", help="SQLite database file")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rows fetched per batch")
+    args = parser.parse_args()
+
+    conn = create_connection(args.db)
+    started = time.perf_counter()
+    try:
+        if args.changes:
+            if args.table not in CHANGE_TABLES:
+                raise ValueError(f"--changes needs --table {' or '.join(CHANGE_TABLES)}")
+            written, full = export_changes(conn, args.changes, args.table, args.output, args.format, args.batch_size)
+            if full:
+                print(f"Full export of {args.table} for {args.changes}; later exports have only the changes.")
+        elif args.table:
+            written = export_table(conn, args.table, args.output, args.format, args.batch_size)
+        else:
+            query = CATALOG.find(args.query)
+            written = export_query(conn, query.sql, args.output, args.format, query.bind(parse_arguments(args.param)),
+                                   args.batch_size)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - started
+    print(f"Exported {written} rows to {args.output} in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import argparse
+import re
+from database import create_connection
+from queries import CATALOG
+
+# Most columns worth putting in a suggested index; wider keys cost more on writes than they save
+MAX_INDEX_COLUMNS = 4
+
+TABLE_ALIAS_PATTERN = re.compile(
+    r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|GROUP\b|ORDER\b|JOIN\b|LIMIT\b|INNER\b|LEFT\b)([A-Za-z_]\w*))?",
+    re.IGNORECASE,
+)
+# Left-hand column of a comparison, plus the right-hand column when it is a qualified join key
+FILTER_PATTERN = re.compile(r"(?:(\w+)\.)?(\w+)\s*(=|>=|<=|>|<|\bIN\b)\s*(?:(\w+)\.(\w+))?", re.IGNORECASE)
+CLAUSE_PATTERN = re.compile(r"\b(GROUP|ORDER)\s+BY\s+(.*?)(?=\bORDER\s+BY\b|\bLIMIT\b|\bHAVING\b|;|$)", re.IGNORECASE | re.DOTALL)
+FULL_SCAN_PATTERN = re.compile(r"^SCAN (\w+)$")
+
+
+# Rows of EXPLAIN QUERY PLAN as plain detail strings
+def explain(conn, query, params=()):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+
+
+# Columns of a table, without the INTEGER PRIMARY KEY (rowid) that every index already carries
+def table_columns(conn, table):
+    return [
+        row[1].lower() for row in conn.execute(f"PRAGMA table_info({table})")
+        if not (row[5] and row[2].upper() == "INTEGER")
+    ]
+
+
+# Leading key columns of every existing index on a table
+def existing_indexes(conn, table):
+    indexes = []
+    for index in conn.execute(f"PRAGMA index_list({table})").fetchall():
+        columns = [row[2].lower() if row[2] else None for row in conn.execute(f"PRAGMA index_info({index[1]})")]
+        indexes.append(columns)
+    return indexes
+
+
+def index_statement(table, columns):
+    return f"CREATE INDEX IF NOT EXISTS idx_auto_{table}_{'_'.join(columns)} ON {table} ({', '.join(columns)});"
+
+
+# Map every alias (and the bare table name) used in a query to its table
+def resolve_aliases(query):
+    aliases = {}
+    for table, alias in TABLE_ALIAS_PATTERN.findall(query):
+        aliases[table.lower()] = table.lower()
+        if alias:
+            aliases[alias.lower()] = table.lower()
+    return aliases
+
+
+# Columns of a table referenced by a query, ordered the way an index wants
+# them: equality filters, then range filters, then GROUP/ORDER BY keys, then
+# any other referenced column so the index can cover the query.
+def index_columns_for(query, table, alias, columns):
+    names = {table, alias}
+    equality, ranges, grouping, other = [], [], [], []
+
+    def owned(qualifier, column):
+        return column.lower() in columns and (qualifier is None or qualifier.lower() in names)
+
+    for qualifier, column, operator, right_qualifier, right_column in FILTER_PATTERN.findall(query):
+        target = equality if operator.upper() in ("=", "IN") else ranges
+        if owned(qualifier or None, column):
+            target.append(column.lower())
+        if right_column and owned(right_qualifier, right_column):
+            target.append(right_column.lower())
+    for _, keys in CLAUSE_PATTERN.findall(query):
+        for key in keys.split(","):
+            match = re.fullmatch(r"\s*(?:(\w+)\.)?(\w+)(?:\s+(?:ASC|DESC))?\s*", key, re.IGNORECASE)
+            if match and owned(match.group(1), match.group(2)):
+                grouping.append(match.group(2).lower())
+    for qualifier, column in re.findall(r"(?:(\w+)\.)?\b(\w+)\b", query):
+        if owned(qualifier or None, column):
+            other.append(column.lower())
+
+    ordered = []
+    for column in equality + ranges + grouping + other:
+        if column not in ordered:
+            ordered.append(column)
+    return ordered[:MAX_INDEX_COLUMNS]
+
+
+class Finding:
+    def __init__(self, name, query, plan):
+        self.name = name
+        self.query = query
+        self.plan = plan
+        self.full_scans = []
+        self.temp_btrees = [line for line in plan if "TEMP B-TREE" in line]
+        self.suggestions = []
+
+    @property
+    def ok(self):
+        return not self.full_scans and not self.temp_btrees
+
+    def as_dict(self):
+        return {
+            "query": self.name,
+            "full_scans": ", ".join(self.full_scans),
+            "temp_btrees": "; ".join(self.temp_btrees),
+            "suggestions": "; ".join(index_statement(table, columns) for table, columns in self.suggestions),
+        }
+
+
+# Run EXPLAIN QUERY PLAN for one query and suggest indexes for its full scans
+def analyze_query(conn, name, query, params=()):
+    finding = Finding(name, query, explain(conn, query, params))
+    aliases = resolve_aliases(query)
+    alias_of = {table: alias for alias, table in aliases.items() if alias != table}
+    for line in finding.plan:
+        match = FULL_SCAN_PATTERN.match(line)
+        if not match:
+            continue
+        table = aliases.get(match.group(1).lower(), match.group(1).lower())
+        finding.full_scans.append(table)
+        columns = index_columns_for(query, table, alias_of.get(table, table), set(table_columns(conn, table)))
+        # An existing index with the same leading columns was already passed over by the planner
+        if columns and not any(index[:len(columns)] == columns for index in existing_indexes(conn, table)):
+            finding.suggestions.append((table, tuple(columns)))
+    return finding
+
+
+# Suggested indexes across all findings, dropping any whose columns are a
+# prefix of another suggestion on the same table
+def merge_suggestions(findings):
+    suggestions = {suggestion for finding in findings for suggestion in finding.suggestions}
+    return sorted(
+        (table, columns) for table, columns in suggestions
+        if not any(
+            other_table == table and len(other) > len(columns) and other[:len(columns)] == columns
+            for other_table, other in suggestions
+        )
+    )
+
+
+# Analyze every catalog query (or the given CatalogQuery objects) with its default arguments
+def advise(conn, catalog=None):
+    findings = []
+    for query in catalog if catalog is not None else CATALOG:
+        try:
+            findings.append(analyze_query(conn, query.name, query.sql, query.defaults))
+        except Exception as e:
+            print(f"Error analyzing '{query.name}': {e}")
+    return findings
+
+
+# Create the merged set of suggested indexes
+def apply_suggestions(conn, findings):
+    created = []
+    for table, columns in merge_suggestions(findings):
+        statement = index_statement(table, columns)
+        conn.execute(statement)
+        created.append(statement)
+    conn.commit()
+    if created:
+        conn.execute("ANALYZE")
+        conn.commit()
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the query catalog for full scans and temp B-trees.")
+    parser.add_argument("--db", default="food_delivery.db", help="SQLite database file")
+    parser.add_argument("--apply", action="store_true", help="create the suggested indexes")
+    args = parser.parse_args()
+
+    conn = create_connection(args.db)
+    findings = advise(conn)
+    for finding in findings:
+        status = "ok" if finding.ok else "needs attention"
+        print(f"{finding.name}: {status}")
+        for line in finding.plan:
+            print(f"    {line}")
+        for table, columns in finding.suggestions:
+            print(f"    suggest: {index_statement(table, columns)}")
+    if args.apply:
+        for statement in apply_suggestions(conn, findings):
+            print(f"created: {statement}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,311 @@
 import streamlit as st
 import pandas as pd
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+import bulk_import
+import change_log
+import chart_data
+import delivery_analytics
+import export
+import index_advisor
+import pagination
+import partitions
+import rollups
+import search_index
+import table_rebuild
+from queries import CATALOG, HEATMAP_GRID, HEATMAP_GRID_BY_CUISINE, HEATMAP_GRID_BY_RESTAURANT
+from approximate import APPROXIMATE_QUERIES, EXACT_BY_DEFAULT
+from connection_pool import create_pooled_connection
+from order_snapshot import SNAPSHOT_QUERIES
+from profiling import SLOW_QUERY_LOG
+from query_cache import MAX_CACHED_ROWS, QueryCache, tables_read, tables_written
+from query_workers import CANCELLED, DEFAULT_TIMEOUT_SECONDS, DONE, TIMED_OUT
+from schema_catalog import SchemaCatalog
 
 class DatabaseManager:
-    def __init__(self, conn):
+    def __init__(self, conn, pool=None, cache=None, snapshot=None, workers=None, writes=None, catalog=None,
+                 approximate=None, replica=None):
         self.conn = conn
         self.cursor = conn.cursor()
+        self.pool = pool
+        self.cache = cache
+        self.snapshot = snapshot
+        self.workers = workers
+        self.writes = writes
+        self.catalog = catalog if catalog is not None else SchemaCatalog()
+        self.approximate = approximate
+        # Report pages reading from the analytics copy keep its results in the
+        # copy's own cache; writes still invalidate the live database's cache
+        self.replica = replica
+        self.read_cache = replica.cache if replica is not None else cache
+        self._schema = None
+
+    def _run_write(self, operation):
+        """
+        Call operation(conn) on a connection that may write, and commit.
+        With a connection pool, writes go through its serialized writer connection.
+        A write from a page reading the analytics copy asks for the copy to be refreshed.
+        """
+        if self.pool is None:
+            result = operation(self.conn)
+            self.conn.commit()
+            return result
+        with self.pool.writer() as conn:
+            result = operation(conn)
+        if self.replica is not None:
+            self.replica.request_refresh()
+        return result
+
+    @contextmanager
+    def _dedicated_connection(self):
+        """
+        A connection of its own for a long write that commits in batches (a
+        table rebuild, a bulk import, log compaction), so other writers
+        interleave between its batches instead of waiting behind the pool's
+        writer for all of it. Without a pool, the page's connection.
+        """
+        if self.pool is None:
+            yield self.conn
+            return
+        conn = create_pooled_connection(self.pool.db_file, profiler=self.pool.profiler)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _write(self, query, params=()):
+        """
+        Execute a statement that modifies the database and commit it. With a
+        write queue, the statement is committed together with writes from
+        other sessions and this returns its WriteResult once that commit is done.
+        """
+        if self.writes is not None:
+            result = self.writes.execute(query, params)
+        else:
+            result = self._run_write(lambda conn: conn.execute(query, params))
+        if self.cache is not None:
+            self.cache.invalidate(tables_written(query))
+        self.catalog.forget_estimates(tables_written(query))
+        return result
+
+    def _ddl(self, query):
+        """
+        Execute a statement that changes the schema, so the next lookup reloads it.
+        """
+        result = self._write(query)
+        self._schema = None
+        return result
+
+    def schema(self):
+        """
+        The schema catalog's current snapshot, checked against schema_version
+        once per rerun instead of on every widget that lists tables or columns.
+        """
+        if self._schema is None:
+            self._schema = self.catalog.current(self.conn)
+        return self._schema
+
+    def fetch_query(self, query, params=(), tables=None):
+        """
+        Run a read query and return (columns, rows), serving repeated queries
+        from the result cache until a table they read from is written. Catalog
+        queries pass the tables they declare; others are parsed for them.
+        """
+        tables = tables if tables is not None else tables_read(query)
+        if self.read_cache is not None:
+            key = QueryCache.make_key(query, params)
+            hit, result = self.read_cache.get(key)
+            if hit:
+                return result
+            # Taken before reading, so a write invalidated while the query runs keeps its result out
+            generation = self.read_cache.generation(tables)
+        cursor = self.conn.execute(query, params)
+        rows = cursor.fetchall()
+        columns = [description[0] for description in cursor.description]
+        if self.read_cache is not None and len(rows) <= MAX_CACHED_ROWS:
+            self.read_cache.put(key, (columns, rows), tables, generation=generation)
+        return columns, rows
+
+    def background_query(self, query, label, key, timeout=DEFAULT_TIMEOUT_SECONDS, params=()):
+        """
+        Run a read query on the background workers and return (columns, rows)
+        once it finishes, or None if it was cancelled or failed. The job is kept
+        in the session, so a rerun picks up the running query or its result
+        instead of starting it again. While it runs, progress is redrawn until
+        it finishes; any widget interaction interrupts the wait, not the query.
+        """
+        job_key = f"{key}_job"
+        if self.read_cache is not None:
+            hit, result = self.read_cache.get(QueryCache.make_key(query, params))
+            if hit:
+                return result
+        job = self.workers.get(st.session_state.get(job_key))
+        # A finished result that was cached but is gone from the cache is stale, as
+        # is one whose tables were written while or after it ran
+        if job is None or job.key != QueryCache.make_key(query, params) or (
+                job.status == DONE and (job.cached or self.workers.stale(job))):
+            job = self.workers.submit(query, params, label=label, timeout=timeout)
+            st.session_state[job_key] = job.id
+
+        if not job.finished:
+            status = st.empty()
+            st.button("Cancel Query", key=f"{key}_cancel", on_click=self.workers.cancel, args=(job.id,))
+            while not job.wait(0.25):
+                if job.progress is None:
+                    status.caption(f"Running in the background for {job.elapsed:.1f}s ({job.steps:,} VM steps)...")
+                else:
+                    status.progress(job.progress, text=f"Running in the background for {job.elapsed:.1f}s...")
+            status.empty()
+
+        if job.status == DONE:
+            st.caption(f"Ran in the background in {job.elapsed:.2f}s.")
+            return job.columns, job.rows
+        if job.status == CANCELLED:
+            st.warning("Query cancelled.")
+        elif job.status == TIMED_OUT:
+            st.error(job.error)
+        else:
+            st.error(f"Error executing query: {job.error}")
+        st.button("Run Again", key=f"{key}_retry", on_click=st.session_state.pop, args=(job_key, None))
+        return None
+
+    def run_named_query(self, query_name, arguments=None):
+        """
+        Run one of the named insight queries of the catalog, with arguments for
+        its parameters. Raises ValueError for an invalid argument.
+        """
+        query = CATALOG[query_name]
+        params = query.bind(arguments)
+        if "heatmap" in query.variants and rollups.heatmap_installed(self.conn):
+            query = query.variants["heatmap"]
+        return self.fetch_query(query.sql, params, query.tables)
+
+    def browse_table(self, table, key=None):
+        """
+        Show one page of a table at a time using keyset seeks on its primary key,
+        so memory and latency stay the same however large the table grows.
+        """
+        key = key or table.lower()
+        info = self.schema().table(table)
+        columns = info.column_names if info else pagination.table_columns(self.conn, table)
+        controls = st.columns(3)
+        page_size = controls[0].selectbox("Rows per page", pagination.PAGE_SIZES,
+                                          index=pagination.PAGE_SIZES.index(pagination.DEFAULT_PAGE_SIZE), key=f"{key}_page_size")
+        sort_column = controls[1].selectbox("Sort by", columns, key=f"{key}_sort")
+        descending = controls[2].radio("Order", ["Ascending", "Descending"], key=f"{key}_order") == "Descending"
+
+        # Cursors of the pages visited so far; reset whenever the ordering changes
+        state_key = f"{key}_pages"
+        settings = (table, page_size, sort_column, descending)
+        if st.session_state.get(f"{state_key}_settings") != settings:
+            st.session_state[f"{state_key}_settings"] = settings
+            st.session_state[state_key] = [None]
+        pages = st.session_state[state_key]
+
+        query, params = pagination.page_query(self.conn, table, page_size, sort_column, pages[-1], descending,
+                                              key=info.primary_key if info else None, columns=columns)
+        result_columns, rows = self.fetch_query(query, params)
+        result_columns, rows, next_after = pagination.split_page(result_columns, rows, page_size)
+
+        estimate = self.catalog.row_estimate(self.conn, table)
+        st.caption(f"Page {len(pages)} of about {max(1, -(-estimate // page_size))} (~{estimate} rows)")
+        if rows:
+            st.dataframe(pd.DataFrame(rows, columns=result_columns))
+        else:
+            st.info(f"No data found in table '{table}'.")
+
+        # Callbacks run before the next rerun, so the new page renders on the same click
+        navigation = st.columns(2)
+        navigation[0].button("Previous Page", key=f"{key}_previous", disabled=len(pages) == 1,
+                             on_click=pages.pop)
+        navigation[1].button("Next Page", key=f"{key}_next", disabled=next_after is None,
+                             on_click=pages.append, args=(next_after,))
+
+    def export_widget(self, query, file_name, key, params=()):
+        """
+        Stream a query result to a temporary CSV/Parquet file with fetchmany and offer it as a download.
+        The download button holds the file in memory, so files past export.MAX_DOWNLOAD_BYTES are not offered.
+        """
+        with st.expander("Export Results"):
+            file_format = st.radio("Format", ["csv", "parquet"], key=f"{key}_export_format", horizontal=True)
+            if st.button("Prepare Export", key=f"{key}_export"):
+                handle, path = tempfile.mkstemp(suffix=f".{file_format}")
+                os.close(handle)
+                try:
+                    written = export.export_query(self.conn, query, path, file_format, params)
+                    mime = "text/csv" if file_format == "csv" else "application/octet-stream"
+                    size = os.path.getsize(path)
+                    if size > export.MAX_DOWNLOAD_BYTES:
+                        st.warning(f"The export has {written} rows ({size / 2 ** 20:,.0f} MiB), too large to download "
+                                   f"here; use export.py from the command line instead.")
+                        return
+                    with open(path, "rb") as handle:
+                        st.download_button(f"Download {written} rows", handle, file_name=f"{file_name}.{file_format}",
+                                           mime=mime, key=f"{key}_download")
+                except Exception as e:
+                    st.error(f"Error: {e}")
+                finally:
+                    os.remove(path)
+
+    def show_table(self, frame, truncated=False):
+        """
+        Show at most chart_data.MAX_TABLE_CELLS cells of frame, so a large
+        result does not have to be serialized to the browser in full.
+        truncated means frame already holds only the first rows of a result.
+        """
+        limit = chart_data.table_row_limit(len(frame.columns))
+        st.dataframe(frame.head(limit))
+        if truncated:
+            st.caption(f"Showing the first {min(limit, len(frame)):,} rows; export the result for all of them.")
+        elif len(frame) > limit:
+            st.caption(f"Showing the first {limit:,} of {len(frame):,} rows.")
+
+    @staticmethod
+    def show_chart(plan):
+        if plan is None:
+            return
+        if plan.kind == "line":
+            st.line_chart(plan.data, x=plan.x, y=plan.y)
+        else:
+            # A Vega-Lite spec rather than st.bar_chart, which sorts the bars
+            # by label; sort null keeps the plan's order, largest first and "Other" last
+            st.vega_lite_chart(plan.data, {
+                "mark": "bar",
+                "encoding": {
+                    "x": {"field": chart_data.vega_field(plan.x), "type": "nominal", "sort": None, "title": plan.x},
+                    "y": {"field": chart_data.vega_field(plan.y[0]), "type": "quantitative", "title": plan.y[0]},
+                },
+            }, use_container_width=True)
+        if plan.note:
+            st.caption(plan.note)
+
+    def search_box(self, table, key):
+        """
+        Typeahead over the table's search index. Picking a match fills in its
+        ID in the update and delete forms, so operators need not know it.
+        """
+        if self.schema().table(search_index.search_table(table)) is None:
+            st.caption("Search is unavailable until the index is installed (python search_index.py install).")
+            return
+        text = st.text_input(f"Search {table}", key=f"{key}_search", placeholder="Name, email, phone, location...")
+        columns, rows = search_index.search(self.conn, table, text)
+        if not rows:
+            if search_index.match_expression(text) is not None:
+                st.info("No matches found.")
+            return
+        st.dataframe(pd.DataFrame(rows, columns=columns))
+        labels = {row[0]: f"{row[0]} - {row[1]}" for row in rows}
+        selected = st.selectbox("Match", list(labels), format_func=labels.get, key=f"{key}_match")
+        st.button("Use Selected ID", key=f"{key}_use", on_click=self._select_match, args=(key, selected))
+
+    # Callback: runs before the rerun, so the ID inputs render with the match
+    @staticmethod
+    def _select_match(key, row_id):
+        st.session_state[f"{key}_update_id"] = row_id
+        st.session_state[f"{key}_delete_id"] = row_id
 
     def manage_customers(self):
         st.subheader("Customer Management")
@@ -20,37 +321,36 @@ class DatabaseManager:
             preferred_cuisine = st.selectbox("Preferred Cuisine", ['Indian', 'Chinese', 'Italian', 'Mexican'])
 
             if st.button("Add Customer"):
-                self.cursor.execute('''
+                self._write('''
                     INSERT INTO Customers (name, email, phone, location, signup_date, is_premium, preferred_cuisine)
                     VALUES (?, ?, ?, ?, ?, ?, ?)
                 ''', (name, email, phone, location, signup_date, is_premium, preferred_cuisine))
-                self.conn.commit()
                 st.success("Customer added successfully!")
 
         # View Customers
         if st.checkbox("View All Customers"):
-            customers = pd.read_sql_query("SELECT * FROM Customers", self.conn)
-            st.dataframe(customers)
+            self.browse_table("Customers")
+
+        # Search Customers
+        self.search_box("customers", "customers")
 
         # Update Customer
         with st.expander("Update Customer"):
-            customer_id = st.number_input("Enter Customer ID to Update", min_value=1, step=1)
+            customer_id = st.number_input("Enter Customer ID to Update", min_value=1, step=1, key="customers_update_id")
             field_to_update = st.selectbox("Field to Update", ['name', 'email', 'phone', 'location', 'preferred_cuisine'])
             new_value = st.text_input("Enter New Value")
 
             if st.button("Update Customer"):
                 query = f"UPDATE Customers SET {field_to_update} = ? WHERE customer_id = ?"
-                self.cursor.execute(query, (new_value, customer_id))
-                self.conn.commit()
+                self._write(query, (new_value, customer_id))
                 st.success("Customer updated successfully!")
 
         # Delete Customer
         with st.expander("Delete Customer"):
-            customer_id_to_delete = st.number_input("Enter Customer ID to Delete", min_value=1, step=1)
+            customer_id_to_delete = st.number_input("Enter Customer ID to Delete", min_value=1, step=1, key="customers_delete_id")
 
             if st.button("Delete Customer"):
-                self.cursor.execute("DELETE FROM Customers WHERE customer_id = ?", (customer_id_to_delete,))
-                self.conn.commit()
+                self._write("DELETE FROM Customers WHERE customer_id = ?", (customer_id_to_delete,))
                 st.success("Customer deleted successfully!")
 
     def manage_restaurants(self):
@@ -69,37 +369,36 @@ class DatabaseManager:
             is_active = st.checkbox("Is Active")
 
             if st.button("Add Restaurant"):
-                self.cursor.execute('''
+                self._write('''
                     INSERT INTO Restaurants (name, cuisine_type, location, owner_name, average_delivery_time, contact_number, rating, total_orders, is_active)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ''', (name, cuisine_type, location, owner_name, average_delivery_time, contact_number, rating, total_orders, is_active))
-                self.conn.commit()
                 st.success("Restaurant added successfully!")
 
         # View Restaurants
         if st.checkbox("View All Restaurants"):
-            restaurants = pd.read_sql_query("SELECT * FROM Restaurants", self.conn)
-            st.dataframe(restaurants)
+            self.browse_table("Restaurants")
+
+        # Search Restaurants
+        self.search_box("restaurants", "restaurants")
 
         # Update Restaurant
         with st.expander("Update Restaurant"):
-            restaurant_id = st.number_input("Enter Restaurant ID to Update", min_value=1, step=1)
+            restaurant_id = st.number_input("Enter Restaurant ID to Update", min_value=1, step=1, key="restaurants_update_id")
             field_to_update = st.selectbox("Field to Update", ['name', 'cuisine_type', 'location', 'owner_name', 'rating'])
             new_value = st.text_input("Enter New Value")
 
             if st.button("Update Restaurant"):
                 query = f"UPDATE Restaurants SET {field_to_update} = ? WHERE restaurant_id = ?"
-                self.cursor.execute(query, (new_value, restaurant_id))
-                self.conn.commit()
+                self._write(query, (new_value, restaurant_id))
                 st.success("Restaurant updated successfully!")
 
         # Delete Restaurant
         with st.expander("Delete Restaurant"):
-            restaurant_id_to_delete = st.number_input("Enter Restaurant ID to Delete", min_value=1, step=1)
+            restaurant_id_to_delete = st.number_input("Enter Restaurant ID to Delete", min_value=1, step=1, key="restaurants_delete_id")
 
             if st.button("Delete Restaurant"):
-                self.cursor.execute("DELETE FROM Restaurants WHERE restaurant_id = ?", (restaurant_id_to_delete,))
-                self.conn.commit()
+                self._write("DELETE FROM Restaurants WHERE restaurant_id = ?", (restaurant_id_to_delete,))
                 st.success("Restaurant deleted successfully!")
 
     def manage_orders(self):
@@ -118,17 +417,15 @@ class DatabaseManager:
             feedback_rating = st.slider("Feedback Rating", min_value=1, max_value=5)
 
             if st.button("Add Order"):
-                self.cursor.execute('''
+                self._write('''
                     INSERT INTO Orders (customer_id, restaurant_id, order_date, delivery_time, status, total_amount, payment_mode, discount_applied, feedback_rating)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ''', (customer_id, restaurant_id, order_date, delivery_time, status, total_amount, payment_mode, discount_applied, feedback_rating))
-                self.conn.commit()
                 st.success("Order added successfully!")
 
         # View Orders
         if st.checkbox("View All Orders"):
-            orders = pd.read_sql_query("SELECT * FROM Orders", self.conn)
-            st.dataframe(orders)
+            self.browse_table("Orders")
 
         # Update Order
         with st.expander("Update Order"):
@@ -138,8 +435,7 @@ class DatabaseManager:
 
             if st.button("Update Order"):
                 query = f"UPDATE Orders SET {field_to_update} = ? WHERE order_id = ?"
-                self.cursor.execute(query, (new_value, order_id))
-                self.conn.commit()
+                self._write(query, (new_value, order_id))
                 st.success("Order updated successfully!")
 
         # Delete Order
@@ -147,8 +443,7 @@ class DatabaseManager:
             order_id_to_delete = st.number_input("Enter Order ID to Delete", min_value=1, step=1)
 
             if st.button("Delete Order"):
-                self.cursor.execute("DELETE FROM Orders WHERE order_id = ?", (order_id_to_delete,))
-                self.conn.commit()
+                self._write("DELETE FROM Orders WHERE order_id = ?", (order_id_to_delete,))
                 st.success("Order deleted successfully!")
 
     def manage_deliveries(self):
@@ -165,17 +460,15 @@ class DatabaseManager:
             vehicle_type = st.selectbox("Vehicle Type", ['Bike', 'Car'])
 
             if st.button("Add Delivery"):
-                self.cursor.execute('''
+                self._write('''
                     INSERT INTO Deliveries (order_id, delivery_status, distance, delivery_time, estimated_time, delivery_fee, vehicle_type)
                     VALUES (?, ?, ?, ?, ?, ?, ?)
                 ''', (order_id, delivery_status, distance, delivery_time, estimated_time, delivery_fee, vehicle_type))
-                self.conn.commit()
                 st.success("Delivery added successfully!")
 
         # View Deliveries
         if st.checkbox("View All Deliveries"):
-            deliveries = pd.read_sql_query("SELECT * FROM Deliveries", self.conn)
-            st.dataframe(deliveries)
+            self.browse_table("Deliveries")
 
         # Update Delivery
         with st.expander("Update Delivery"):
@@ -185,8 +478,7 @@ class DatabaseManager:
 
             if st.button("Update Delivery"):
                 query = f"UPDATE Deliveries SET {field_to_update} = ? WHERE delivery_id = ?"
-                self.cursor.execute(query, (new_value, delivery_id))
-                self.conn.commit()
+                self._write(query, (new_value, delivery_id))
                 st.success("Delivery updated successfully!")
 
         # Delete Delivery
@@ -194,8 +486,7 @@ class DatabaseManager:
             delivery_id_to_delete = st.number_input("Enter Delivery ID to Delete", min_value=1, step=1)
 
             if st.button("Delete Delivery"):
-                self.cursor.execute("DELETE FROM Deliveries WHERE delivery_id = ?", (delivery_id_to_delete,))
-                self.conn.commit()
+                self._write("DELETE FROM Deliveries WHERE delivery_id = ?", (delivery_id_to_delete,))
                 st.success("Delivery deleted successfully!")
 
     def manage_columns(self):
@@ -204,8 +495,10 @@ class DatabaseManager:
         """
         st.subheader("Column Management")
 
-        table_name = st.selectbox("Select Table", ["Customers", "Restaurants", "Orders", "Deliveries"])
+        table_name = st.selectbox("Select Table", self.schema().table_names())
         operation = st.selectbox("Operation", ["Add Column", "Delete Column", "Update Column Name"])
+        columns = self.schema().table(table_name).column_names if table_name else []
+        st.caption(f"Columns: {', '.join(columns)}")
 
         if operation == "Add Column":
             column_name = st.text_input("New Column Name")
@@ -213,22 +506,55 @@ class DatabaseManager:
             if st.button(f"Add Column to {table_name}"):
                 query = f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"
                 try:
-                    self.cursor.execute(query)
-                    self.conn.commit()
+                    self._ddl(query)
+                    # Changes to the new column are logged once the triggers know it
+                    if table_name.lower() in change_log.trigger_tables(self.conn):
+                        self._run_write(lambda conn: change_log.create_change_triggers(conn, table_name.lower(), refresh=True))
                     st.success(f"Column {column_name} added to {table_name}!")
                 except Exception as e:
                     st.error(f"Error: {e}")
 
         elif operation == "Delete Column":
-            st.warning("Deleting a column is not natively supported in SQLite. It requires recreating the table.")
-            st.info("Please consult a database administrator for this operation.")
-            # Optional implementation: Table recreation logic
+            column_name = st.selectbox("Column to Delete", columns)
+            st.caption("The table is rebuilt without the column in small batches, so it stays readable and "
+                       "writable until the rebuilt copy is swapped in. Indexes on the column are dropped with it.")
+            if st.button(f"Delete {column_name} from {table_name}"):
+                status = st.progress(0.0, text="Starting...")
+                marks = {}
+
+                def report(stage, done, total, elapsed):
+                    # Each stage's ETA comes from its own rate so far
+                    started = marks.setdefault(stage, marks.get("last", 0.0))
+                    marks["last"] = elapsed
+                    remaining = (elapsed - started) / done * (total - done)
+                    label = "rows copied" if stage == "copy" else "indexes built"
+                    status.progress(done / total, text=f"{done:,} of {total:,} {label}, about {remaining:.0f}s left")
+
+                try:
+                    with self._dedicated_connection() as conn:
+                        copied, dropped_indexes, elapsed = table_rebuild.drop_column(conn, table_name, column_name, progress=report)
+                    self._schema = None
+                    if self.cache is not None:
+                        self.cache.invalidate(tables_written(f"ALTER TABLE {table_name}"))
+                    status.empty()
+                    st.success(f"Column {column_name} deleted from {table_name} in {elapsed:.2f}s ({copied} rows copied).")
+                    if dropped_indexes:
+                        st.info(f"Dropped indexes: {', '.join(dropped_indexes)}.")
+                except Exception as e:
+                    st.error(f"Error: {e}")
 
         elif operation == "Update Column Name":
-            old_column_name = st.text_input("Old Column Name")
+            old_column_name = st.selectbox("Old Column Name", columns)
             new_column_name = st.text_input("New Column Name")
             if st.button(f"Update Column Name in {table_name}"):
-                st.warning("Renaming a column is not natively supported in SQLite. Consider using table recreation logic.")
+                try:
+                    self._run_write(lambda conn: table_rebuild.rename_column(conn, table_name, old_column_name, new_column_name))
+                    self._schema = None
+                    if self.cache is not None:
+                        self.cache.invalidate(tables_written(f"ALTER TABLE {table_name}"))
+                    st.success(f"Column {old_column_name} renamed to {new_column_name} in {table_name}!")
+                except Exception as e:
+                    st.error(f"Error: {e}")
 
         st.info("SQLite has limited support for modifying table structures. Use carefully.")
 
@@ -239,61 +565,275 @@ class DatabaseManager:
         """
         st.subheader("Query Section")
 
-        # List of predefined SQL queries with updated queries
-        queries = [
-            ("1. Get the total number of customers", "SELECT COUNT(*) FROM customers"),
-            ("2. Get the details of top 5 customers by total orders", "SELECT * FROM customers ORDER BY total_orders DESC LIMIT 5"),
-            ("3. Get the average order value for all customers", "SELECT AVG(total_amount) FROM orders"),
-            ("4. Get the total number of orders for each restaurant", "SELECT restaurant_id, COUNT(*) AS total_orders FROM orders GROUP BY restaurant_id"),
-            ("5. Get the total revenue for each restaurant", "SELECT restaurant_id, SUM(total_amount) AS total_revenue FROM orders GROUP BY restaurant_id"),
-            ("6. Get the number of orders placed each month in the last year", 
-             "SELECT strftime('%Y-%m', order_date) AS month, COUNT(*) AS total_orders FROM orders WHERE order_date >= DATE('now', '-1 year') GROUP BY month ORDER BY month DESC"),
-            ("7. Get the most popular restaurant by total orders", "SELECT restaurant_id, COUNT(*) AS total_orders FROM orders GROUP BY restaurant_id ORDER BY total_orders DESC LIMIT 1"),
-            ("8. Get the total number of canceled orders per restaurant", 
-             "SELECT restaurant_id, COUNT(*) AS canceled_orders FROM orders WHERE status = 'Cancelled' GROUP BY restaurant_id"),
-            ("9. Get the total revenue generated for each month", 
-             "SELECT strftime('%Y-%m', order_date) AS month, SUM(total_amount) AS total_revenue FROM orders GROUP BY month ORDER BY month DESC"),
-            ("10. Get the top 3 restaurants by rating", "SELECT restaurant_id, AVG(rating) AS avg_rating FROM restaurants GROUP BY restaurant_id ORDER BY avg_rating DESC LIMIT 3"),
-            ("11. Get the average discount applied for all orders", "SELECT AVG(discount_applied) FROM orders"),
-            ("12. Get the average order amount for premium customers", "SELECT AVG(total_amount) FROM orders WHERE customer_id IN (SELECT customer_id FROM customers WHERE is_premium = 1)"),
-            ("13. Get the total number of canceled orders", "SELECT COUNT(*) FROM orders WHERE status = 'Cancelled'"),
-            ("14. Get the average rating given to restaurants for each restaurant", 
-             "SELECT restaurant_id, AVG(rating) AS avg_rating FROM restaurants GROUP BY restaurant_id"),
-            ("15. Get the most common cuisine types ordered by customers", "SELECT preferred_cuisine, COUNT(*) AS frequency FROM customers GROUP BY preferred_cuisine ORDER BY frequency DESC LIMIT 5"),
-            ("16. Get the orders placed in the last 7 days", "SELECT * FROM orders WHERE order_date >= DATE('now', '-7 days')"),
-            ("17. Get the average delivery fee for orders", "SELECT AVG(delivery_fee) FROM deliveries"),
-            ("18. Get the number of active restaurants", "SELECT COUNT(*) FROM restaurants WHERE is_active = 1"),
-            ("19. Get the total number of orders placed per day", "SELECT DATE(order_date) AS order_day, COUNT(*) AS total_orders FROM orders GROUP BY order_day ORDER BY order_day DESC"),
-            ("20. Get the total revenue for the last 30 days", "SELECT SUM(total_amount) FROM orders WHERE order_date >= DATE('now', '-30 days')")
-        ]
-
         # Let the user select a query
-        selected_query = st.selectbox("Choose a query to execute", [query[0] for query in queries])
+        selected_query = st.selectbox("Choose a query to execute", [query.name for query in CATALOG.section()])
+        query = CATALOG[selected_query]
+
+        # Arguments for the query's parameters, e.g. its window or row limit
+        arguments = {}
+        if query.parameters:
+            inputs = st.columns(len(query.parameters))
+            for column, parameter in zip(inputs, query.parameters.values()):
+                arguments[parameter.name] = column.number_input(
+                    parameter.label, min_value=parameter.minimum, max_value=parameter.maximum,
+                    value=parameter.default, step=1, key=f"query_section_{query.name}_{parameter.name}")
+        try:
+            params = query.bind(arguments)
+        except ValueError as e:
+            st.error(f"Error: {e}")
+            return
+
+        # Exploratory aggregates default to an approximate answer from the
+        # sample and sketches; the exact one is a click away. Cheap indexed
+        # counts default to exact.
+        use_approximate = (self.approximate is not None and selected_query in APPROXIMATE_QUERIES
+                           and st.radio("Answer", ["Approximate", "Exact"], horizontal=True,
+                                        index=int(selected_query in EXACT_BY_DEFAULT)) == "Approximate")
+        if use_approximate and not self.approximate.available(self.conn):
+            st.caption("The approximate summary is being built in the background; showing the exact answer meanwhile.")
+            use_approximate = False
+
+        # Answer from the columnar orders snapshot when enabled, otherwise from
+        # the rollup tables when they are installed
+        use_snapshot = (not use_approximate and self.snapshot is not None and selected_query in SNAPSHOT_QUERIES
+                        and st.checkbox("Use columnar orders snapshot", value=True))
+        query_to_run, tables = query.sql, query.tables
+        if use_approximate:
+            st.caption("Estimated from a sample and sketches of orders and customers. error_bound is the 95% "
+                       "margin of the estimate, or for counts by value the most they can overcount.")
+        elif use_snapshot:
+            st.caption("Answered from the in-memory orders snapshot.")
+        elif "rollup" in query.variants and rollups.rollups_installed(self.conn):
+            query_to_run, tables = query.variants["rollup"].sql, query.variants["rollup"].tables
+            st.caption("Answered from the order rollup tables.")
+        elif selected_query in partitions.DATE_BOUNDED_QUERIES and partitions.is_partitioned(self.conn):
+            query_to_run, read = partitions.pruned_query(self.conn, query_to_run,
+                                                         partitions.DATE_BOUNDED_QUERIES[selected_query], params)
+            tables = None
+            st.caption(f"Reading {len(read)} of {len(partitions.order_tables(self.conn))} order partitions.")
 
-        # Find the query that matches the selected one
-        query_to_run = None
-        for query in queries:
-            if query[0] == selected_query:
-                query_to_run = query[1]
-                break
+        # Long queries run on the background workers, stopped after this many seconds
+        if self.workers is not None and not use_snapshot and not use_approximate:
+            timeout = st.number_input("Timeout (seconds)", min_value=1, value=DEFAULT_TIMEOUT_SECONDS, step=30)
+
+        # SQL results are fetched only as far as the table shows them; a chart
+        # of a longer one is aggregated or narrowed to its columns in SQL
+        row_limit = chart_data.table_row_limit(len(query.columns))
+        limited = chart_data.limited_query(query_to_run, row_limit + 1)
+
+        def fetch(sql, key):
+            if self.workers is not None:
+                return self.background_query(sql, selected_query, key, timeout, params)
+            return self.fetch_query(sql, params, tables)
 
         # Execute the selected query and display the result
-        if query_to_run:
-            try:
-                self.cursor.execute(query_to_run)
-                result = self.cursor.fetchall()
-                columns = [description[0] for description in self.cursor.description]  # Get column names from cursor description
-                
+        try:
+            if use_approximate:
+                outcome = self.approximate.answer(self.conn, selected_query, params)
+            elif use_snapshot:
+                self.snapshot.refresh(self.conn)
+                outcome = SNAPSHOT_QUERIES[selected_query](self.snapshot, self.conn, **params)
+            else:
+                outcome = fetch(limited, "query_section")
+
+            if outcome is not None:
+                columns, result = outcome
+                truncated = not use_approximate and not use_snapshot and len(result) > row_limit
+
                 # Convert result to DataFrame
-                df = pd.DataFrame(result, columns=columns)
-                
+                df = pd.DataFrame(result[:row_limit] if truncated else result, columns=columns)
+
                 if not df.empty:
+                    if truncated:
+                        self.show_chart(chart_data.plan_full_chart(
+                            lambda sql: fetch(sql, "query_section_chart"), query_to_run, df))
+                    else:
+                        self.show_chart(chart_data.plan_chart(df))
                     st.write("Query Results:")
-                    st.dataframe(df)  # Display the DataFrame directly without passing 'columns'
+                    self.show_table(df, truncated)
                 else:
                     st.info("No results found for the selected query.")
-            except Exception as e:
-                st.error(f"Error executing query: {e}")
+        except Exception as e:
+            st.error(f"Error executing query: {e}")
+        if use_approximate:
+            summary = self.approximate
+            st.caption(f"Sampled {summary.orders.filled:,} of {summary.order_count:,} orders; "
+                       f"{summary.changed:,} order updates or deletes since the sample was drawn are not reflected.")
+            st.button("Resample", on_click=summary.invalidate)
+        self.export_widget(query_to_run, f"query_{selected_query.split('.')[0]}", "query_section", params)
+
+        if self.read_cache is not None:
+            stats = self.read_cache.stats()
+            st.caption(
+                f"Result cache: {stats['hits']} hits, {stats['misses']} misses "
+                f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} entries, "
+                f"{stats['invalidations']} invalidated"
+            )
+
+    def replica_status(self):
+        """
+        How current the analytics copy this page reads is, with a button to
+        refresh it now. Flagged when refreshes fall behind or fail.
+        """
+        replica = self.replica
+        age = replica.age
+        when = time.strftime("%H:%M:%S", time.localtime(replica.current_at))
+        message = (f"Reading the analytics copy, current as of {when} "
+                   f"({f'{age:.0f}s' if age < 120 else f'{age / 60:.0f} min'} ago).")
+        if replica.error:
+            st.warning(f"{message} The last refresh failed: {replica.error}")
+        elif replica.stale:
+            st.warning(f"{message} Refreshes are falling behind the {replica.interval}s interval.")
+        else:
+            st.caption(f"{message} Refreshed every {replica.interval}s while the database changes; "
+                       f"the last copy took {replica.last_duration:.1f}s.")
+        st.button("Refresh Analytics Copy", on_click=replica.request_refresh)
+
+    def order_heatmap(self):
+        """
+        Orders by day of week and hour of day from the heatmap rollups, for
+        all restaurants or drilled down to one restaurant or cuisine.
+        """
+        st.subheader("Order Heatmap")
+        if not rollups.heatmap_installed(self.conn):
+            st.info("The order heatmap is not installed; use Table Management > Rebuild Rollups.")
+            return
+
+        scope = st.radio("Show", ["All restaurants", "Restaurant", "Cuisine"], horizontal=True)
+        if scope == "Restaurant":
+            _, restaurants = self.fetch_query("SELECT restaurant_id, name FROM restaurants ORDER BY name")
+            restaurant = st.selectbox("Restaurant", restaurants, format_func=lambda row: f"{row[1]} (#{row[0]})")
+            _, cells = self.fetch_query(HEATMAP_GRID_BY_RESTAURANT, (restaurant[0] if restaurant else None,))
+        elif scope == "Cuisine":
+            _, cuisines = self.fetch_query("SELECT DISTINCT cuisine_type FROM restaurants WHERE cuisine_type IS NOT NULL ORDER BY 1")
+            cuisine = st.selectbox("Cuisine", [row[0] for row in cuisines])
+            _, cells = self.fetch_query(HEATMAP_GRID_BY_CUISINE, (cuisine,))
+        else:
+            _, cells = self.fetch_query(HEATMAP_GRID)
+
+        cells = pd.DataFrame(cells, columns=["weekday", "hour", "orders"])
+        undated = int(cells.loc[(cells["weekday"] < 0) | (cells["hour"] < 0), "orders"].sum())
+        cells = cells[(cells["weekday"] >= 0) & (cells["hour"] >= 0)]
+        if cells.empty:
+            st.info("No orders found.")
+            return
+        days = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
+        grid = cells.pivot(index="weekday", columns="hour", values="orders").reindex(index=range(7), columns=range(24))
+        grid = grid.fillna(0).astype(int)
+        grid.index = days
+
+        peak = cells.loc[cells["orders"].idxmax()]
+        by_hour = grid.sum(axis=0)
+        by_day = grid.sum(axis=1)
+        metrics = st.columns(3)
+        metrics[0].metric("Peak hour", f"{by_hour.idxmax():02d}:00")
+        metrics[1].metric("Peak day", by_day.idxmax())
+        metrics[2].metric("Busiest slot", f"{days[int(peak['weekday'])]} {int(peak['hour']):02d}:00")
+
+        st.write("Orders by day of week and hour of day:")
+        st.dataframe(grid)
+        st.bar_chart(by_hour.rename("orders"))
+        if undated:
+            st.caption(f"{undated} orders without a valid order date are not shown.")
+
+        reconciled = rollups.last_reconciled(self.conn)
+        if reconciled:
+            st.caption(f"Last reconciled with orders at {reconciled[0]} UTC ({reconciled[1]} cells corrected).")
+        if st.button("Reconcile Heatmap"):
+            corrected = self._run_write(rollups.reconcile_heatmap)
+            if self.cache is not None:
+                self.cache.invalidate(list(rollups.HEATMAPS))
+            st.success(f"Heatmap reconciled with orders, {corrected} cells corrected.")
+
+    def load_delivery_arrays(self):
+        """
+        Delivery columns as NumPy arrays, kept in the result cache until orders or deliveries are written.
+        """
+        key = QueryCache.make_key(delivery_analytics.DELIVERY_COLUMNS_QUERY)
+        if self.read_cache is not None:
+            hit, arrays = self.read_cache.get(key)
+            if hit:
+                return arrays
+            generation = self.read_cache.generation(delivery_analytics.SOURCE_TABLES)
+        arrays = delivery_analytics.load_delivery_arrays(self.conn)
+        if self.read_cache is not None:
+            self.read_cache.put(key, arrays, delivery_analytics.SOURCE_TABLES, generation=generation)
+        return arrays
+
+    def delivery_performance(self):
+        """
+        Delay percentiles, lateness ratios and courier throughput computed in
+        memory from the delivery arrays.
+        """
+        st.subheader("Delivery Performance")
+        arrays = self.load_delivery_arrays()
+        if not len(arrays):
+            st.info("No deliveries found.")
+            return
+        st.caption(f"{len(arrays)} deliveries loaded ({arrays.nbytes / 2 ** 20:.1f} MiB)")
+
+        st.write("Delay past the estimate (minutes):")
+        percentiles = delivery_analytics.delay_percentiles(arrays)
+        for column, (label, value) in zip(st.columns(len(percentiles)), percentiles.items()):
+            column.metric(label, "-" if value is None else f"{value:.1f}")
+
+        dimension = st.selectbox("Lateness by", ["restaurant", "vehicle_type", "distance"])
+        lateness = delivery_analytics.lateness_by(arrays, dimension).round(3)
+        self.show_chart(chart_data.category_chart(lateness, lateness.columns[0], "late_ratio"))
+        self.show_table(lateness)
+
+        st.write("Courier throughput:")
+        throughput = delivery_analytics.courier_throughput(arrays)
+        self.show_table(throughput.round(3))
+        if st.button("Update Delivery Person Counters"):
+            updated = self._run_write(lambda conn: delivery_analytics.refresh_courier_counters(conn, throughput))
+            if self.cache is not None:
+                self.cache.invalidate(["delivery_persons"])
+            st.success(f"Updated total_deliveries and average_rating for {updated} delivery persons.")
+
+    def performance(self):
+        """
+        Shows statement and page latency percentiles collected by the query
+        profiler, and the statements that crossed the slow-query threshold.
+        """
+        st.subheader("Performance")
+        profiler = self.pool.profiler if self.pool is not None else None
+        if profiler is None:
+            st.info("Query profiling is not enabled for this connection.")
+            return
+
+        threshold_ms = st.number_input("Slow-query threshold (ms)", min_value=1, value=int(profiler.slow_threshold * 1000), step=50)
+        profiler.slow_threshold = threshold_ms / 1000
+        st.button("Reset statistics", on_click=profiler.reset)
+
+        st.write("Page render times:")
+        pages = pd.DataFrame(profiler.page_report())
+        if pages.empty:
+            st.info("No pages have been rendered yet.")
+        else:
+            st.dataframe(pages.sort_values("p95_ms", ascending=False).round(2))
+
+        st.write("Statements:")
+        statements = pd.DataFrame(profiler.statement_report())
+        if statements.empty:
+            st.info("No statements have been recorded yet.")
+        else:
+            self.show_table(statements.sort_values("p95_ms", ascending=False).round(2))
+
+        if self.writes is not None:
+            stats = self.writes.stats()
+            st.caption(
+                f"Write queue: {stats['writes']} writes in {stats['groups']} commits "
+                f"(average group {stats['average_group']:.1f}, largest {stats['largest_group']}), "
+                f"{stats['busy_retries']} busy retries"
+            )
+
+        st.write(f"Slow queries (≥ {threshold_ms} ms, also written to {SLOW_QUERY_LOG}):")
+        slow = pd.DataFrame(list(profiler.slow_queries)[::-1])
+        if slow.empty:
+            st.info("No slow queries recorded.")
+        else:
+            st.dataframe(slow)
 
     def manage_tables(self):
         """
@@ -304,7 +844,7 @@ class DatabaseManager:
         # Select Operation
         operation = st.selectbox(
             "Select Operation",
-            ["Create Table", "View Tables", "View Table Content", "Delete Table", "Update Table Name", "Populate Table"]
+            ["Create Table", "View Tables", "View Table Content", "Delete Table", "Update Table Name", "Populate Table", "Index Advisor", "Rebuild Rollups", "Bulk Import", "Partition Orders", "Change Log"]
         )
 
         if operation == "Create Table":
@@ -317,8 +857,7 @@ class DatabaseManager:
                 if table_name and columns:
                     try:
                         query = f"CREATE TABLE IF NOT EXISTS {table_name} ({columns})"
-                        self.cursor.execute(query)
-                        self.conn.commit()
+                        self._ddl(query)
                         st.success(f"Table '{table_name}' created successfully!")
                     except Exception as e:
                         st.error(f"Error: {e}")
@@ -326,15 +865,11 @@ class DatabaseManager:
                     st.warning("Please provide both table name and column definitions.")
 
         elif operation == "Populate Table":
-            query = "SELECT name FROM sqlite_master WHERE type='table';"
-            self.cursor.execute(query)
-            tables = [table[0] for table in self.cursor.fetchall()]
+            tables = self.schema().table_names()
             selected_table = st.selectbox("Select Table to Populate", tables)
             if selected_table:
                 st.write(f"Populating table '{selected_table}'")
-                self.cursor.execute(f"PRAGMA table_info({selected_table})")
-                columns = self.cursor.fetchall()
-                column_names = [col[1] for col in columns]
+                column_names = self.schema().table(selected_table).column_names
 
                 # Input form for populating the table
                 input_data = {}
@@ -347,63 +882,166 @@ class DatabaseManager:
                         placeholders = ", ".join(["?" for _ in column_names])
                         values = tuple(input_data[col] for col in column_names)
                         query = f"INSERT INTO {selected_table} ({', '.join(column_names)}) VALUES ({placeholders})"
-                        self.cursor.execute(query, values)
-                        self.conn.commit()
+                        self._write(query, values)
                         st.success(f"Data inserted into '{selected_table}' successfully!")
                     except Exception as e:
                         st.error(f"Error: {e}")
 
         elif operation == "View Tables":
-            query = "SELECT name FROM sqlite_master WHERE type='table';"
-            self.cursor.execute(query)
-            tables = self.cursor.fetchall()
+            tables = [self.schema().table(name) for name in self.schema().table_names()]
             if tables:
                 st.write("Existing Tables:")
-                for table in tables:
-                    st.write(f"- {table[0]}")
+                st.dataframe(pd.DataFrame(
+                    [(table.name, ", ".join(f"{column.name} {column.declared_type}".strip() for column in table.columns),
+                      ", ".join(index.name for index in table.indexes), self.catalog.row_estimate(self.conn, table.name))
+                     for table in tables],
+                    columns=["table", "columns", "indexes", "approximate rows"],
+                ))
             else:
                 st.info("No tables found.")
 
         elif operation == "View Table Content":
-            query = "SELECT name FROM sqlite_master WHERE type='table';"
-            self.cursor.execute(query)
-            tables = [table[0] for table in self.cursor.fetchall()]
+            tables = self.schema().table_names()
             selected_table = st.selectbox("Select Table to View Content", tables)
-            if st.button("View Content"):
+            if selected_table:
                 try:
-                    self.cursor.execute(f"SELECT * FROM {selected_table}")
-                    rows = self.cursor.fetchall()
-                    if rows:
-                        st.write(f"Contents of {selected_table}:")
-                        st.dataframe(rows)
-                    else:
-                        st.info(f"No data found in table '{selected_table}'.")
+                    st.write(f"Contents of {selected_table}:")
+                    self.browse_table(selected_table, key="table_content")
+                    self.export_widget(f"SELECT * FROM {selected_table}", selected_table, "table_content")
                 except Exception as e:
                     st.error(f"Error: {e}")
 
         elif operation == "Delete Table":
-            query = "SELECT name FROM sqlite_master WHERE type='table';"
-            self.cursor.execute(query)
-            tables = [table[0] for table in self.cursor.fetchall()]
+            tables = self.schema().table_names()
             table_to_delete = st.selectbox("Select Table to Delete", tables)
             if st.button(f"Delete {table_to_delete}"):
                 try:
-                    self.cursor.execute(f"DROP TABLE IF EXISTS {table_to_delete}")
-                    self.conn.commit()
+                    self._ddl(f"DROP TABLE IF EXISTS {table_to_delete}")
                     st.success(f"Table '{table_to_delete}' deleted successfully!")
                 except Exception as e:
                     st.error(f"Error: {e}")
 
         elif operation == "Update Table Name":
-            query = "SELECT name FROM sqlite_master WHERE type='table';"
-            self.cursor.execute(query)
-            tables = [table[0] for table in self.cursor.fetchall()]
+            tables = self.schema().table_names()
             table_to_update = st.selectbox("Select Table to Rename", tables)
             new_table_name = st.text_input("Enter New Table Name")
             if st.button(f"Rename '{table_to_update}' to '{new_table_name}'"):
                 try:
-                    self.cursor.execute(f"ALTER TABLE {table_to_update} RENAME TO {new_table_name}")
-                    self.conn.commit()
+                    self._ddl(f"ALTER TABLE {table_to_update} RENAME TO {new_table_name}")
                     st.success(f"Table renamed from '{table_to_update}' to '{new_table_name}'!")
                 except Exception as e:
-                    st.error(f"Error: {e}")
\ No newline at end of file
+                    st.error(f"Error: {e}")
+
+        elif operation == "Index Advisor":
+            st.write("Runs EXPLAIN QUERY PLAN over every catalog query and flags full scans and temporary B-trees.")
+            findings = index_advisor.advise(self.conn)
+            st.dataframe(pd.DataFrame([finding.as_dict() for finding in findings if not finding.ok]))
+            suggestions = index_advisor.merge_suggestions(findings)
+            if not suggestions:
+                st.success("No missing indexes found for the query catalog.")
+            elif st.button("Create Suggested Indexes"):
+                try:
+                    created = self._run_write(lambda conn: index_advisor.apply_suggestions(conn, findings))
+                    st.success(f"Created {len(created)} indexes.")
+                    for statement in created:
+                        st.code(statement, language="sql")
+                except Exception as e:
+                    st.error(f"Error: {e}")
+
+        elif operation == "Rebuild Rollups":
+            st.write("Recomputes the order rollup tables and the total_orders counters from the orders table in one pass.")
+            if st.button("Rebuild Rollups"):
+                try:
+                    elapsed = self._run_write(lambda conn: rollups.install_rollups(conn, rebuild=True))
+                    if self.cache is not None:
+                        self.cache.invalidate(list(rollups.ROLLUPS) + ["customers", "restaurants"])
+                    st.success(f"Rollups rebuilt in {elapsed:.2f}s.")
+                except Exception as e:
+                    st.error(f"Error: {e}")
+
+        elif operation == "Partition Orders":
+            if not partitions.is_partitioned(self.conn):
+                st.write("Splits orders into one table per month behind an orders view, so date-bounded queries "
+                         "read only the months they need. Reads and writes on orders keep working unchanged.")
+                if st.button("Partition Orders by Month"):
+                    try:
+                        created = self._run_write(partitions.partition_orders)
+                        if self.cache is not None:
+                            self.cache.clear()
+                        st.success(f"Orders split into {created} monthly partitions.")
+                    except Exception as e:
+                        st.error(f"Error: {e}")
+            else:
+                counts = [(table, self.catalog.row_estimate(self.conn, table)) for table in partitions.order_tables(self.conn)]
+                st.dataframe(pd.DataFrame(counts, columns=["partition", "approximate orders"]))
+                months = [month for month, _ in partitions.month_partitions(self.conn)]
+                month = st.selectbox("Month", months[::-1])
+                actions = st.columns(3)
+                try:
+                    if actions[0].button("Create Upcoming Partitions"):
+                        created = self._run_write(partitions.ensure_partitions)
+                        if created:
+                            st.success(f"Created {', '.join(created)}.")
+                        else:
+                            st.info("Partitions up to next month already exist.")
+                    if actions[1].button("Compact Month"):
+                        self._run_write(lambda conn: partitions.compact_partition(conn, month))
+                        st.success(f"Compacted {partitions.partition_name(month)}.")
+                    if actions[2].button("Archive Month"):
+                        path = self._run_write(lambda conn: partitions.archive_partition(conn, month))
+                        if self.cache is not None:
+                            self.cache.clear()
+                        st.success(f"Archived {month} to {path}.")
+                except Exception as e:
+                    st.error(f"Error: {e}")
+
+        elif operation == "Change Log":
+            st.write("Every insert, update and delete on orders and deliveries is logged with its key and changed "
+                     "columns. Consumers read the log from their saved position instead of rescanning the tables.")
+            head, entries, consumers = change_log.log_status(self.conn)
+            metrics = st.columns(2)
+            metrics[0].metric("Changes logged", f"{head:,}")
+            metrics[1].metric("Entries kept", f"{entries:,}")
+            if consumers:
+                st.dataframe(pd.DataFrame(consumers, columns=["consumer", "position", "behind", "updated_at"]))
+            else:
+                st.info("No consumers are registered; compaction removes every entry.")
+            st.dataframe(pd.DataFrame(
+                [(change.seq, change.table, change.key, change.operation, ", ".join(change.columns), change.changed_at)
+                 for change in change_log.read_changes(self.conn, max(head - 20, 0))][::-1],
+                columns=["seq", "table", "key", "operation", "changed columns", "changed_at"],
+            ))
+            if st.button("Compact Change Log"):
+                try:
+                    with self._dedicated_connection() as conn:
+                        read, superseded = change_log.compact_log(conn)
+                    if self.cache is not None:
+                        self.cache.invalidate(["change_log"])
+                    st.success(f"Removed {read} entries read by every consumer and {superseded} superseded entries.")
+                except Exception as e:
+                    st.error(f"Error: {e}")
+
+        elif operation == "Bulk Import":
+            tables = self.schema().table_names()
+            selected_table = st.selectbox("Select Table to Import Into", tables)
+            uploaded = st.file_uploader("CSV or Parquet file with a header row matching the table's columns", type=["csv", "parquet"])
+            chunk_size = st.number_input("Rows per transaction", min_value=1000, value=bulk_import.DEFAULT_CHUNK_SIZE, step=1000)
+            if uploaded is not None and st.button(f"Import into {selected_table}"):
+                # A stable path keeps the saved progress valid if the same file is uploaded again after a failure
+                path = os.path.join(tempfile.gettempdir(), f"bulk_import_{selected_table}_{os.path.basename(uploaded.name)}")
+                with open(path, "wb") as handle:
+                    shutil.copyfileobj(uploaded, handle, length=1024 * 1024)
+                status = st.empty()
+
+                def report(rows_done, elapsed):
+                    status.write(f"{rows_done} rows imported ({rows_done / max(elapsed, 1e-9):,.0f} rows/sec)")
+
+                try:
+                    with self._dedicated_connection() as conn:
+                        imported, elapsed = bulk_import.import_file(conn, selected_table, path, int(chunk_size), progress=report)
+                    os.remove(path)
+                    if self.cache is not None:
+                        self.cache.invalidate(tables_written(f"INSERT INTO {selected_table}"))
+                    st.success(f"Imported {imported} rows into '{selected_table}' in {elapsed:.2f}s.")
+                except Exception as e:
+                    st.error(f"Error: {e}")
@@ -0,0 +1,400 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from partitions import order_tables
+from queries import SINCE_DAYS, SINCE_MONTHS
+
+DEFAULT_SNAPSHOT_DIR = os.path.join("snapshots", "orders")
+
+# Rows pulled per fetchmany call while appending to the snapshot
+REFRESH_BATCH_SIZE = 100_000
+
+# Snapshot columns, their on-disk dtype and the SQL that produces them. Text
+# columns and restaurant_id are dictionary-encoded; order_date is stored as
+# epoch seconds with NULL as NaT (the minimum int64) so it views as datetime64.
+# Text codes are int16, which leaves room for 32,767 distinct labels; status
+# and payment_mode are free text, so a few hundred would overflow int8.
+COLUMNS = {
+    "order_id": (np.int64, "order_id"),
+    "customer_id": (np.int64, "COALESCE(customer_id, -1)"),
+    "restaurant_id": (np.int32, "restaurant_id"),
+    "status": (np.int16, "status"),
+    "payment_mode": (np.int16, "payment_mode"),
+    "order_date": (np.int64, "CAST(strftime('%s', order_date) AS INTEGER)"),
+    "total_amount": (np.float32, "total_amount"),
+    "discount_applied": (np.float32, "discount_applied"),
+    "feedback_rating": (np.float32, "feedback_rating"),
+}
+ENCODED_COLUMNS = ["restaurant_id", "status", "payment_mode"]
+NAT = np.iinfo(np.int64).min
+
+# Updates and deletes cannot be seen from the order_id watermark, so triggers
+# bump this counter and a changed counter makes the next refresh start over
+CREATE_VERSION_TABLE = "CREATE TABLE IF NOT EXISTS order_snapshot_version (version INTEGER NOT NULL);"
+
+
+# Version triggers on an orders table (orders itself, or each of its partitions)
+def version_triggers(table="orders"):
+    prefix = table.lower()
+    return {
+        f"{prefix}_snapshot_{event.lower()}": f"CREATE TRIGGER IF NOT EXISTS {prefix}_snapshot_{event.lower()} "
+                                              f"AFTER {event} ON {table} "
+                                              f"BEGIN UPDATE order_snapshot_version SET version = version + 1; END;"
+        for event in ("UPDATE", "DELETE")
+    }
+
+
+def install_snapshot_triggers(conn):
+    conn.execute(CREATE_VERSION_TABLE)
+    if conn.execute("SELECT COUNT(*) FROM order_snapshot_version").fetchone()[0] == 0:
+        conn.execute("INSERT INTO order_snapshot_version (version) VALUES (0)")
+    for table in order_tables(conn):
+        for statement in version_triggers(table).values():
+            conn.execute(statement)
+    conn.commit()
+
+
+# Force snapshots to rebuild, e.g. after orders were moved between tables
+def bump_orders_version(conn):
+    conn.execute("UPDATE order_snapshot_version SET version = version + 1")
+    conn.commit()
+
+
+def orders_version(conn):
+    try:
+        row = conn.execute("SELECT version FROM order_snapshot_version").fetchone()
+    except sqlite3.OperationalError:
+        return None  # triggers not installed: every refresh rebuilds
+    return row[0] if row else None
+
+
+class OrderSnapshot:
+    """
+    Memory-mapped, columnar copy of orders kept in one file per column under
+    path. refresh() appends orders past the order_id watermark, and rebuilds
+    from scratch when orders were updated or deleted since the last refresh.
+    Files are appended before meta.json is replaced, so a crash mid-refresh
+    only leaves a tail that the next refresh truncates.
+    """
+
+    def __init__(self, path=DEFAULT_SNAPSHOT_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stale_generation = None
+        self.meta = self._read_meta()
+        self.columns = self._map_columns()
+
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self.path, "meta.json")) as handle:
+                meta = json.load(handle)
+            if meta["dtypes"] == self._empty_meta(None)["dtypes"]:
+                return meta
+            # Files written with other dtypes (e.g. int8 codes) are rebuilt as the
+            # next generation, and theirs removed once it is written
+            return self._empty_meta(None, meta["generation"])
+        except (OSError, ValueError, KeyError):
+            pass
+        return self._empty_meta(None)
+
+    @staticmethod
+    def _empty_meta(version, generation=0):
+        return {
+            "generation": generation,
+            "rows": 0,
+            "watermark": 0,
+            "version": version,
+            "dictionaries": {name: [] for name in ENCODED_COLUMNS},
+            "dtypes": {name: np.dtype(dtype).str for name, (dtype, _) in COLUMNS.items()},
+            "refreshed_at": None,
+        }
+
+    def _column_file(self, name, generation=None):
+        generation = self.meta.get("generation", 0) if generation is None else generation
+        return os.path.join(self.path, f"{name}.{generation}.bin")
+
+    def _map_columns(self):
+        rows = self.meta["rows"]
+        columns = {}
+        for name, (dtype, _) in COLUMNS.items():
+            if rows:
+                columns[name] = np.memmap(self._column_file(name), dtype=dtype, mode="r", shape=(rows,))
+            else:
+                columns[name] = np.empty(0, dtype=dtype)
+        return columns
+
+    def _write_meta(self):
+        target = os.path.join(self.path, "meta.json")
+        with open(target + ".tmp", "w") as handle:
+            json.dump(self.meta, handle)
+        os.replace(target + ".tmp", target)
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def labels(self, name):
+        return self.meta["dictionaries"][name]
+
+    def code_for(self, name, label):
+        labels = self.labels(name)
+        return labels.index(label) if label in labels else -1
+
+    def _encode(self, name, values):
+        labels = self.meta["dictionaries"][name]
+        lookup = {label: code for code, label in enumerate(labels)}
+        dtype = COLUMNS[name][0]
+        codes = np.empty(len(values), dtype=dtype)
+        for i, value in enumerate(values):
+            code = lookup.get(value)
+            if code is None:
+                if len(labels) > np.iinfo(dtype).max:
+                    raise ValueError(f"The orders snapshot holds at most {np.iinfo(dtype).max + 1:,} distinct "
+                                     f"{name} values.")
+                code = lookup[value] = len(labels)
+                labels.append(value)
+            codes[i] = code
+        return codes
+
+    def _convert(self, name, values):
+        dtype = COLUMNS[name][0]
+        if name in ENCODED_COLUMNS:
+            return self._encode(name, values)
+        if name == "order_date":
+            return np.array([NAT if value is None else value for value in values], dtype=dtype)
+        return np.array(values, dtype=dtype)  # None becomes NaN for the float columns
+
+    def refresh(self, conn, batch_size=REFRESH_BATCH_SIZE):
+        """
+        Bring the snapshot up to date with orders. Returns the number of rows appended.
+        """
+        with self._lock:
+            version = orders_version(conn)
+            os.makedirs(self.path, exist_ok=True)
+            if version is None or version != self.meta["version"]:
+                # A rebuild writes a new generation of files, because truncating
+                # files that readers still have mapped would crash them
+                stale = self.meta.get("generation", 0)
+                self.meta = self._empty_meta(version, stale + 1)
+                self._stale_generation = stale
+            rows = self.meta["rows"]
+            handles = {}
+            for name, (dtype, _) in COLUMNS.items():
+                handle = open(self._column_file(name), "r+b" if os.path.exists(self._column_file(name)) else "w+b")
+                handle.truncate(rows * np.dtype(dtype).itemsize)
+                handle.seek(0, os.SEEK_END)
+                handles[name] = handle
+
+            select = ", ".join(expression for _, expression in COLUMNS.values())
+            cursor = conn.execute(f"SELECT {select} FROM orders WHERE order_id > ? ORDER BY order_id",
+                                  (self.meta["watermark"],))
+            appended = 0
+            try:
+                while True:
+                    batch = cursor.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    for name, values in zip(COLUMNS, zip(*batch)):
+                        handles[name].write(self._convert(name, values).tobytes())
+                    appended += len(batch)
+                    self.meta["watermark"] = batch[-1][0]
+            finally:
+                for handle in handles.values():
+                    handle.close()
+
+            if appended or self.meta["refreshed_at"] is None:
+                self.meta["rows"] = rows + appended
+                self.meta["refreshed_at"] = time.time()
+                self._write_meta()
+                self.columns = self._map_columns()
+            self._remove_generation(self._stale_generation)
+            self._stale_generation = None
+            return appended
+
+    def _remove_generation(self, generation):
+        if generation is None:
+            return
+        for name in COLUMNS:
+            try:
+                os.remove(self._column_file(name, generation))
+            except OSError:
+                pass  # never written, or still mapped on a platform that forbids removing it
+
+
+# Epoch seconds of a SQLite date expression such as DATE('now', '-1 year'),
+# so the snapshot uses exactly the cutoff the SQL query would
+def sqlite_epoch(conn, expression, params=()):
+    return conn.execute(f"SELECT CAST(strftime('%s', {expression}) AS INTEGER)", params).fetchone()[0]
+
+
+def decoded_keys(snapshot, name, counts):
+    """
+    (label, code) for every code with a non-zero count, ordered like SQL's
+    GROUP BY on the label: NULL first, then ascending.
+    """
+    labels = snapshot.labels(name)
+    present = [(labels[code], code) for code in np.flatnonzero(counts)]
+    return sorted(present, key=lambda item: (item[0] is not None, item[0] if item[0] is not None else 0))
+
+
+def group_by_restaurant(snapshot, weights=None, mask=None):
+    codes = snapshot["restaurant_id"]
+    if mask is not None:
+        codes = codes[mask]
+        weights = weights[mask] if weights is not None else None
+    groups = len(snapshot.labels("restaurant_id"))
+    counts = np.bincount(codes, minlength=groups)
+    if weights is None:
+        return counts, counts
+    present = ~np.isnan(weights)
+    sums = np.bincount(codes[present], weights=weights[present].astype(np.float64), minlength=groups)
+    valued = np.bincount(codes[present], minlength=groups)
+    return counts, np.where(valued > 0, sums, np.nan)
+
+
+def bucket_totals(snapshot, unit, weights=None, mask=None):
+    """
+    Count (or sum of weights) per 'YYYY-MM' (unit "M") or 'YYYY-MM-DD' (unit "D")
+    bucket, newest first with NULL dates last, matching ORDER BY bucket DESC in
+    SQLite. Buckets are offsets from the earliest one, so a bincount replaces sorting.
+    """
+    dates = snapshot["order_date"] if mask is None else snapshot["order_date"][mask]
+    if weights is not None:
+        weights = (weights if mask is None else weights[mask]).astype(np.float64)
+    buckets = dates.view("datetime64[s]").astype(f"datetime64[{unit}]").astype(np.int64)
+    dated = buckets != NAT
+
+    # SUM over a bucket whose amounts are all NULL is NULL, so count the valued rows too
+    def total(selected, offsets=None, size=None):
+        if weights is None:
+            return np.bincount(offsets, minlength=size) if offsets is not None else np.count_nonzero(selected)
+        values = weights[selected]
+        valued = ~np.isnan(values)
+        if offsets is None:
+            return values[valued].sum() if valued.any() else np.nan
+        sums = np.bincount(offsets, weights=np.where(valued, values, 0.0), minlength=size)
+        return np.where(np.bincount(offsets, weights=valued, minlength=size) > 0, sums, np.nan)
+
+    result = []
+    if dated.any():
+        first = buckets[dated].min()
+        offsets = buckets[dated] - first
+        counts = np.bincount(offsets)
+        totals = total(dated, offsets, len(counts))
+        for offset in np.flatnonzero(counts)[::-1]:
+            label = np.datetime_as_string(np.datetime64(int(first + offset), unit), unit=unit)
+            result.append((str(label), totals[offset]))
+    if not dated.all():
+        result.append((None, total(~dated)))
+    return result
+
+
+def as_number(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return round(float(value), 2)
+
+
+def nan_mean(values):
+    values = values[~np.isnan(values)]
+    return as_number(values.astype(np.float64).mean()) if len(values) else None
+
+
+def snapshot_average_order_value(snapshot, conn):
+    return ["AVG(total_amount)"], [(nan_mean(snapshot["total_amount"]),)]
+
+
+def snapshot_orders_per_restaurant(snapshot, conn):
+    counts, _ = group_by_restaurant(snapshot)
+    return ["restaurant_id", "total_orders"], [(label, int(counts[code])) for label, code in decoded_keys(snapshot, "restaurant_id", counts)]
+
+
+def snapshot_revenue_per_restaurant(snapshot, conn):
+    counts, sums = group_by_restaurant(snapshot, snapshot["total_amount"])
+    return ["restaurant_id", "total_revenue"], [(label, as_number(sums[code])) for label, code in decoded_keys(snapshot, "restaurant_id", counts)]
+
+
+def snapshot_orders_per_month_last_year(snapshot, conn, months):
+    mask = snapshot["order_date"] >= sqlite_epoch(conn, SINCE_MONTHS, {"months": months})
+    return ["month", "total_orders"], [(label, int(total)) for label, total in bucket_totals(snapshot, "M", mask=mask)]
+
+
+def snapshot_most_popular_restaurant(snapshot, conn):
+    counts, _ = group_by_restaurant(snapshot)
+    rows = [(label, int(counts[code])) for label, code in decoded_keys(snapshot, "restaurant_id", counts)]
+    # Python's sort is stable, so ties keep SQLite's restaurant_id order
+    return ["restaurant_id", "total_orders"], sorted(rows, key=lambda row: -row[1])[:1]
+
+
+def snapshot_cancelled_per_restaurant(snapshot, conn):
+    mask = snapshot["status"] == snapshot.code_for("status", "Cancelled")
+    counts, _ = group_by_restaurant(snapshot, mask=mask)
+    return ["restaurant_id", "canceled_orders"], [(label, int(counts[code])) for label, code in decoded_keys(snapshot, "restaurant_id", counts)]
+
+
+def snapshot_revenue_per_month(snapshot, conn):
+    return ["month", "total_revenue"], [(label, as_number(total)) for label, total in bucket_totals(snapshot, "M", snapshot["total_amount"])]
+
+
+def snapshot_average_discount(snapshot, conn):
+    return ["AVG(discount_applied)"], [(nan_mean(snapshot["discount_applied"]),)]
+
+
+def snapshot_cancelled_orders(snapshot, conn):
+    return ["COUNT(*)"], [(int(np.count_nonzero(snapshot["status"] == snapshot.code_for("status", "Cancelled"))),)]
+
+
+def snapshot_orders_per_day(snapshot, conn):
+    return ["order_day", "total_orders"], [(label, int(total)) for label, total in bucket_totals(snapshot, "D")]
+
+
+def snapshot_revenue_last_30_days(snapshot, conn, days):
+    amounts = snapshot["total_amount"][snapshot["order_date"] >= sqlite_epoch(conn, SINCE_DAYS, {"days": days})]
+    amounts = amounts[~np.isnan(amounts)]
+    return ["SUM(total_amount)"], [(as_number(amounts.astype(np.float64).sum()) if len(amounts) else None,)]
+
+
+# Query Section queries answered from the snapshot, by label. Each takes the
+# query's bound arguments as keywords and returns the same (columns, rows) as
+# running the SQL through DatabaseManager.fetch_query; amounts are float32 in
+# the snapshot, so sums are rounded to cents, and an order_date SQLite cannot
+# parse counts as NULL rather than as a text value.
+SNAPSHOT_QUERIES = {
+    "3. Get the average order value for all customers": snapshot_average_order_value,
+    "4. Get the total number of orders for each restaurant": snapshot_orders_per_restaurant,
+    "5. Get the total revenue for each restaurant": snapshot_revenue_per_restaurant,
+    "6. Get the number of orders placed each month in the last year": snapshot_orders_per_month_last_year,
+    "7. Get the most popular restaurant by total orders": snapshot_most_popular_restaurant,
+    "8. Get the total number of canceled orders per restaurant": snapshot_cancelled_per_restaurant,
+    "9. Get the total revenue generated for each month": snapshot_revenue_per_month,
+    "11. Get the average discount applied for all orders": snapshot_average_discount,
+    "13. Get the total number of canceled orders": snapshot_cancelled_orders,
+    "19. Get the total number of orders placed per day": snapshot_orders_per_day,
+    "20. Get the total revenue for the last 30 days": snapshot_revenue_last_30_days,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or refresh the columnar orders snapshot.")
+    parser.add_argument("--db", default="food_delivery.db", help="SQLite database file")
+    parser.add_argument("--path", default=DEFAULT_SNAPSHOT_DIR, help="snapshot directory")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    snapshot = OrderSnapshot(args.path)
+    started = time.perf_counter()
+    appended = snapshot.refresh(conn)
+    conn.close()
+    size = sum(column.nbytes for column in snapshot.columns.values())
+    print(f"Appended {appended} orders in {time.perf_counter() - started:.2f}s; "
+          f"snapshot holds {len(snapshot)} orders in {size / 2 ** 20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+DEFAULT_PAGE_SIZE = 50
+PAGE_SIZES = [25, 50, 100, 500]
+
+
+# Name of the column that identifies a row, falling back to the implicit rowid.
+# Views have neither, so they use their first column (order_id for the partitioned orders view).
+def primary_key(conn, table):
+    columns = list(conn.execute(f"PRAGMA table_info({table})"))
+    key_columns = [row for row in columns if row[5]]
+    if len(key_columns) == 1:
+        return key_columns[0][1]
+    kind = conn.execute("SELECT type FROM sqlite_master WHERE name = ? COLLATE NOCASE", (table,)).fetchone()
+    if kind and kind[0] == "view" and columns:
+        return columns[0][1]
+    return "rowid"
+
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def estimate_row_count(conn, table):
+    """
+    Cheap row count: the ANALYZE statistics when present, otherwise the span of
+    the primary key read from both ends of its B-tree. Exact only for tables
+    without deleted rows, which is good enough to size a pager.
+    """
+    try:
+        row = conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? COLLATE NOCASE LIMIT 1", (table,)).fetchone()
+        if row and row[0]:
+            return int(row[0].split()[0])
+    except Exception:
+        pass  # sqlite_stat1 only exists once ANALYZE has run
+    key = primary_key(conn, table)
+    low = conn.execute(f"SELECT {key} FROM {table} ORDER BY {key} ASC LIMIT 1").fetchone()
+    high = conn.execute(f"SELECT {key} FROM {table} ORDER BY {key} DESC LIMIT 1").fetchone()
+    if low is None:
+        return 0
+    if isinstance(low[0], int) and isinstance(high[0], int):
+        return high[0] - low[0] + 1
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+# WHERE clause and parameters that seek past the last row of the previous page.
+# Row-value comparisons let SQLite seek straight into an index on
+# (sort_column, key). SQLite sorts NULLs first ascending and last descending,
+# so NULL sort values need their own branch of the comparison.
+def seek_condition(key, sort_column, after, descending):
+    if after is None:
+        return "", ()
+    if sort_column == key:
+        return f"WHERE {key} {'<' if descending else '>'} ?", (after[1],)
+    value, last_key = after
+    if descending:
+        if value is None:
+            return f"WHERE {sort_column} IS NULL AND {key} < ?", (last_key,)
+        return f"WHERE ({sort_column}, {key}) < (?, ?) OR {sort_column} IS NULL", (value, last_key)
+    if value is None:
+        return f"WHERE ({sort_column} IS NULL AND {key} > ?) OR {sort_column} IS NOT NULL", (last_key,)
+    return f"WHERE ({sort_column}, {key}) > (?, ?)", (value, last_key)
+
+
+def page_query(conn, table, page_size=DEFAULT_PAGE_SIZE, sort_column=None, after=None, descending=False,
+               key=None, columns=None):
+    """
+    Build the keyset query for one page of a table, ordered by sort_column and
+    then the primary key. after is the (sort value, key) pair of the last row
+    on the previous page, or None for the first page. The table's key and
+    columns are looked up unless passed in, e.g. from the schema catalog.
+    """
+    key = key or primary_key(conn, table)
+    columns = columns if columns is not None else table_columns(conn, table)
+    sort_column = sort_column or key
+    if sort_column != key and sort_column not in columns:
+        raise ValueError(f"Unknown column '{sort_column}' in table '{table}'")
+    where, params = seek_condition(key, sort_column, after, descending)
+    direction = "DESC" if descending else "ASC"
+    order_by = f"{key} {direction}" if sort_column == key else f"{sort_column} {direction}, {key} {direction}"
+    # The sort value and key are selected again at the end so the next cursor
+    # can be read back even when the table has no visible primary key column
+    query = (
+        f"SELECT *, {sort_column} AS _sort_value, {key} AS _row_key FROM {table} "
+        f"{where} ORDER BY {order_by} LIMIT ?"
+    )
+    return query, params + (page_size,)
+
+
+# Split a fetched page into (columns, rows, cursor for the next page)
+def split_page(columns, rows, page_size):
+    next_after = (rows[-1][-2], rows[-1][-1]) if len(rows) == page_size else None
+    return columns[:-2], [row[:-2] for row in rows], next_after
@@ -0,0 +1,461 @@
+import argparse
+import os
+import re
+import sqlite3
+from datetime import date
+from queries import SINCE_DAYS, SINCE_MONTHS
+from query_cache import register_derived_tables
+
+# Optional monthly partitioning of orders. When enabled, orders becomes a
+# UNION ALL view over one table per month (orders_YYYY_MM) plus orders_default
+# for NULL or out-of-range dates. INSTEAD OF triggers route writes on the view
+# to the right partition, so callers keep reading and writing "orders".
+# order_keys hands out order ids across partitions and is what deliveries
+# reference, since a foreign key cannot point at a view.
+PARTITION_GLOB = "orders_[0-9][0-9][0-9][0-9]_[0-9][0-9]"
+DEFAULT_PARTITION = "orders_default"
+DEFAULT_ARCHIVE_DIR = "archive"
+
+# Months created past the current one, so new orders land in a month partition
+MONTHS_AHEAD = 1
+
+CREATE_ORDER_KEYS_TABLE = "CREATE TABLE IF NOT EXISTS order_keys (order_id INTEGER PRIMARY KEY AUTOINCREMENT);"
+
+TABLE_NAME_PATTERN = re.compile(r"^(CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?)[\"`\[]?\w+[\"`\]]?", re.IGNORECASE)
+INDEX_PATTERN = re.compile(
+    r"^CREATE\s+(UNIQUE\s+)?INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?[\"`\[]?(\w+)[\"`\]]?\s+ON\s+[\"`\[]?\w+[\"`\]]?",
+    re.IGNORECASE,
+)
+ORDERS_REFERENCE_PATTERN = re.compile(r"REFERENCES\s+[\"`\[]?orders[\"`\]]?", re.IGNORECASE)
+INSERT_ORDERS_PATTERN = re.compile(r"^\s*INSERT\s+(?:OR\s+\w+\s+)?INTO\s+[\"`\[]?orders[\"`\]]?[\s(]", re.IGNORECASE)
+
+
+def object_type(conn, name):
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = ? COLLATE NOCASE", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def is_partitioned(conn):
+    return object_type(conn, "orders") == "view"
+
+
+def inserted_row_id(conn, query, cursor):
+    """
+    The rowid of the row query inserted through cursor, i.e. cursor.lastrowid.
+    An insert into partitioned orders runs the view's INSTEAD OF trigger, after
+    which SQLite restores last_insert_rowid() to its value before the
+    statement, so the new order's id is read back from order_keys in the same
+    transaction instead. That is the highest key, which is the new order's as
+    long as the insert did not pick an explicit, lower order_id.
+    """
+    if INSERT_ORDERS_PATTERN.match(query) and is_partitioned(conn):
+        return conn.execute("SELECT MAX(order_id) FROM order_keys").fetchone()[0]
+    return cursor.lastrowid
+
+
+def partition_name(month):
+    return f"orders_{month.replace('-', '_')}"
+
+
+def next_month(month):
+    year, number = map(int, month.split("-"))
+    return f"{year + 1:04d}-01" if number == 12 else f"{year:04d}-{number + 1:02d}"
+
+
+def month_bounds(month):
+    return f"{month}-01", f"{next_month(month)}-01"
+
+
+# (month, table) for every month partition, oldest first
+def month_partitions(conn):
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? ORDER BY name",
+                        (PARTITION_GLOB,)).fetchall()
+    return [(f"{name[7:11]}-{name[12:14]}", name) for (name,) in rows]
+
+
+def partition_tables(conn):
+    return [table for _, table in month_partitions(conn)] + [DEFAULT_PARTITION]
+
+
+def order_tables(conn):
+    """
+    Tables that hold order rows: the partitions when orders is partitioned,
+    otherwise orders itself. Row-level triggers on orders go on each of these.
+    """
+    if not is_partitioned(conn):
+        row = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'orders' COLLATE NOCASE").fetchone()
+        return [row[0]] if row else []
+    return partition_tables(conn)
+
+
+def covering_partitions(conn, start=None, end=None):
+    """
+    Partitions that can hold orders dated in [start, end): the overlapping month
+    partitions plus orders_default, which holds whatever falls outside them.
+    """
+    tables = []
+    for month, table in month_partitions(conn):
+        low, high = month_bounds(month)
+        if (start is None or high > start) and (end is None or low < end):
+            tables.append(table)
+    return tables + [DEFAULT_PARTITION]
+
+
+def table_sql(conn, table):
+    return conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ? COLLATE NOCASE", (table,)).fetchone()[0]
+
+
+def index_sql(conn, table):
+    return [sql for (sql,) in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? COLLATE NOCASE AND sql IS NOT NULL", (table,))]
+
+
+def column_names(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+# Copy a table definition and its indexes under a new name
+def clone_table(conn, template, table):
+    conn.execute(TABLE_NAME_PATTERN.sub(lambda m: f"{m.group(1)}{table}", table_sql(conn, template), count=1))
+    for sql in index_sql(conn, template):
+        def rename(match):
+            suffix = re.sub(rf"^idx_{re.escape(template)}_?", "", match.group(2), flags=re.IGNORECASE)
+            return f"CREATE {match.group(1) or ''}INDEX IF NOT EXISTS idx_{table}_{suffix} ON {table}"
+        conn.execute(INDEX_PATTERN.sub(rename, sql, count=1))
+
+
+# Drop the row triggers (rollups, snapshot version, change log) of a table; install_order_triggers recreates them
+def drop_row_triggers(conn, table):
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ? COLLATE NOCASE",
+                                (table,)).fetchall():
+        conn.execute(f"DROP TRIGGER {name}")
+
+
+def route_condition(row, month):
+    low, high = month_bounds(month)
+    return f"{row}.order_date >= '{low}' AND {row}.order_date < '{high}'"
+
+
+# Orders outside every month partition go to orders_default. Archived months
+# leave gaps, so the month partitions are matched as runs of consecutive months.
+def default_condition(row, months):
+    runs = []
+    for month in months:
+        if runs and next_month(runs[-1][1]) == month:
+            runs[-1][1] = month
+        else:
+            runs.append([month, month])
+    if not runs:
+        return "1"
+    covered = " OR ".join(f"({row}.order_date >= '{month_bounds(first)[0]}' AND {row}.order_date < '{month_bounds(last)[1]}')"
+                          for first, last in runs)
+    return f"({row}.order_date IS NULL OR NOT ({covered}))"
+
+
+def routing_statements(conn, row, action):
+    """
+    One statement per partition, each guarded by the partition's date range on
+    row (NEW or OLD). The guards only read the trigger row, so SQLite skips the
+    statements of the other partitions without touching their tables.
+    """
+    partitions = month_partitions(conn)
+    months = [month for month, _ in partitions]
+    targets = [(table, route_condition(row, month)) for month, table in partitions]
+    targets.append((DEFAULT_PARTITION, default_condition(row, months)))
+    columns = column_names(conn, DEFAULT_PARTITION)
+    values = ", ".join("COALESCE(NEW.order_id, last_insert_rowid())" if column == "order_id" else f"NEW.{column}"
+                       for column in columns)
+    statements = []
+    for table, condition in targets:
+        if action == "insert":
+            statements.append(f"INSERT INTO {table} ({', '.join(columns)}) SELECT {values} WHERE {condition};")
+        else:
+            statements.append(f"DELETE FROM {table} WHERE order_id = OLD.order_id AND {condition};")
+    return statements
+
+
+def create_orders_view(conn):
+    """
+    (Re)create the orders view and its INSTEAD OF triggers over the current partitions.
+    """
+    tables = partition_tables(conn)
+    conn.execute("DROP VIEW IF EXISTS orders")
+    conn.execute("CREATE VIEW orders AS " + " UNION ALL ".join(f"SELECT * FROM {table}" for table in tables))
+    body = "\n    ".join
+    insert = ["INSERT INTO order_keys (order_id) VALUES (NEW.order_id);"] + routing_statements(conn, "NEW", "insert")
+    delete = routing_statements(conn, "OLD", "delete") + ["DELETE FROM order_keys WHERE order_id = OLD.order_id;"]
+    # An update moves the row, since a new order_date may belong to another month
+    update = (routing_statements(conn, "OLD", "delete")
+              + ["UPDATE order_keys SET order_id = NEW.order_id WHERE order_id = OLD.order_id AND NEW.order_id IS NOT OLD.order_id;"]
+              + routing_statements(conn, "NEW", "insert"))
+    # Changes are logged here rather than on the partitions, so moving rows
+    # between partitions is not a change. After the routing insert,
+    # last_insert_rowid() is the new order's id.
+    from change_log import DELETE, INSERT, UPDATE, change_log_installed, change_statements
+    if change_log_installed(conn):
+        columns = column_names(conn, DEFAULT_PARTITION)
+        insert += change_statements("orders", columns, INSERT, "COALESCE(NEW.order_id, last_insert_rowid())")
+        delete += change_statements("orders", columns, DELETE)
+        update += change_statements("orders", columns, UPDATE)
+    conn.execute(f"CREATE TRIGGER orders_partition_insert INSTEAD OF INSERT ON orders BEGIN\n    {body(insert)}\nEND;")
+    conn.execute(f"CREATE TRIGGER orders_partition_delete INSTEAD OF DELETE ON orders BEGIN\n    {body(delete)}\nEND;")
+    conn.execute(f"CREATE TRIGGER orders_partition_update INSTEAD OF UPDATE ON orders BEGIN\n    {body(update)}\nEND;")
+
+
+def install_order_triggers(conn):
+    # Imported here because rollups, order_snapshot and change_log import from this module
+    from change_log import install_change_log
+    from order_snapshot import bump_orders_version, install_snapshot_triggers
+    from rollups import install_rollups
+    install_rollups(conn)
+    install_snapshot_triggers(conn)
+    install_change_log(conn)
+    bump_orders_version(conn)
+
+
+def months_to_cover(first, last):
+    months = [first]
+    while months[-1] < last:
+        months.append(next_month(months[-1]))
+    return months
+
+
+def current_month():
+    return date.today().strftime("%Y-%m")
+
+
+def add_partitions(conn, months, source=DEFAULT_PARTITION):
+    """
+    Create partitions for months (filling any gap so the month partitions stay
+    contiguous) and fill each one with its rows from source. Rows are moved out
+    of orders_default, and copied from any other source. Returns the tables created.
+    """
+    existing = [month for month, _ in month_partitions(conn)]
+    wanted = sorted(set(months) | set(existing))
+    if not wanted:
+        return []
+    created = []
+    columns = ", ".join(column_names(conn, DEFAULT_PARTITION))
+    for month in months_to_cover(wanted[0], wanted[-1]):
+        if month in existing:
+            continue
+        table = partition_name(month)
+        clone_table(conn, DEFAULT_PARTITION, table)
+        low, high = month_bounds(month)
+        conn.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {source} "
+                     f"WHERE order_date >= ? AND order_date < ?", (low, high))
+        if source == DEFAULT_PARTITION:
+            conn.execute(f"DELETE FROM {DEFAULT_PARTITION} WHERE order_date >= ? AND order_date < ?", (low, high))
+        created.append(table)
+    return created
+
+
+def ensure_partitions(conn, months_ahead=MONTHS_AHEAD):
+    """
+    Make sure month partitions exist through months_ahead months from now, and
+    for any month that has collected orders in orders_default.
+    """
+    if not is_partitioned(conn):
+        return []
+    months = [current_month()]
+    for _ in range(months_ahead):
+        months.append(next_month(months[-1]))
+    months += [month for (month,) in conn.execute(
+        f"SELECT DISTINCT strftime('%Y-%m', order_date) FROM {DEFAULT_PARTITION} WHERE strftime('%Y-%m', order_date) IS NOT NULL")]
+    existing = {month for month, _ in month_partitions(conn)}
+    if set(months) <= existing:
+        return []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Rows moved out of orders_default must not count as deleted orders
+        drop_row_triggers(conn, DEFAULT_PARTITION)
+        created = add_partitions(conn, months)
+        create_orders_view(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    # The new partitions need the row triggers the others have
+    install_order_triggers(conn)
+    return created
+
+
+# Query Section queries bounded below by order_date, and the SQLite expression of
+# the bound, evaluated with the query's arguments
+DATE_BOUNDED_QUERIES = {
+    "6. Get the number of orders placed each month in the last year": SINCE_MONTHS,
+    "16. Get the orders placed in the last 7 days": SINCE_DAYS,
+    "20. Get the total revenue for the last 30 days": SINCE_DAYS,
+}
+
+ORDERS_SOURCE_PATTERN = re.compile(r"\bFROM\s+orders\b", re.IGNORECASE)
+
+
+def pruned_query(conn, query, start_expression, params=()):
+    """
+    Rewrite query to read only the partitions that can hold orders dated on or
+    after start_expression. Returns (query, tables read).
+    """
+    start = conn.execute(f"SELECT {start_expression}", params).fetchone()[0]
+    tables = covering_partitions(conn, start)
+    # Writes to the orders view must also invalidate cached results of the partitions
+    register_derived_tables("orders", tables)
+    source = "(" + " UNION ALL ".join(f"SELECT * FROM {table}" for table in tables) + ")"
+    return ORDERS_SOURCE_PATTERN.sub(f"FROM {source} AS orders", query, count=1), tables
+
+
+def rebuild_deliveries(conn):
+    """
+    Point deliveries.order_id at order_keys instead of the orders table that is
+    about to become a view, using SQLite's create-copy-drop-rename rebuild.
+    """
+    sql = table_sql(conn, "deliveries")
+    if not ORDERS_REFERENCE_PATTERN.search(sql):
+        return
+    indexes = index_sql(conn, "deliveries")
+    conn.execute(TABLE_NAME_PATTERN.sub(lambda m: f"{m.group(1)}deliveries_rebuild", ORDERS_REFERENCE_PATTERN.sub(
+        "REFERENCES order_keys", sql), count=1))
+    conn.execute("INSERT INTO deliveries_rebuild SELECT * FROM deliveries")
+    conn.execute("DROP TABLE deliveries")
+    conn.execute("ALTER TABLE deliveries_rebuild RENAME TO deliveries")
+    for index in indexes:
+        conn.execute(index)
+
+
+def partition_orders(conn):
+    """
+    Convert the orders table into monthly partitions behind an orders view.
+    Runs in one transaction; returns the number of month partitions created.
+    """
+    if is_partitioned(conn):
+        return 0
+    source = order_tables(conn)[0]
+    months = [month for (month,) in conn.execute(
+        f"SELECT DISTINCT strftime('%Y-%m', order_date) FROM {source} WHERE strftime('%Y-%m', order_date) IS NOT NULL")]
+    months.append(current_month())
+
+    # Foreign key enforcement cannot change inside a transaction, and the
+    # tables are moved with their keys intact
+    foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(CREATE_ORDER_KEYS_TABLE)
+        conn.execute(f"INSERT INTO order_keys (order_id) SELECT order_id FROM {source}")
+        sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ? COLLATE NOCASE", (source,)).fetchone()
+        if sequence:
+            conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'order_keys'", (sequence[0],))
+
+        # Each month is copied with a range scan of the order_date index, and
+        # orders_default takes whatever no month partition covers
+        clone_table(conn, source, DEFAULT_PARTITION)
+        created = add_partitions(conn, months, source)
+        covered = [month for month, _ in month_partitions(conn)]
+        conn.execute(f"INSERT INTO {DEFAULT_PARTITION} SELECT * FROM {source} WHERE {default_condition(source, covered)}")
+
+        rebuild_deliveries(conn)
+        conn.execute(f"DROP TABLE {source}")
+        create_orders_view(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+    install_order_triggers(conn)
+    return len(created)
+
+
+def compact_partition(conn, month):
+    """
+    Rebuild one month partition's indexes and planner statistics. Only that
+    partition is touched, so the write lock is short and the hot month's
+    tables and indexes are left alone.
+    """
+    table = partition_name(month)
+    if object_type(conn, table) != "table":
+        raise ValueError(f"No partition for {month}.")
+    conn.execute(f"REINDEX {table}")
+    conn.execute(f"ANALYZE {table}")
+    conn.commit()
+
+
+def archive_partition(conn, month, archive_dir=DEFAULT_ARCHIVE_DIR):
+    """
+    Move a closed month partition into its own database file under archive_dir
+    and drop it from the live database. Its orders leave the orders view, but
+    the rollups keep counting them, since dropping a table fires no triggers.
+    Returns the archive file path.
+    """
+    table = partition_name(month)
+    if object_type(conn, table) != "table":
+        raise ValueError(f"No partition for {month}.")
+    if month >= current_month():
+        raise ValueError("Only months before the current one can be archived.")
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{table}.db")
+    if os.path.exists(path):
+        raise ValueError(f"{path} already exists.")
+
+    # The copied schema keeps its REFERENCES clauses, which would resolve against
+    # the archive database, so foreign keys are not enforced during the copy
+    foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(TABLE_NAME_PATTERN.sub(lambda m: f"{m.group(1)}archive.{table}", table_sql(conn, table), count=1))
+        conn.execute(f"INSERT INTO archive.{table} SELECT * FROM main.{table}")
+        copied = conn.execute(f"SELECT COUNT(*) FROM archive.{table}").fetchone()[0]
+        if copied != conn.execute(f"SELECT COUNT(*) FROM main.{table}").fetchone()[0]:
+            raise RuntimeError(f"Archive copy of {table} is incomplete.")
+        conn.execute(f"DROP TABLE main.{table}")
+        # Archived months fall outside the contiguous range, so the view routes
+        # any later writes for them to orders_default
+        create_orders_view(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        conn.execute("DETACH DATABASE archive")
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    finally:
+        conn.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+    conn.execute("DETACH DATABASE archive")
+    from order_snapshot import bump_orders_version
+    bump_orders_version(conn)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage monthly partitions of the orders table.")
+    parser.add_argument("command", choices=["enable", "maintain", "compact", "archive", "list"],
+                        help="partition orders, create upcoming partitions, compact or archive a month, or list partitions")
+    parser.add_argument("--month", help="YYYY-MM, for compact and archive")
+    parser.add_argument("--db", default="food_delivery.db", help="SQLite database file")
+    parser.add_argument("--archive-dir", default=DEFAULT_ARCHIVE_DIR, help="directory for archived partitions")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.command == "enable":
+            print(f"Created {partition_orders(conn)} month partitions.")
+        elif args.command == "maintain":
+            print(f"Created partitions: {', '.join(ensure_partitions(conn)) or 'none'}")
+        elif args.command == "compact":
+            compact_partition(conn, args.month)
+            print(f"Compacted {partition_name(args.month)}.")
+        elif args.command == "archive":
+            print(f"Archived {args.month} to {archive_partition(conn, args.month, args.archive_dir)}.")
+        else:
+            for table in order_tables(conn):
+                print(f"{table}: {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]} orders")
+    except (ValueError, RuntimeError, sqlite3.Error) as e:
+        print(f"Error: {e}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
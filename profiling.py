@@ -0,0 +1,276 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+DEFAULT_SLOW_THRESHOLD = 0.5  # seconds
+SLOW_QUERY_LOG = "slow_queries.log"
+
+# Latest samples kept per statement fingerprint and per page for the percentiles
+SAMPLES_PER_KEY = 1000
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+VALUE_LIST = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+
+slow_query_logger = logging.getLogger("zomato.slow_queries")
+
+
+def configure_slow_query_log(path=SLOW_QUERY_LOG):
+    if not slow_query_logger.handlers:
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_query_logger.addHandler(handler)
+        slow_query_logger.setLevel(logging.INFO)
+        slow_query_logger.propagate = False
+
+
+# Statement text with literals replaced by ?, so executions differing only in values group together
+def fingerprint(query):
+    normalized = STRING_LITERAL.sub("?", query)
+    normalized = NUMBER_LITERAL.sub("?", normalized)
+    normalized = " ".join(normalized.split())
+    return VALUE_LIST.sub("(...)", normalized)
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class StatementStats:
+    def __init__(self):
+        self.durations = deque(maxlen=SAMPLES_PER_KEY)
+        self.count = 0
+        self.rows = 0
+        self.errors = 0
+        self.plan = ""
+        self.pages = set()
+
+
+class QueryProfiler:
+    """
+    Collects wall time, rows returned and the query plan of every statement run
+    on a ProfiledConnection, grouped by statement fingerprint and by the page
+    being rendered. Statements slower than slow_threshold go to the slow-query log.
+    """
+
+    def __init__(self, slow_threshold=DEFAULT_SLOW_THRESHOLD, slow_log_path=SLOW_QUERY_LOG):
+        self.slow_threshold = slow_threshold
+        self.statements = defaultdict(StatementStats)
+        self.page_durations = defaultdict(lambda: deque(maxlen=SAMPLES_PER_KEY))
+        self.slow_queries = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if slow_log_path:
+            configure_slow_query_log(slow_log_path)
+
+    @property
+    def current_page(self):
+        return getattr(self._local, "page", None)
+
+    @contextmanager
+    def track_page(self, page):
+        """
+        Tag statements run inside the block with page and time the whole block.
+        """
+        previous = self.current_page
+        self._local.page = page
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._local.page = previous
+            with self._lock:
+                self.page_durations[page].append(elapsed)
+
+    def needs_plan(self, key):
+        with self._lock:
+            stats = self.statements.get(key)
+            return stats is None or not stats.plan
+
+    def record(self, query, elapsed, rows, error=None, plan=None):
+        key = fingerprint(query)
+        page = self.current_page
+        with self._lock:
+            stats = self.statements[key]
+            stats.count += 1
+            stats.durations.append(elapsed)
+            stats.rows += max(rows, 0)
+            if error is not None:
+                stats.errors += 1
+            if plan:
+                stats.plan = plan
+            if page:
+                stats.pages.add(page)
+            plan = stats.plan
+        if elapsed >= self.slow_threshold:
+            entry = {"seconds": round(elapsed, 4), "rows": rows, "page": page or "", "statement": key, "plan": plan}
+            with self._lock:
+                self.slow_queries.append(entry)
+            slow_query_logger.info(f"{elapsed:.3f}s rows={rows} page={page or '-'} plan=[{plan}] {key}")
+
+    def statement_report(self):
+        with self._lock:
+            return [
+                {
+                    "statement": key,
+                    "calls": stats.count,
+                    "p50_ms": percentile(stats.durations, 0.50) * 1000,
+                    "p95_ms": percentile(stats.durations, 0.95) * 1000,
+                    "p99_ms": percentile(stats.durations, 0.99) * 1000,
+                    "max_ms": max(stats.durations, default=0.0) * 1000,
+                    "avg_rows": stats.rows / stats.count if stats.count else 0,
+                    "errors": stats.errors,
+                    "pages": ", ".join(sorted(stats.pages)),
+                    "plan": stats.plan,
+                }
+                for key, stats in self.statements.items()
+            ]
+
+    def page_report(self):
+        with self._lock:
+            return [
+                {
+                    "page": page,
+                    "renders": len(durations),
+                    "p50_ms": percentile(durations, 0.50) * 1000,
+                    "p95_ms": percentile(durations, 0.95) * 1000,
+                    "p99_ms": percentile(durations, 0.99) * 1000,
+                }
+                for page, durations in self.page_durations.items()
+            ]
+
+    def reset(self):
+        with self._lock:
+            self.statements.clear()
+            self.page_durations.clear()
+            self.slow_queries.clear()
+
+
+# One line summary of EXPLAIN QUERY PLAN, run on a plain cursor so it is not profiled itself
+def plan_summary(conn, query, params):
+    try:
+        rows = sqlite3.Cursor(conn).execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+        return "; ".join(row[3] for row in rows)
+    except sqlite3.Error:
+        return ""
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """
+    Cursor that times each statement from execute() until its rows have been
+    fetched, then reports it to the connection's profiler.
+    """
+
+    def _start(self, query, params):
+        self._finish()
+        self._query = query
+        self._elapsed = 0.0
+        self._rows = 0
+        profiler = self.connection.profiler
+        self._plan = None
+        if query.lstrip()[:6].upper() in ("SELECT", "WITH") and profiler.needs_plan(fingerprint(query)):
+            self._plan = plan_summary(self.connection, query, params)
+
+    def _finish(self, error=None):
+        query = getattr(self, "_query", None)
+        if query is None:
+            return
+        self._query = None
+        self.connection.profiler.record(query, self._elapsed, self._rows, error, self._plan)
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        except StopIteration:
+            raise
+        except Exception as e:
+            self._elapsed += time.perf_counter() - started
+            self._finish(e)
+            raise
+        finally:
+            if getattr(self, "_query", None) is not None:
+                self._elapsed += time.perf_counter() - started
+
+    def execute(self, query, params=()):
+        self._start(query, params)
+        self._timed(super().execute, query, params)
+        if self.description is None:
+            self._rows = self.rowcount
+            self._finish()
+        return self
+
+    def executemany(self, query, seq_of_params):
+        self._start(query, ())
+        self._timed(super().executemany, query, seq_of_params)
+        self._rows = self.rowcount
+        self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, size if size is not None else self.arraysize)
+        self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    # Statements whose rows were never read to the end are recorded when the cursor is dropped
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """
+    Connection whose cursors report to self.profiler. Pass as factory= to sqlite3.connect.
+    """
+
+    profiler = None
+
+    def cursor(self, factory=ProfiledCursor):
+        if self.profiler is None:
+            return super().cursor()
+        return super().cursor(factory)
+
+    def execute(self, query, params=()):
+        return self.cursor().execute(query, params)
+
+    def executemany(self, query, seq_of_params):
+        return self.cursor().executemany(query, seq_of_params)
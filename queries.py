@@ -1,4 +1,6 @@
 # Example SQL Queries for Data Insights
+import re
+from query_catalog import CatalogQuery, QueryCatalog, QueryParameter
 
 # Top customers by total orders
 TOP_CUSTOMERS = """
@@ -60,6 +62,141 @@ GROUP BY payment_mode
 ORDER BY avg_rating DESC;
 """
 
+# The SQL of a legacy constant with its literal LIMIT bound as :limit. The
+# constants keep LIMIT 10 so that they still run without arguments.
+def bound_limit(sql):
+    return re.sub(r"\bLIMIT 10;", "LIMIT :limit;", sql)
+
+
+# Parameters shared by several queries. Windows are counted back from today.
+def limit(default):
+    return QueryParameter("limit", default, minimum=1, maximum=1000, label="Rows")
+
+
+DAYS = QueryParameter("days", 30, minimum=1, maximum=3650, label="Days back")
+MONTHS = QueryParameter("months", 12, minimum=1, maximum=120, label="Months back")
+
+# Lower bounds of the windows in SQL, shared with the rollup variants and partition pruning
+SINCE_DAYS = "DATE('now', '-' || :days || ' days')"
+SINCE_MONTHS = "DATE('now', '-' || :months || ' months')"
+
+
+def section_query(label, sql, columns, tables, parameters=(), rollup=None):
+    return CatalogQuery(label, sql, columns, tables, parameters, section=True,
+                        variants={"rollup": rollup} if rollup else None)
+
+
+# Every query of the app: the named insight queries, then the Query Section
+# queries in menu order, named by their label. A rollup variant answers the
+# same query from the rollup tables maintained by rollups.py, reading one row
+# per (restaurant,) day or month instead of every order; the heatmap variant
+# reads the 7 x 24 platform-wide cells.
+CATALOG = QueryCatalog([
+    CatalogQuery("top_customers", bound_limit(TOP_CUSTOMERS), ["name", "total_orders", "average_rating"], ["customers"], [limit(10)]),
+    CatalogQuery("popular_restaurants", bound_limit(MOST_POPULAR_RESTAURANTS), ["name", "total_orders", "rating"], ["restaurants"],
+                 [limit(10)]),
+    CatalogQuery("avg_delivery_time", AVERAGE_DELIVERY_TIME, ["name", "avg_delivery_time"],
+                 ["restaurants", "orders", "deliveries"]),
+    CatalogQuery("peak_order_times", PEAK_ORDER_TIMES, ["hour", "order_count"], ["orders"], variants={
+        "heatmap": "SELECT CASE WHEN hour >= 0 THEN printf('%02d', hour) END AS hour, SUM(order_count) AS order_count "
+                   "FROM order_heatmap_totals GROUP BY hour ORDER BY order_count DESC",
+    }),
+    CatalogQuery("delayed_deliveries", DELAYED_DELIVERIES,
+                 ["order_id", "customer_name", "restaurant_name", "estimated_time", "delivery_time"],
+                 ["orders", "customers", "restaurants", "deliveries"]),
+    CatalogQuery("delivery_performance", bound_limit(DELIVERY_PERSONNEL_PERFORMANCE), ["name", "total_deliveries", "average_rating"],
+                 ["delivery_persons"], [limit(10)]),
+    CatalogQuery("feedback_by_payment", FEEDBACK_BY_PAYMENT_MODE, ["payment_mode", "avg_rating"], ["orders"]),
+
+    section_query("1. Get the total number of customers", "SELECT COUNT(*) FROM customers", ["COUNT(*)"], ["customers"]),
+    section_query("2. Get the details of top 5 customers by total orders",
+                  "SELECT * FROM customers ORDER BY total_orders DESC LIMIT :limit",
+                  ["customer_id", "name", "email", "phone", "location", "signup_date", "is_premium", "preferred_cuisine",
+                   "total_orders", "average_rating"], ["customers"], [limit(5)]),
+    section_query("3. Get the average order value for all customers", "SELECT AVG(total_amount) FROM orders",
+                  ["AVG(total_amount)"], ["orders"],
+                  rollup="SELECT SUM(revenue) / SUM(amount_count) AS \"AVG(total_amount)\" FROM order_daily_stats"),
+    section_query("4. Get the total number of orders for each restaurant",
+                  "SELECT restaurant_id, COUNT(*) AS total_orders FROM orders GROUP BY restaurant_id",
+                  ["restaurant_id", "total_orders"], ["orders"],
+                  rollup="SELECT NULLIF(restaurant_id, 0) AS restaurant_id, SUM(order_count) AS total_orders "
+                         "FROM restaurant_monthly_stats GROUP BY restaurant_id"),
+    section_query("5. Get the total revenue for each restaurant",
+                  "SELECT restaurant_id, SUM(total_amount) AS total_revenue FROM orders GROUP BY restaurant_id",
+                  ["restaurant_id", "total_revenue"], ["orders"],
+                  rollup="SELECT NULLIF(restaurant_id, 0) AS restaurant_id, "
+                         "CASE WHEN SUM(amount_count) > 0 THEN SUM(revenue) END AS total_revenue "
+                         "FROM restaurant_monthly_stats GROUP BY restaurant_id"),
+    section_query("6. Get the number of orders placed each month in the last year",
+                  "SELECT strftime('%Y-%m', order_date) AS month, COUNT(*) AS total_orders FROM orders "
+                  f"WHERE order_date >= {SINCE_MONTHS} GROUP BY month ORDER BY month DESC",
+                  ["month", "total_orders"], ["orders"], [MONTHS],
+                  rollup="SELECT substr(day, 1, 7) AS month, SUM(order_count) AS total_orders FROM order_daily_stats "
+                         f"WHERE day >= {SINCE_MONTHS} GROUP BY month ORDER BY month DESC"),
+    section_query("7. Get the most popular restaurant by total orders",
+                  "SELECT restaurant_id, COUNT(*) AS total_orders FROM orders GROUP BY restaurant_id "
+                  "ORDER BY total_orders DESC LIMIT 1",
+                  ["restaurant_id", "total_orders"], ["orders"],
+                  rollup="SELECT NULLIF(restaurant_id, 0) AS restaurant_id, SUM(order_count) AS total_orders "
+                         "FROM restaurant_monthly_stats GROUP BY restaurant_id ORDER BY total_orders DESC LIMIT 1"),
+    section_query("8. Get the total number of canceled orders per restaurant",
+                  "SELECT restaurant_id, COUNT(*) AS canceled_orders FROM orders WHERE status = 'Cancelled' "
+                  "GROUP BY restaurant_id",
+                  ["restaurant_id", "canceled_orders"], ["orders"],
+                  rollup="SELECT NULLIF(restaurant_id, 0) AS restaurant_id, SUM(cancelled_count) AS canceled_orders "
+                         "FROM restaurant_monthly_stats GROUP BY restaurant_id HAVING canceled_orders > 0"),
+    section_query("9. Get the total revenue generated for each month",
+                  "SELECT strftime('%Y-%m', order_date) AS month, SUM(total_amount) AS total_revenue FROM orders "
+                  "GROUP BY month ORDER BY month DESC",
+                  ["month", "total_revenue"], ["orders"],
+                  rollup="SELECT NULLIF(substr(day, 1, 7), '') AS month, "
+                         "CASE WHEN SUM(amount_count) > 0 THEN SUM(revenue) END AS total_revenue "
+                         "FROM order_daily_stats GROUP BY month ORDER BY month DESC"),
+    section_query("10. Get the top 3 restaurants by rating",
+                  "SELECT restaurant_id, AVG(rating) AS avg_rating FROM restaurants GROUP BY restaurant_id "
+                  "ORDER BY avg_rating DESC LIMIT :limit",
+                  ["restaurant_id", "avg_rating"], ["restaurants"], [limit(3)]),
+    section_query("11. Get the average discount applied for all orders", "SELECT AVG(discount_applied) FROM orders",
+                  ["AVG(discount_applied)"], ["orders"],
+                  rollup="SELECT SUM(discount_total) / SUM(discount_count) AS \"AVG(discount_applied)\" "
+                         "FROM order_daily_stats"),
+    section_query("12. Get the average order amount for premium customers",
+                  "SELECT AVG(total_amount) FROM orders "
+                  "WHERE customer_id IN (SELECT customer_id FROM customers WHERE is_premium = 1)",
+                  ["AVG(total_amount)"], ["orders", "customers"]),
+    section_query("13. Get the total number of canceled orders", "SELECT COUNT(*) FROM orders WHERE status = 'Cancelled'",
+                  ["COUNT(*)"], ["orders"],
+                  rollup="SELECT COALESCE(SUM(cancelled_count), 0) AS \"COUNT(*)\" FROM order_daily_stats"),
+    section_query("14. Get the average rating given to restaurants for each restaurant",
+                  "SELECT restaurant_id, AVG(rating) AS avg_rating FROM restaurants GROUP BY restaurant_id",
+                  ["restaurant_id", "avg_rating"], ["restaurants"]),
+    section_query("15. Get the most common cuisine types ordered by customers",
+                  "SELECT preferred_cuisine, COUNT(*) AS frequency FROM customers GROUP BY preferred_cuisine "
+                  "ORDER BY frequency DESC LIMIT :limit",
+                  ["preferred_cuisine", "frequency"], ["customers"], [limit(5)]),
+    section_query("16. Get the orders placed in the last 7 days",
+                  f"SELECT * FROM orders WHERE order_date >= {SINCE_DAYS}",
+                  ["order_id", "customer_id", "restaurant_id", "order_date", "delivery_time", "status", "total_amount",
+                   "payment_mode", "discount_applied", "feedback_rating"], ["orders"],
+                  [QueryParameter("days", 7, minimum=1, maximum=3650, label="Days back")]),
+    section_query("17. Get the average delivery fee for orders", "SELECT AVG(delivery_fee) FROM deliveries",
+                  ["AVG(delivery_fee)"], ["deliveries"]),
+    section_query("18. Get the number of active restaurants", "SELECT COUNT(*) FROM restaurants WHERE is_active = 1",
+                  ["COUNT(*)"], ["restaurants"]),
+    section_query("19. Get the total number of orders placed per day",
+                  "SELECT DATE(order_date) AS order_day, COUNT(*) AS total_orders FROM orders "
+                  "GROUP BY order_day ORDER BY order_day DESC",
+                  ["order_day", "total_orders"], ["orders"],
+                  rollup="SELECT NULLIF(day, '') AS order_day, order_count AS total_orders FROM order_daily_stats "
+                         "ORDER BY day DESC"),
+    section_query("20. Get the total revenue for the last 30 days",
+                  f"SELECT SUM(total_amount) FROM orders WHERE order_date >= {SINCE_DAYS}",
+                  ["SUM(total_amount)"], ["orders"], [DAYS],
+                  rollup="SELECT CASE WHEN SUM(amount_count) > 0 THEN SUM(revenue) END AS \"SUM(total_amount)\" "
+                         f"FROM order_daily_stats WHERE day >= {SINCE_DAYS}"),
+])
+
+
 # Function to fetch and execute specific queries
 def get_query(query_name):
     queries = {
@@ -72,3 +209,18 @@ def get_query(query_name):
         "feedback_by_payment": FEEDBACK_BY_PAYMENT_MODE,
     }
     return queries.get(query_name, "")
+
+
+# Order counts per (weekday, hour) cell for the heatmap page, overall or drilled
+# down to one restaurant or one cuisine
+HEATMAP_GRID = "SELECT weekday, hour, order_count FROM order_heatmap_totals"
+HEATMAP_GRID_BY_RESTAURANT = (
+    "SELECT weekday, hour, SUM(order_count) FROM order_heatmap WHERE restaurant_id = ? GROUP BY weekday, hour"
+)
+HEATMAP_GRID_BY_CUISINE = """
+SELECT h.weekday, h.hour, SUM(h.order_count)
+FROM order_heatmap h
+JOIN restaurants r ON r.restaurant_id = h.restaurant_id
+WHERE r.cuisine_type = ?
+GROUP BY h.weekday, h.hour
+"""
@@ -0,0 +1,155 @@
+import itertools
+import re
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL_SECONDS = 300
+
+# Results larger than this are not worth keeping in memory
+MAX_CACHED_ROWS = 100_000
+
+READ_TABLES_PATTERN = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+WRITE_TABLES_PATTERN = re.compile(
+    r"^\s*(?:INSERT\s+(?:OR\s+\w+\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM|ALTER\s+TABLE|DROP\s+TABLE(?:\s+IF\s+EXISTS)?)\s+([A-Za-z_][A-Za-z0-9_]*)",
+    re.IGNORECASE,
+)
+RENAME_PATTERN = re.compile(r"\bRENAME\s+TO\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+
+# Tables changed as a side effect (by triggers) when a source table is written
+DERIVED_TABLES = {}
+
+
+def register_derived_tables(source, tables):
+    DERIVED_TABLES.setdefault(source.lower(), set()).update(table.lower() for table in tables)
+
+
+# Tables a SELECT statement reads from, lower-cased since SQLite names are case-insensitive
+def tables_read(query):
+    return frozenset(name.lower() for name in READ_TABLES_PATTERN.findall(query))
+
+
+# Tables a write or DDL statement modifies
+def tables_written(query):
+    tables = {name.lower() for name in WRITE_TABLES_PATTERN.findall(query)}
+    tables.update(name.lower() for name in RENAME_PATTERN.findall(query))
+    for table in list(tables):
+        tables.update(DERIVED_TABLES.get(table, ()))
+    return tables
+
+
+class CacheEntry:
+    def __init__(self, value, tables, expires_at):
+        self.value = value
+        self.tables = tables
+        self.expires_at = expires_at
+
+
+class QueryCache:
+    """
+    LRU cache of query results keyed by SQL text and parameters. Entries expire
+    after a TTL and are dropped as soon as a table they depend on is written.
+
+    Every invalidation also stamps its tables with a new generation. A reader
+    takes generation(tables) before running its query and passes it to put,
+    which drops the result if any of those tables was invalidated meanwhile,
+    so a result read before a write never outlives that write's invalidate.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._stamps = itertools.count(1)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    @staticmethod
+    def make_key(query, params=()):
+        # Named parameters key by name and value, so each set of arguments is its own entry
+        if isinstance(params, dict):
+            return (" ".join(query.split()), tuple(sorted(params.items())))
+        return (" ".join(query.split()), tuple(params))
+
+    def get(self, key):
+        """
+        Return (True, value) on a hit and (False, None) on a miss or expired entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry.value
+
+    def generation(self, tables):
+        """
+        The latest invalidation of any of tables, to pass to put for a result read after this call.
+        """
+        with self._lock:
+            return self._generation(tables)
+
+    def _generation(self, tables):
+        return max((self._generations.get(table.lower(), 0) for table in tables), default=0)
+
+    def put(self, key, value, tables, ttl=None, generation=None):
+        """
+        Cache value for the given tables. With a generation from generation(),
+        the value is dropped instead if one of them has been invalidated since.
+        Returns whether the value was cached.
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if generation is not None and self._generation(tables) != generation:
+                self.stale_puts += 1
+                return False
+            self._entries[key] = CacheEntry(value, frozenset(tables), expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, tables):
+        """
+        Drop every entry that reads from any of the given tables.
+        """
+        tables = {table.lower() for table in tables}
+        if not tables:
+            return 0
+        with self._lock:
+            stamp = next(self._stamps)
+            for table in tables:
+                self._generations[table] = stamp
+            stale = [key for key, entry in self._entries.items() if entry.tables & tables]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_puts": self.stale_puts,
+            }
@@ -0,0 +1,190 @@
+import argparse
+import re
+import sqlite3
+from query_cache import tables_read
+
+# Named placeholders (:days) outside string literals, so a time format such as
+# '%H:%M' is not mistaken for one
+PLACEHOLDER_PATTERN = re.compile(r"(?<![:\w]):([A-Za-z_]\w*)")
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+
+def placeholders(sql):
+    return set(PLACEHOLDER_PATTERN.findall(STRING_LITERAL.sub("''", sql)))
+
+
+class QueryParameter:
+    """
+    A value bound into a catalog query. Its type is the type of the default,
+    and bound values are converted to it and checked against the bounds.
+    """
+
+    def __init__(self, name, default, minimum=None, maximum=None, label=None):
+        self.name = name
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self.label = label or name.replace("_", " ").capitalize()
+        self.validate(default)
+
+    @property
+    def type(self):
+        return type(self.default)
+
+    def validate(self, value):
+        try:
+            value = self.type(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Parameter '{self.name}' must be {self.type.__name__}, got {value!r}") from None
+        if self.minimum is not None and value < self.minimum:
+            raise ValueError(f"Parameter '{self.name}' must be at least {self.minimum}, got {value}")
+        if self.maximum is not None and value > self.maximum:
+            raise ValueError(f"Parameter '{self.name}' must be at most {self.maximum}, got {value}")
+        return value
+
+
+class CatalogQuery:
+    """
+    One query of the catalog: its SQL with named placeholders, the parameters
+    they take, the tables it reads and the columns it returns. Variants are the
+    same query answered from other tables (e.g. "rollup"), taking the same
+    parameters and returning the same columns. The SQL text never changes
+    between executions, so pooled connections compile it once and keep it in
+    their statement cache whatever arguments it is run with.
+    """
+
+    def __init__(self, name, sql, columns, tables, parameters=(), section=False, variants=None):
+        self.name = name
+        self.sql = sql.strip()
+        self.columns = list(columns)
+        self.tables = frozenset(table.lower() for table in tables)
+        self.parameters = {parameter.name: parameter for parameter in parameters}
+        self.section = section
+        self.variants = {
+            source: CatalogQuery(f"{source}: {name}", variant, columns, tables_read(variant), parameters)
+            for source, variant in (variants or {}).items()
+        }
+        self._check()
+
+    def _check(self):
+        used = placeholders(self.sql)
+        if used != set(self.parameters):
+            raise ValueError(f"Query '{self.name}' uses parameters {sorted(used)} but declares {sorted(self.parameters)}")
+        read = tables_read(self.sql)
+        if read != self.tables:
+            raise ValueError(f"Query '{self.name}' reads {sorted(read)} but declares {sorted(self.tables)}")
+
+    @property
+    def defaults(self):
+        return {name: parameter.default for name, parameter in self.parameters.items()}
+
+    def bind(self, arguments=None):
+        """
+        Named parameters for executing the query: the given arguments checked
+        and converted, and the defaults for the rest.
+        """
+        arguments = dict(arguments or {})
+        unknown = set(arguments) - set(self.parameters)
+        if unknown:
+            raise ValueError(f"Query '{self.name}' has no parameter {', '.join(sorted(unknown))}")
+        return {name: parameter.validate(arguments.get(name, parameter.default))
+                for name, parameter in self.parameters.items()}
+
+
+class QueryCatalog:
+    """
+    Every catalog query by name, in declaration order. Query Section queries
+    are named by their label.
+    """
+
+    def __init__(self, queries):
+        self._queries = {}
+        for query in queries:
+            if query.name in self._queries:
+                raise ValueError(f"Duplicate catalog query '{query.name}'")
+            self._queries[query.name] = query
+        self._section = [query for query in self._queries.values() if query.section]
+
+    def __iter__(self):
+        return iter(self._queries.values())
+
+    def __len__(self):
+        return len(self._queries)
+
+    def __contains__(self, name):
+        return name in self._queries
+
+    def __getitem__(self, name):
+        try:
+            return self._queries[name]
+        except KeyError:
+            raise KeyError(f"Unknown query '{name}'") from None
+
+    def section(self):
+        return self._section
+
+    def find(self, name):
+        """
+        A query by name, or a Query Section query by its number.
+        """
+        if name in self._queries:
+            return self._queries[name]
+        for query in self._section:
+            if query.name.split(".")[0] == name:
+                return query
+        raise KeyError(f"Unknown query '{name}'")
+
+    def statements(self):
+        """
+        Every query and variant, as the CatalogQuery that is executed.
+        """
+        for query in self:
+            yield query
+            yield from query.variants.values()
+
+    def validate(self, conn):
+        """
+        Compile every query and variant against the database with its default
+        arguments and compare the columns it returns with the declared ones.
+        Returns the problems found as messages. Wrapped in LIMIT 0, a query
+        returns its columns without reading any rows.
+        """
+        problems = []
+        existing = {name.lower() for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+        for query in self.statements():
+            # Variants are only used once their tables have been installed
+            if query.name not in self._queries and not query.tables <= existing:
+                continue
+            try:
+                cursor = conn.execute(f"SELECT * FROM ({query.sql.rstrip(';')}) LIMIT 0", query.defaults)
+            except sqlite3.Error as e:
+                problems.append(f"Query '{query.name}' does not compile: {e}")
+                continue
+            columns = [description[0] for description in cursor.description]
+            if columns != query.columns:
+                problems.append(f"Query '{query.name}' returns {columns} but declares {query.columns}")
+        return problems
+
+
+def main():
+    from queries import CATALOG
+
+    parser = argparse.ArgumentParser(description="List the query catalog and check it against a database.")
+    parser.add_argument("--db", default="food_delivery.db", help="SQLite database file")
+    args = parser.parse_args()
+
+    for query in CATALOG:
+        arguments = ", ".join(f"{name}={value}" for name, value in query.defaults.items())
+        variants = f" [{', '.join(query.variants)}]" if query.variants else ""
+        print(f"{query.name}({arguments}) -> {', '.join(query.columns)}{variants}")
+    conn = sqlite3.connect(args.db)
+    problems = CATALOG.validate(conn)
+    conn.close()
+    for problem in problems:
+        print(f"Error: {problem}")
+    print(f"{len(CATALOG)} queries, {len(problems)} problems.")
+
+
+if __name__ == "__main__":
+    main()
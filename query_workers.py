@@ -0,0 +1,225 @@
+import itertools
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from connection_pool import create_pooled_connection
+from query_cache import MAX_CACHED_ROWS, QueryCache, tables_read
+
+DEFAULT_WORKERS = 2
+DEFAULT_TIMEOUT_SECONDS = 120
+
+# SQLite VM instructions between progress handler calls; each call checks for
+# cancellation and the timeout
+PROGRESS_INTERVAL = 10_000
+
+# Finished jobs kept for sessions to pick up their results
+MAX_FINISHED_JOBS = 64
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed out"
+FINISHED = {DONE, FAILED, CANCELLED, TIMED_OUT}
+
+
+class QueryJob:
+    """
+    One query submitted to QueryWorkers, with its status, progress and result.
+    """
+
+    def __init__(self, job_id, key, query, params, label, timeout, expected_steps=None):
+        self.id = job_id
+        self.key = key
+        self.query = query
+        self.params = dict(params) if isinstance(params, dict) else tuple(params)
+        self.label = label
+        self.timeout = timeout
+        self.expected_steps = expected_steps
+        self.status = QUEUED
+        self.steps = 0
+        self.columns = None
+        self.rows = None
+        self.cached = False
+        # Cache generation of the tables read, taken before the query ran
+        self.tables = tables_read(query)
+        self.generation = None
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def progress(self):
+        # Fraction done, estimated from the VM steps the last run of the same
+        # query took; None when the query has not completed before
+        if self.status == DONE:
+            return 1.0
+        if not self.expected_steps:
+            return None
+        return min(self.steps / self.expected_steps, 0.99)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def wait(self, timeout=None):
+        """
+        Block until the job finishes or timeout seconds pass; True if it finished.
+        """
+        return self._done.wait(timeout)
+
+
+class QueryWorkers:
+    """
+    Background threads that run long read queries on their own read-only
+    connections, so a Streamlit rerun only polls for the result. Identical
+    queries already queued or running are shared rather than started again,
+    and finished results go into the result cache.
+    """
+
+    def __init__(self, db_file, workers=DEFAULT_WORKERS, profiler=None, cache=None):
+        self.db_file = db_file
+        self.profiler = profiler
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query-worker")
+        self._local = threading.local()
+        self._connections = []
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._steps = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        # One read-only connection per worker thread, opened on first use
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = create_pooled_connection(self.db_file, read_only=True, profiler=self.profiler)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def submit(self, query, params=(), label=None, timeout=DEFAULT_TIMEOUT_SECONDS):
+        """
+        Queue query and return its QueryJob, or the job already running it.
+        """
+        key = QueryCache.make_key(query, params)
+        page = self.profiler.current_page if self.profiler is not None else None
+        with self._lock:
+            job = self._active.get(key)
+            if job is not None and not job.cancel_requested:
+                return job
+            job = QueryJob(next(self._ids), key, query, params, label or key[0][:60], timeout, self._steps.get(key))
+            self._jobs[job.id] = job
+            self._active[key] = job
+            self._trim()
+        self._executor.submit(self._run, job, page)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+
+    def stale(self, job):
+        """
+        Whether a table job read has been invalidated since it started, so its result is out of date.
+        """
+        return (self.cache is not None and job.generation is not None
+                and self.cache.generation(job.tables) != job.generation)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _run(self, job, page):
+        if job.cancel_requested:
+            self._finish(job, CANCELLED)
+            return
+        conn = self._connection()
+        job.started_at = time.monotonic()
+        job.status = RUNNING
+
+        # Returning non-zero makes SQLite abandon the statement with "interrupted"
+        def check():
+            job.steps += PROGRESS_INTERVAL
+            if job.cancel_requested:
+                return 1
+            return 1 if job.timeout and time.monotonic() - job.started_at > job.timeout else 0
+
+        conn.set_progress_handler(check, PROGRESS_INTERVAL)
+        if self.cache is not None:
+            job.generation = self.cache.generation(job.tables)
+        try:
+            with self.profiler.track_page(page) if self.profiler is not None and page else nullcontext():
+                cursor = conn.execute(job.query, job.params)
+                rows = cursor.fetchall()
+            job.columns = [description[0] for description in cursor.description]
+            job.rows = rows
+        except sqlite3.OperationalError as e:
+            if job.cancel_requested:
+                self._finish(job, CANCELLED)
+            elif "interrupted" in str(e):
+                self._finish(job, TIMED_OUT, f"Query stopped after exceeding its {job.timeout}s timeout.")
+            else:
+                self._finish(job, FAILED, str(e))
+        except Exception as e:
+            self._finish(job, FAILED, str(e))
+        else:
+            with self._lock:
+                self._steps[job.key] = job.steps
+            if self.cache is not None and len(rows) <= MAX_CACHED_ROWS:
+                job.cached = self.cache.put(job.key, (job.columns, rows), job.tables, generation=job.generation)
+            self._finish(job, DONE)
+        finally:
+            conn.set_progress_handler(None, PROGRESS_INTERVAL)
+            if conn.in_transaction:
+                conn.rollback()
+
+    def _finish(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.monotonic()
+        with self._lock:
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+        job._done.set()
+
+    def shutdown(self):
+        for job in self.jobs():
+            job.cancel()
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
@@ -0,0 +1,347 @@
+import argparse
+import sqlite3
+import time
+from partitions import order_tables
+from query_cache import register_derived_tables
+
+# Rollup tables keyed by (entity, time bucket), or by time bucket alone for the
+# platform-wide daily totals. Orders with no date or no customer/restaurant are
+# counted under '' and 0 so the keys stay usable as upsert conflict targets;
+# queries read them back with NULLIF.
+ROLLUPS = {
+    "order_daily_stats": (None, "day", "DATE(order_date)"),
+    "restaurant_daily_stats": ("restaurant_id", "day", "DATE(order_date)"),
+    "restaurant_monthly_stats": ("restaurant_id", "month", "strftime('%Y-%m', order_date)"),
+    "customer_daily_stats": ("customer_id", "day", "DATE(order_date)"),
+    "customer_monthly_stats": ("customer_id", "month", "strftime('%Y-%m', order_date)"),
+}
+
+# Per-bucket measures and the expression each order contributes to them
+MEASURES = {
+    "order_count": "1",
+    "cancelled_count": "CASE WHEN {row}.status = 'Cancelled' THEN 1 ELSE 0 END",
+    "revenue": "COALESCE({row}.total_amount, 0)",
+    "amount_count": "CASE WHEN {row}.total_amount IS NULL THEN 0 ELSE 1 END",
+    "discount_total": "COALESCE({row}.discount_applied, 0)",
+    "discount_count": "CASE WHEN {row}.discount_applied IS NULL THEN 0 ELSE 1 END",
+}
+
+# Columns of orders whose changes move an order between buckets or change its measures
+TRACKED_COLUMNS = ["customer_id", "restaurant_id", "order_date", "status", "total_amount", "discount_applied"]
+
+# Orders per restaurant, day of week (0 = Sunday) and hour of day behind the
+# peak-time heatmaps, plus the platform-wide totals so the overall view reads
+# 7 x 24 cells. Orders with no (valid) date are counted under -1.
+HEATMAP = "order_heatmap"
+HEATMAPS = {
+    HEATMAP: "restaurant_id",
+    "order_heatmap_totals": None,
+}
+HEATMAP_BUCKETS = {
+    "weekday": "CAST(strftime('%w', order_date) AS INTEGER)",
+    "hour": "CAST(strftime('%H', order_date) AS INTEGER)",
+}
+
+
+def heatmap_columns(name):
+    key = HEATMAPS[name]
+    return ([] if key is None else [key]) + list(HEATMAP_BUCKETS)
+
+
+def create_heatmap_table(name):
+    columns = [f"{column} INTEGER NOT NULL" for column in heatmap_columns(name)]
+    columns += ["order_count INTEGER NOT NULL DEFAULT 0", f"PRIMARY KEY ({', '.join(heatmap_columns(name))})"]
+    return f"CREATE TABLE IF NOT EXISTS {name} (\n    " + ",\n    ".join(columns) + "\n) WITHOUT ROWID;"
+
+
+CREATE_ROLLUP_STATE_TABLE = """
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name TEXT PRIMARY KEY,
+    reconciled_at TEXT,
+    corrected INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# rollup_state row present while the triggers are dropped for a bulk load. If
+# the load dies before the rollups are rebuilt, the next install_rollups sees
+# it and rebuilds them instead of keeping totals that miss the loaded rows.
+DEFERRED = "deferred"
+
+# Writes to orders also change these tables through the triggers below
+register_derived_tables("orders", list(ROLLUPS) + list(HEATMAPS) + ["customers", "restaurants"])
+
+
+def key_columns(name):
+    key, bucket, _ = ROLLUPS[name]
+    return [bucket] if key is None else [key, bucket]
+
+
+def create_rollup_table(name):
+    key, bucket, _ = ROLLUPS[name]
+    columns = [] if key is None else [f"{key} INTEGER NOT NULL"]
+    columns.append(f"{bucket} TEXT NOT NULL")
+    columns += [
+        f"{measure} {'REAL' if measure.endswith('total') or measure == 'revenue' else 'INTEGER'} NOT NULL DEFAULT 0"
+        for measure in MEASURES
+    ]
+    columns.append(f"PRIMARY KEY ({', '.join(key_columns(name))})")
+    return f"CREATE TABLE IF NOT EXISTS {name} (\n    " + ",\n    ".join(columns) + "\n) WITHOUT ROWID;"
+
+
+def bucket_value(expression, row):
+    return f"COALESCE({expression.replace('order_date', f'{row}.order_date')}, '')"
+
+
+# Statement that adds (sign=1) or removes (sign=-1) one order row in a rollup
+def apply_row(name, row, sign):
+    key, bucket, expression = ROLLUPS[name]
+    keys = [] if key is None else [f"COALESCE({row}.{key}, 0)"]
+    keys.append(bucket_value(expression, row))
+    values = ", ".join(keys + [f"{sign} * ({MEASURES[measure].format(row=row)})" for measure in MEASURES])
+    updates = ", ".join(f"{measure} = {measure} + excluded.{measure}" for measure in MEASURES)
+    columns = ", ".join(key_columns(name) + list(MEASURES))
+    return (
+        f"INSERT INTO {name} ({columns}) VALUES ({values}) "
+        f"ON CONFLICT ({', '.join(key_columns(name))}) DO UPDATE SET {updates};"
+    )
+
+
+# Statement that drops the bucket an order left once it holds no orders
+def prune_row(name, row):
+    key, bucket, expression = ROLLUPS[name]
+    condition = "" if key is None else f"{key} = COALESCE({row}.{key}, 0) AND "
+    return f"DELETE FROM {name} WHERE {condition}{bucket} = {bucket_value(expression, row)} AND order_count = 0;"
+
+
+def heatmap_keys(name, row):
+    key = HEATMAPS[name]
+    keys = [] if key is None else [f"COALESCE({row}.{key}, 0)"]
+    return keys + [f"COALESCE({expression.replace('order_date', f'{row}.order_date')}, -1)"
+                   for expression in HEATMAP_BUCKETS.values()]
+
+
+def apply_heatmap_row(name, row, sign):
+    columns = ", ".join(heatmap_columns(name))
+    return (
+        f"INSERT INTO {name} ({columns}, order_count) VALUES ({', '.join(heatmap_keys(name, row))}, {sign}) "
+        f"ON CONFLICT ({columns}) DO UPDATE SET order_count = order_count + excluded.order_count;"
+    )
+
+
+def prune_heatmap_row(name, row):
+    condition = " AND ".join(f"{column} = {value}" for column, value in zip(heatmap_columns(name), heatmap_keys(name, row)))
+    return f"DELETE FROM {name} WHERE {condition} AND order_count = 0;"
+
+
+def apply_total_orders(row, sign):
+    return [
+        f"UPDATE customers SET total_orders = COALESCE(total_orders, 0) + {sign} WHERE customer_id = {row}.customer_id;",
+        f"UPDATE restaurants SET total_orders = COALESCE(total_orders, 0) + {sign} WHERE restaurant_id = {row}.restaurant_id;",
+    ]
+
+
+# Row triggers on an orders table (orders itself, or each of its partitions).
+# The heatmap has triggers of its own, so databases created before it get them too.
+def trigger_statements(table="orders"):
+    add = [apply_row(name, "NEW", 1) for name in ROLLUPS] + apply_total_orders("NEW", 1)
+    remove = [apply_row(name, "OLD", -1) for name in ROLLUPS] + apply_total_orders("OLD", -1)
+    prune = [prune_row(name, "OLD") for name in ROLLUPS]
+    heatmap_add = [apply_heatmap_row(name, "NEW", 1) for name in HEATMAPS]
+    heatmap_remove = [apply_heatmap_row(name, "OLD", -1) for name in HEATMAPS]
+    heatmap_prune = [prune_heatmap_row(name, "OLD") for name in HEATMAPS]
+    body = "\n    ".join
+    prefix = table.lower()
+    return {
+        f"{prefix}_rollup_insert": f"CREATE TRIGGER IF NOT EXISTS {prefix}_rollup_insert AFTER INSERT ON {table} BEGIN\n    {body(add)}\nEND;",
+        f"{prefix}_rollup_delete": f"CREATE TRIGGER IF NOT EXISTS {prefix}_rollup_delete AFTER DELETE ON {table} BEGIN\n    {body(remove + prune)}\nEND;",
+        f"{prefix}_rollup_update": (
+            f"CREATE TRIGGER IF NOT EXISTS {prefix}_rollup_update AFTER UPDATE OF {', '.join(TRACKED_COLUMNS)} ON {table} "
+            f"BEGIN\n    {body(remove + add + prune)}\nEND;"
+        ),
+        f"{prefix}_heatmap_insert": (
+            f"CREATE TRIGGER IF NOT EXISTS {prefix}_heatmap_insert AFTER INSERT ON {table} "
+            f"BEGIN\n    {body(heatmap_add)}\nEND;"
+        ),
+        f"{prefix}_heatmap_delete": (
+            f"CREATE TRIGGER IF NOT EXISTS {prefix}_heatmap_delete AFTER DELETE ON {table} "
+            f"BEGIN\n    {body(heatmap_remove + heatmap_prune)}\nEND;"
+        ),
+        f"{prefix}_heatmap_update": (
+            f"CREATE TRIGGER IF NOT EXISTS {prefix}_heatmap_update AFTER UPDATE OF restaurant_id, order_date ON {table} "
+            f"BEGIN\n    {body(heatmap_remove + heatmap_add + heatmap_prune)}\nEND;"
+        ),
+    }
+
+
+def rollups_installed(conn):
+    names = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    return all(name in names for name in ROLLUPS)
+
+
+def heatmap_installed(conn):
+    names = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    return all(name in names for name in HEATMAPS)
+
+
+def drop_rollup_triggers(conn):
+    conn.execute(CREATE_ROLLUP_STATE_TABLE)
+    conn.execute("INSERT OR IGNORE INTO rollup_state (name) VALUES (?)", (DEFERRED,))
+    for table in order_tables(conn):
+        for trigger in trigger_statements(table):
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.commit()
+
+
+def rebuild_rollups(conn):
+    """
+    Recompute every rollup and the customers/restaurants total_orders columns.
+    orders is scanned once per entity for the daily rollups; the other
+    rollups and the totals are then summed from the (much smaller) daily ones.
+    """
+    started = time.perf_counter()
+    sums = ", ".join(f"SUM({measure})" for measure in MEASURES)
+    with conn:
+        for name in ROLLUPS:
+            conn.execute(f"DELETE FROM {name}")
+        for name in ("restaurant_daily_stats", "customer_daily_stats"):
+            key, bucket, expression = ROLLUPS[name]
+            measures = ", ".join(f"SUM({MEASURES[measure].format(row='orders')})" for measure in MEASURES)
+            conn.execute(
+                f"INSERT INTO {name} ({key}, {bucket}, {', '.join(MEASURES)}) "
+                f"SELECT COALESCE(orders.{key}, 0), {bucket_value(expression, 'orders')}, {measures} "
+                f"FROM orders GROUP BY 1, 2"
+            )
+        conn.execute(
+            f"INSERT INTO order_daily_stats (day, {', '.join(MEASURES)}) "
+            f"SELECT day, {sums} FROM restaurant_daily_stats GROUP BY day"
+        )
+        for daily, monthly in (("restaurant_daily_stats", "restaurant_monthly_stats"),
+                               ("customer_daily_stats", "customer_monthly_stats")):
+            key = ROLLUPS[daily][0]
+            conn.execute(
+                f"INSERT INTO {monthly} ({key}, month, {', '.join(MEASURES)}) "
+                f"SELECT {key}, substr(day, 1, 7), {sums} FROM {daily} GROUP BY 1, 2"
+            )
+        conn.execute(
+            "UPDATE customers SET total_orders = COALESCE((SELECT SUM(order_count) FROM customer_monthly_stats s "
+            "WHERE s.customer_id = customers.customer_id), 0)"
+        )
+        conn.execute(
+            "UPDATE restaurants SET total_orders = COALESCE((SELECT SUM(order_count) FROM restaurant_monthly_stats s "
+            "WHERE s.restaurant_id = restaurants.restaurant_id), 0)"
+        )
+        rebuild_heatmap(conn)
+    return time.perf_counter() - started
+
+
+def heatmap_counts_query(name):
+    return f"SELECT {', '.join(heatmap_keys(name, 'orders'))}, COUNT(*) FROM orders GROUP BY {', '.join(heatmap_keys(name, 'orders'))}"
+
+
+def rebuild_heatmap(conn):
+    # The totals are summed from the per-restaurant cells rather than from orders
+    conn.execute(f"DELETE FROM {HEATMAP}")
+    conn.execute(f"INSERT INTO {HEATMAP} ({', '.join(heatmap_columns(HEATMAP))}, order_count) {heatmap_counts_query(HEATMAP)}")
+    conn.execute("DELETE FROM order_heatmap_totals")
+    conn.execute(f"INSERT INTO order_heatmap_totals (weekday, hour, order_count) "
+                 f"SELECT weekday, hour, SUM(order_count) FROM {HEATMAP} GROUP BY weekday, hour")
+
+
+def reconcile_heatmap(conn):
+    """
+    Recount the heatmaps from orders and correct every cell that has drifted
+    from it, e.g. through writes made while the triggers were dropped. Meant to
+    run periodically; returns the number of cells corrected.
+    """
+    corrected = 0
+    with conn:
+        for name in HEATMAPS:
+            cells = ", ".join(heatmap_columns(name) + ["order_count"])
+            actual = "SELECT * FROM temp.heatmap_actual"
+            conn.execute("DROP TABLE IF EXISTS temp.heatmap_actual")
+            conn.execute(f"CREATE TEMP TABLE heatmap_actual AS {heatmap_counts_query(name)}")
+            drifted = conn.execute(
+                f"SELECT (SELECT COUNT(*) FROM ({actual} EXCEPT SELECT {cells} FROM {name})) + "
+                f"(SELECT COUNT(*) FROM (SELECT {cells} FROM {name} EXCEPT {actual}))"
+            ).fetchone()[0]
+            if drifted:
+                conn.execute(f"DELETE FROM {name}")
+                conn.execute(f"INSERT INTO {name} ({cells}) {actual}")
+            conn.execute("DROP TABLE temp.heatmap_actual")
+            corrected += drifted
+        conn.execute(CREATE_ROLLUP_STATE_TABLE)
+        conn.execute(
+            "INSERT INTO rollup_state (name, reconciled_at, corrected) VALUES (?, datetime('now'), ?) "
+            "ON CONFLICT (name) DO UPDATE SET reconciled_at = excluded.reconciled_at, corrected = excluded.corrected",
+            (HEATMAP, corrected),
+        )
+    return corrected
+
+
+# (reconciled_at, corrected) for the last heatmap reconciliation, or None
+def last_reconciled(conn):
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rollup_state'").fetchone() is None:
+        return None
+    return conn.execute("SELECT reconciled_at, corrected FROM rollup_state WHERE name = ?", (HEATMAP,)).fetchone()
+
+
+def rollups_deferred(conn):
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rollup_state'").fetchone() is None:
+        return False
+    return conn.execute("SELECT 1 FROM rollup_state WHERE name = ?", (DEFERRED,)).fetchone() is not None
+
+
+def install_rollups(conn, rebuild=None):
+    """
+    Create the rollup tables and the triggers on orders that keep them current.
+    The rollups are rebuilt from orders when they are new, when their triggers
+    were dropped by a load that did not finish, or when rebuild=True.
+    Returns the time spent rebuilding, in seconds.
+    """
+    if rebuild is None:
+        rebuild = not rollups_installed(conn) or rollups_deferred(conn)
+    new_heatmap = not heatmap_installed(conn)
+    for name in ROLLUPS:
+        conn.execute(create_rollup_table(name))
+    for name in HEATMAPS:
+        conn.execute(create_heatmap_table(name))
+    for table in order_tables(conn):
+        for statement in trigger_statements(table).values():
+            conn.execute(statement)
+    conn.commit()
+    if rebuild:
+        elapsed = rebuild_rollups(conn)
+        with conn:
+            conn.execute(CREATE_ROLLUP_STATE_TABLE)
+            conn.execute("DELETE FROM rollup_state WHERE name = ?", (DEFERRED,))
+        return elapsed
+    if new_heatmap:
+        with conn:
+            rebuild_heatmap(conn)
+    return 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the order rollup tables.")
+    parser.add_argument("command", choices=["install", "rebuild", "reconcile"],
+                        help="create tables and triggers, recompute all rollups and restore their triggers, "
+                             "or correct drift in the order heatmap")
+    parser.add_argument("--db", default="food_delivery.db", help="SQLite database file")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.command == "install":
+        install_rollups(conn)
+        print("Rollup tables and triggers installed.")
+    elif args.command == "rebuild":
+        # Also puts back the triggers an interrupted bulk load dropped
+        elapsed = install_rollups(conn, rebuild=True)
+        print(f"Rollups and triggers rebuilt in {elapsed:.2f}s.")
+    else:
+        corrected = reconcile_heatmap(conn)
+        print(f"Order heatmap reconciled, {corrected} cells corrected.")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
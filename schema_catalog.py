@@ -0,0 +1,159 @@
+import sqlite3
+import threading
+import pagination
+
+# Every table and view with its columns, and every index with its columns, in
+# one statement each through the pragma table-valued functions
+TABLES_QUERY = "SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view')"
+COLUMNS_QUERY = """
+SELECT m.name, c.name, c.type, c."notnull", c.dflt_value, c.pk
+FROM sqlite_master m
+JOIN pragma_table_info(m.name) c
+WHERE m.type IN ('table', 'view')
+ORDER BY m.name, c.cid
+"""
+INDEXES_QUERY = """
+SELECT m.name, l.name, l."unique", i.name
+FROM sqlite_master m
+JOIN pragma_index_list(m.name) l
+JOIN pragma_index_info(l.name) i
+WHERE m.type = 'table'
+ORDER BY m.name, l.name, i.seqno
+"""
+
+
+class Column:
+    def __init__(self, name, declared_type, not_null, default, primary_key):
+        self.name = name
+        self.declared_type = declared_type
+        self.not_null = bool(not_null)
+        self.default = default
+        self.primary_key = primary_key
+
+
+class Index:
+    def __init__(self, name, unique):
+        self.name = name
+        self.unique = bool(unique)
+        # None for an expression column
+        self.columns = []
+
+
+class TableInfo:
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.columns = []
+        self.indexes = []
+
+    @property
+    def column_names(self):
+        return [column.name for column in self.columns]
+
+    @property
+    def primary_key(self):
+        """
+        Name of the column that identifies a row, resolved the same way as
+        pagination.primary_key.
+        """
+        key_columns = [column for column in self.columns if column.primary_key]
+        if len(key_columns) == 1:
+            return key_columns[0].name
+        if self.kind == "view" and self.columns:
+            return self.columns[0].name
+        return "rowid"
+
+
+class Schema:
+    """
+    Tables, views, columns and indexes of the database as of one schema_version.
+    Names are looked up case-insensitively, like SQLite does.
+    """
+
+    def __init__(self, version, tables):
+        self.version = version
+        self._tables = {table.name.lower(): table for table in tables}
+
+    def table(self, name):
+        return self._tables.get(name.lower())
+
+    def table_names(self, kind="table"):
+        return [table.name for table in self._tables.values() if table.kind == kind]
+
+
+def column_rows(conn, tables):
+    try:
+        return conn.execute(COLUMNS_QUERY).fetchall()
+    except sqlite3.OperationalError:
+        pass  # a view over a dropped table or column fails the joined query; skip just that view
+    rows = []
+    for table in tables:
+        try:
+            rows += [(table.name,) + row[1:] for row in conn.execute(f'PRAGMA table_info("{table.name}")')]
+        except sqlite3.OperationalError:
+            continue
+    return rows
+
+
+def load_schema(conn):
+    # schema_version is read first: if DDL lands while loading, the newer
+    # schema is kept under the older version and simply reloaded next time
+    version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    tables = {name.lower(): TableInfo(name, kind) for name, kind in conn.execute(TABLES_QUERY)}
+    for table, name, declared_type, not_null, default, primary_key in column_rows(conn, tables.values()):
+        tables[table.lower()].columns.append(Column(name, declared_type, not_null, default, primary_key))
+    for table, index_name, unique, column in conn.execute(INDEXES_QUERY):
+        indexes = tables[table.lower()].indexes
+        if not indexes or indexes[-1].name != index_name:
+            indexes.append(Index(index_name, unique))
+        indexes[-1].columns.append(column)
+    return Schema(version, tables.values())
+
+
+class SchemaCatalog:
+    """
+    Process-wide cache of the database schema. current() costs one PRAGMA
+    schema_version and reloads the schema only when it has changed, which any
+    DDL statement does whichever connection or process ran it. Row-count
+    estimates are kept per table until the table is written or the schema changes.
+    """
+
+    def __init__(self):
+        self._schema = None
+        self._estimates = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def current(self, conn):
+        version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        with self._lock:
+            if self._schema is None or self._schema.version != version:
+                self._schema = load_schema(conn)
+                self._estimates = {}
+                self.loads += 1
+            return self._schema
+
+    def invalidate(self):
+        with self._lock:
+            self._schema = None
+            self._estimates = {}
+
+    def row_estimate(self, conn, table):
+        key = table.lower()
+        with self._lock:
+            if key in self._estimates:
+                return self._estimates[key]
+        try:
+            estimate = pagination.estimate_row_count(conn, table)
+        except sqlite3.OperationalError:
+            # A WITHOUT ROWID table with a composite key has no single column to seek on
+            estimate = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        with self._lock:
+            self._estimates[key] = estimate
+        return estimate
+
+    # Drop the estimates of tables that were written, e.g. from tables_written
+    def forget_estimates(self, tables):
+        with self._lock:
+            for table in tables:
+                self._estimates.pop(table.lower(), None)
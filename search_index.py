@@ -0,0 +1,186 @@
+import argparse
+import re
+import sqlite3
+import time
+from query_cache import register_derived_tables
+
+# FTS5 indexes over the text columns operators search by, as
+# table -> (key column, indexed columns). Each index is an external-content
+# FTS5 table named <table>_search whose rowid is the table's key, so it stores
+# only the index and lookups join back to the table for the row itself.
+SEARCH_INDEXES = {
+    "customers": ("customer_id", ["name", "email", "phone", "location"]),
+    "restaurants": ("restaurant_id", ["name", "owner_name", "cuisine_type", "location"]),
+}
+
+# Prefix indexes for 2 and 3 characters, so short typeahead prefixes are
+# answered from a single index term instead of a scan of every longer term
+PREFIX_LENGTHS = "2 3"
+MIN_QUERY_LENGTH = 2
+DEFAULT_LIMIT = 10
+
+# Matches scored per search. bm25 has to count every row holding a term, so
+# scoring all matches of a common prefix costs a pass over most of the index;
+# typeahead ranks the first candidates found instead, and a more specific
+# query narrows the candidates down to the rows wanted.
+CANDIDATE_LIMIT = 200
+
+# bm25 weight of the first indexed column (the name) relative to the others
+NAME_WEIGHT = 4.0
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+for _table in SEARCH_INDEXES:
+    register_derived_tables(_table, [f"{_table}_search"])
+
+
+def search_table(table):
+    return f"{table.lower()}_search"
+
+
+def create_search_table(table):
+    key, columns = SEARCH_INDEXES[table]
+    return (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {search_table(table)} USING fts5("
+        f"{', '.join(columns)}, content='{table}', content_rowid='{key}', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='{PREFIX_LENGTHS}')"
+    )
+
+
+def trigger_statements(table):
+    """
+    Triggers that keep the search index of table in step with it. External
+    content indexes remove a row by being handed its old values.
+    """
+    key, columns = SEARCH_INDEXES[table]
+    index = search_table(table)
+    names = ", ".join(columns)
+    add = f"INSERT INTO {index} (rowid, {names}) VALUES (NEW.{key}, {', '.join(f'NEW.{c}' for c in columns)});"
+    remove = (f"INSERT INTO {index} ({index}, rowid, {names}) "
+              f"VALUES ('delete', OLD.{key}, {', '.join(f'OLD.{c}' for c in columns)});")
+    return {
+        f"{index}_insert": f"CREATE TRIGGER IF NOT EXISTS {index}_insert AFTER INSERT ON {table} BEGIN\n    {add}\nEND;",
+        f"{index}_delete": f"CREATE TRIGGER IF NOT EXISTS {index}_delete AFTER DELETE ON {table} BEGIN\n    {remove}\nEND;",
+        # Only the indexed columns, so the total_orders counters kept by the
+        # rollup triggers do not rewrite the index on every order
+        f"{index}_update": (
+            f"CREATE TRIGGER IF NOT EXISTS {index}_update AFTER UPDATE OF {key}, {names} ON {table} BEGIN\n"
+            f"    {remove}\n    {add}\nEND;"
+        ),
+    }
+
+
+def search_installed(conn):
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return all(search_table(table) in names for table in SEARCH_INDEXES)
+
+
+# Drop the index triggers for a bulk load; install_search(conn, rebuild=True) restores them
+def drop_search_triggers(conn):
+    for table in SEARCH_INDEXES:
+        for name in trigger_statements(table):
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.commit()
+
+
+def rebuild_search(conn):
+    """
+    Rebuild every search index from its table. Returns the time taken in seconds.
+    """
+    started = time.perf_counter()
+    with conn:
+        for table in SEARCH_INDEXES:
+            index = search_table(table)
+            conn.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+            conn.execute(f"INSERT INTO {index} ({index}) VALUES ('optimize')")
+    return time.perf_counter() - started
+
+
+def install_search(conn, rebuild=None):
+    """
+    Create the search indexes and their triggers. The indexes are built from
+    their tables when they are new, or when rebuild=True.
+    """
+    if rebuild is None:
+        rebuild = not search_installed(conn)
+    for table in SEARCH_INDEXES:
+        conn.execute(create_search_table(table))
+        for statement in trigger_statements(table).values():
+            conn.execute(statement)
+    conn.commit()
+    if rebuild:
+        return rebuild_search(conn)
+    return 0.0
+
+
+def match_expression(text):
+    """
+    FTS5 query for what has been typed so far: every word must match, the last
+    one as a prefix since it may still be incomplete. Words are quoted, so
+    operators and punctuation in the input are searched for literally.
+    Returns None when there is nothing to search for yet.
+    """
+    tokens = TOKEN_PATTERN.findall(text)
+    if not tokens or len(text.strip()) < MIN_QUERY_LENGTH:
+        return None
+    # A single character has no prefix index to read, so it is matched whole
+    terms = [f'"{token}"' for token in tokens]
+    if len(tokens[-1]) >= MIN_QUERY_LENGTH:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_query(table, limit=DEFAULT_LIMIT):
+    """
+    Best of the candidate matches first by bm25, name matches weighted up,
+    joined back to the table for the displayed columns. Only rowids are read
+    from the index, so it never has to look up its external content.
+    """
+    key, columns = SEARCH_INDEXES[table]
+    index = search_table(table)
+    weights = ", ".join(str(NAME_WEIGHT if position == 0 else 1.0) for position in range(len(columns)))
+    return (
+        f"SELECT t.{key}, {', '.join(f't.{c}' for c in columns)} "
+        f"FROM (SELECT rowid, bm25({index}, {weights}) AS score FROM {index} WHERE {index} MATCH ? "
+        f"LIMIT {CANDIDATE_LIMIT}) s "
+        f"JOIN {table} t ON t.{key} = s.rowid ORDER BY s.score LIMIT {int(limit)}"
+    )
+
+
+def search(conn, table, text, limit=DEFAULT_LIMIT):
+    """
+    Rows of table matching the typed text as (columns, rows), best first.
+    """
+    key, columns = SEARCH_INDEXES[table.lower()]
+    expression = match_expression(text)
+    if expression is None:
+        return [key] + columns, []
+    return [key] + columns, conn.execute(search_query(table.lower(), limit), (expression,)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the customer and restaurant search indexes.")
+    parser.add_argument("command", choices=["install", "rebuild", "search"],
+                        help="create the indexes and triggers, rebuild them from their tables, or run a search")
+    parser.add_argument("--db", default="food_delivery.db", help="SQLite database file")
+    parser.add_argument("--table", choices=list(SEARCH_INDEXES), default="customers", help="table to search")
+    parser.add_argument("--text", default="", help="text to search for")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.command == "install":
+        install_search(conn)
+        print("Search indexes and triggers installed.")
+    elif args.command == "rebuild":
+        elapsed = rebuild_search(conn)
+        print(f"Search indexes rebuilt in {elapsed:.2f}s.")
+    else:
+        columns, rows = search(conn, args.table, args.text)
+        print(" | ".join(columns))
+        for row in rows:
+            print(" | ".join(str(value) for value in row))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+import argparse
+import re
+import sqlite3
+import time
+from change_log import CHANGE_TABLES, change_log_installed, create_change_triggers, trigger_names
+from database import create_connection
+from pagination import estimate_row_count
+from partitions import is_partitioned, order_tables
+
+# Online rebuild of a table into a new shape, for changes SQLite can only make
+# by recreating the table (dropping a column). The new table is filled in
+# rowid batches, each in its own short transaction so other writers keep
+# going, and its indexes are then built one per transaction under temporary
+# names. Triggers log the rowids written meanwhile; those rows are copied
+# again before the tables are swapped in one final transaction that only
+# has to move names around.
+DEFAULT_BATCH_SIZE = 10_000
+
+# After each transaction the rebuild pauses for as long as it held the lock,
+# up to this long, so waiting writers get a turn: SQLite's busy handler polls
+# at most every 100ms and would miss shorter gaps.
+MAX_PAUSE_SECONDS = 0.1
+
+# Catch-up passes made outside the final transaction before swapping anyway
+MAX_CATCH_UP_ROUNDS = 10
+
+REBUILD_SUFFIX = "__rebuild"
+LOG_SUFFIX = "__rebuild_log"
+
+TABLE_CONSTRAINT_PATTERN = re.compile(r"^(CONSTRAINT|PRIMARY|UNIQUE|CHECK|FOREIGN)\b", re.IGNORECASE)
+NAME = r'(?:"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|\w+)'
+INDEX_PATTERN = re.compile(rf"^(CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?)({NAME})(\s+ON\s+)({NAME})", re.IGNORECASE)
+
+
+class TableRebuildError(Exception):
+    pass
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def unquote(name):
+    if name[:1] in ('"', "`", "[") and len(name) > 1:
+        return name[1:-1]
+    return name
+
+
+def mentions(sql, column):
+    return re.search(rf"(?<![\w$]){re.escape(column)}(?![\w$])", sql, re.IGNORECASE) is not None
+
+
+def split_definitions(sql):
+    """
+    Split a CREATE TABLE statement into (head, definitions, tail): the text up
+    to the opening parenthesis, the column and constraint definitions, and what
+    follows the closing parenthesis (e.g. WITHOUT ROWID).
+    """
+    start = sql.index("(")
+    definitions, depth, current, quote_char = [], 0, [], None
+    for position in range(start + 1, len(sql)):
+        char = sql[position]
+        if quote_char:
+            if char == quote_char:
+                quote_char = None
+        elif char in "'\"`":
+            quote_char = char
+        elif char == "[":
+            quote_char = "]"
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            if depth == 0:
+                definitions.append("".join(current).strip())
+                return sql[:start], definitions, sql[position + 1:]
+            depth -= 1
+        elif char == "," and depth == 0:
+            definitions.append("".join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    raise TableRebuildError("Could not parse the table definition.")
+
+
+def definition_column(definition):
+    if TABLE_CONSTRAINT_PATTERN.match(definition):
+        return None
+    match = re.match(rf"({NAME}|\S+)", definition)
+    return unquote(match.group(1))
+
+
+# (type, name, table, sql) of every index, trigger and view with SQL of its own
+def dependent_sql(conn):
+    return conn.execute(
+        "SELECT type, name, tbl_name, sql FROM sqlite_master WHERE type IN ('index', 'trigger', 'view') AND sql IS NOT NULL"
+    ).fetchall()
+
+
+def plan_drop_column(conn, table, column):
+    """
+    Check that column can be dropped from table and work out the rebuild:
+    returns (create_sql, kept_columns, indexes, trigger_sql, dropped_indexes),
+    where indexes holds (name, sql) of the indexes to carry over.
+    Indexes on the column are dropped with it; anything else that uses it
+    (a table constraint, a trigger on the table, a view or trigger naming both
+    the table and the column) has to be changed first.
+    """
+    row = conn.execute("SELECT type, sql FROM sqlite_master WHERE name = ? COLLATE NOCASE AND type IN ('table', 'view')",
+                       (table,)).fetchone()
+    if row is None:
+        raise TableRebuildError(f"Table '{table}' does not exist.")
+    if row[0] == "view" or (is_partitioned(conn) and table.lower() in {name.lower() for name in order_tables(conn)}):
+        raise TableRebuildError(f"'{table}' is a view or an orders partition; its columns cannot be changed here.")
+    head, definitions, tail = split_definitions(row[1])
+    if "WITHOUT ROWID" in tail.upper():
+        raise TableRebuildError(f"'{table}' is a WITHOUT ROWID table and cannot be rebuilt online.")
+
+    columns = [definition_column(definition) for definition in definitions]
+    if column.lower() not in {name.lower() for name in columns if name}:
+        raise TableRebuildError(f"Column '{column}' does not exist in table '{table}'.")
+    if len([name for name in columns if name]) == 1:
+        raise TableRebuildError(f"'{column}' is the only column of '{table}'.")
+    kept = []
+    for name, definition in zip(columns, definitions):
+        if name is not None and name.lower() == column.lower():
+            if re.search(r"\bPRIMARY\s+KEY\b", definition, re.IGNORECASE):
+                raise TableRebuildError(f"'{column}' is the primary key of '{table}'.")
+            continue
+        if mentions(definition, column):
+            raise TableRebuildError(f"'{column}' is used by the definition '{definition}'.")
+        kept.append(definition)
+
+    # The change log triggers name every column; they are generated afresh for the new table
+    regenerated = {name.lower() for name in trigger_names(table.lower())} if table.lower() in CHANGE_TABLES else set()
+    indexes, trigger_sql, dropped_indexes = [], [], []
+    for kind, name, owner, sql in dependent_sql(conn):
+        on_table = kind != "view" and owner.lower() == table.lower()
+        if on_table and name.lower() in regenerated:
+            continue
+        if on_table and not mentions(sql, column):
+            if kind == "index":
+                indexes.append((name, sql))
+            else:
+                trigger_sql.append(sql)
+        elif on_table and kind == "index":
+            dropped_indexes.append(name)
+        elif mentions(sql, column) and (on_table or mentions(sql, table)):
+            raise TableRebuildError(f"'{column}' is used by {kind} '{name}'; drop or change it first.")
+
+    create_sql = f"CREATE TABLE {quote(table + REBUILD_SUFFIX)} (\n    " + ",\n    ".join(kept) + f"\n){tail}"
+    kept_columns = [name for name in columns if name and name.lower() != column.lower()]
+    return create_sql, kept_columns, indexes, trigger_sql, dropped_indexes
+
+
+# The statement creating an index's stand-in on the new table, under a temporary name
+def shadow_index_sql(table, name, sql):
+    return INDEX_PATTERN.sub(lambda match: f"{match.group(1)}{quote(name + REBUILD_SUFFIX)}{match.group(3)}"
+                                           f"{quote(table + REBUILD_SUFFIX)}", sql, count=1)
+
+
+def restore_index_names(conn, indexes):
+    """
+    Give the stand-in indexes their original names and SQL, inside the swap
+    transaction. SQLite cannot rename an index, so this edits sqlite_master
+    following the documented writable_schema procedure: only names change,
+    never the stored index, and the schema version is bumped so every
+    connection reloads the schema.
+    """
+    version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    conn.execute("PRAGMA writable_schema = ON")
+    try:
+        for name, sql in indexes:
+            conn.execute("UPDATE sqlite_master SET name = ?, sql = ? WHERE type = 'index' AND name = ?",
+                         (name, sql, name + REBUILD_SUFFIX))
+        conn.execute(f"PRAGMA schema_version = {version + 1}")
+    finally:
+        conn.execute("PRAGMA writable_schema = OFF")
+
+
+def capture_triggers(table):
+    log = quote(table + LOG_SUFFIX)
+    name = quote(table)
+    return [
+        f"CREATE TRIGGER {quote(table + REBUILD_SUFFIX + '_insert')} AFTER INSERT ON {name} "
+        f"BEGIN INSERT INTO {log} (row_key) VALUES (NEW.rowid); END;",
+        f"CREATE TRIGGER {quote(table + REBUILD_SUFFIX + '_update')} AFTER UPDATE ON {name} "
+        f"BEGIN INSERT INTO {log} (row_key) VALUES (OLD.rowid); INSERT INTO {log} (row_key) VALUES (NEW.rowid); END;",
+        f"CREATE TRIGGER {quote(table + REBUILD_SUFFIX + '_delete')} AFTER DELETE ON {name} "
+        f"BEGIN INSERT INTO {log} (row_key) VALUES (OLD.rowid); END;",
+    ]
+
+
+# Remove what an interrupted rebuild left behind, so the capture triggers stop logging
+def abandon_rebuild(conn, table):
+    with conn:
+        for event in ("insert", "update", "delete"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {quote(table + REBUILD_SUFFIX + '_' + event)}")
+        # Dropping the new table takes its stand-in indexes with it
+        conn.execute(f"DROP TABLE IF EXISTS {quote(table + REBUILD_SUFFIX)}")
+        conn.execute(f"DROP TABLE IF EXISTS {quote(table + LOG_SUFFIX)}")
+
+
+# Run statements in one transaction, then give waiting writers their turn.
+# Returns (rowcount, rows) per statement, read before the commit so that no
+# cursor keeps a stale read snapshot open.
+def run_batch(conn, *statements):
+    started = time.perf_counter()
+    with conn:
+        results = [(cursor.rowcount, cursor.fetchall()) for cursor in map(conn.execute, statements)]
+    time.sleep(min(time.perf_counter() - started, MAX_PAUSE_SECONDS))
+    return results
+
+
+def catch_up(conn, table, columns, batch_size, final=False):
+    """
+    Copy the rows logged so far again, deleting those that are gone. Outside the
+    final transaction this works through the log as it stood when called, in
+    batches of entries that each get their own transaction, so writers that keep
+    logging cannot hold it up. Returns the number of log entries applied.
+    """
+    new, log = quote(table + REBUILD_SUFFIX), quote(table + LOG_SUFFIX)
+    column_list = ", ".join(quote(name) for name in columns)
+    first, target = conn.execute(f"SELECT MIN(id), MAX(id) FROM {log}").fetchone()
+    if first is None:
+        return 0
+    low = first
+    while low <= target:
+        high = target if final else min(target, low + batch_size - 1)
+        keys = f"SELECT row_key FROM {log} WHERE id <= {high}"
+        statements = [
+            f"DELETE FROM {new} WHERE rowid IN ({keys})",
+            f"INSERT INTO {new} (rowid, {column_list}) SELECT rowid, {column_list} FROM {quote(table)} WHERE rowid IN ({keys})",
+            f"DELETE FROM {log} WHERE id <= {high}",
+        ]
+        if final:
+            for statement in statements:
+                conn.execute(statement)
+        else:
+            run_batch(conn, *statements)
+        low = high + 1
+    return target - first + 1
+
+
+def drop_column(conn, table, column, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Drop column from table without holding the write lock for the whole copy.
+    conn should be a connection of its own, since it commits after every batch.
+    progress(stage, done, total, elapsed_seconds) is called after each batch of
+    rows ("copy") and each index built ("index"). Indexes are built after the
+    copy because sorting the finished table writes far fewer pages than
+    updating them row by row. Returns (rows_copied, dropped_indexes, elapsed_seconds).
+    """
+    started = time.perf_counter()
+    abandon_rebuild(conn, table)
+    create_sql, columns, indexes, trigger_sql, dropped_indexes = plan_drop_column(conn, table, column)
+    column_list = ", ".join(quote(name) for name in columns)
+    name, new, log = quote(table), quote(table + REBUILD_SUFFIX), quote(table + LOG_SUFFIX)
+
+    # Writes are logged from the moment the copy can first see the table
+    with conn:
+        conn.execute("BEGIN")
+        conn.execute(create_sql)
+        conn.execute(f"CREATE TABLE {log} (id INTEGER PRIMARY KEY AUTOINCREMENT, row_key INTEGER NOT NULL)")
+        for sql in capture_triggers(table):
+            conn.execute(sql)
+    total = estimate_row_count(conn, table)
+
+    copied, after = 0, None
+    try:
+        while True:
+            where = "" if after is None else f"WHERE rowid > {after}"
+            (inserted, _), (_, last) = run_batch(conn, f"INSERT INTO {new} (rowid, {column_list}) SELECT rowid, {column_list} "
+                                           f"FROM {name} {where} ORDER BY rowid LIMIT {batch_size}",
+                                     f"SELECT MAX(rowid) FROM {new}")
+            if inserted == 0:
+                break
+            copied += inserted
+            after = last[0][0]
+            if progress:
+                progress("copy", copied, max(total, copied), time.perf_counter() - started)
+
+        for built, (index_name, sql) in enumerate(indexes, 1):
+            run_batch(conn, shadow_index_sql(table, index_name, sql))
+            if progress:
+                progress("index", built, len(indexes), time.perf_counter() - started)
+
+        for _ in range(MAX_CATCH_UP_ROUNDS):
+            if catch_up(conn, table, columns, batch_size) < batch_size:
+                break
+
+        # The swap: apply what is left of the log and replace the table. Foreign
+        # keys are off so dropping the old table does not check the rows that
+        # reference it, and the legacy rename leaves views and triggers naming
+        # the table alone instead of rejecting them while it is missing.
+        foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+        conn.execute("PRAGMA foreign_keys = OFF")
+        conn.execute("PRAGMA legacy_alter_table = ON")
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            catch_up(conn, table, columns, batch_size, final=True)
+            for event in ("insert", "update", "delete"):
+                conn.execute(f"DROP TRIGGER {quote(table + REBUILD_SUFFIX + '_' + event)}")
+            conn.execute(f"DROP TABLE {log}")
+            conn.execute(f"DROP TABLE {name}")
+            conn.execute(f"ALTER TABLE {new} RENAME TO {name}")
+            for sql in trigger_sql:
+                conn.execute(sql)
+            if table.lower() in CHANGE_TABLES and change_log_installed(conn):
+                create_change_triggers(conn, table.lower())
+            restore_index_names(conn, indexes)
+            violations = conn.execute(f"PRAGMA foreign_key_check({name})").fetchall()
+            if violations:
+                raise TableRebuildError(f"Rebuilding '{table}' would leave {len(violations)} foreign key violations.")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("PRAGMA legacy_alter_table = OFF")
+            conn.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+    except Exception:
+        abandon_rebuild(conn, table)
+        raise
+    return copied, dropped_indexes, time.perf_counter() - started
+
+
+# Rename a column in place. SQLite 3.25+ does this by editing the schema, which
+# takes no longer on a large table than on a small one, and updates the
+# indexes, triggers and views that refer to the column.
+def rename_column(conn, table, old_name, new_name):
+    if sqlite3.sqlite_version_info < (3, 25, 0):
+        raise TableRebuildError(f"Renaming columns requires SQLite 3.25 or later (found {sqlite3.sqlite_version}).")
+    with conn:
+        conn.execute(f"ALTER TABLE {quote(table)} RENAME COLUMN {quote(old_name)} TO {quote(new_name)}")
+        # The rename updates column references, but not the names the change log records
+        if table.lower() in CHANGE_TABLES and change_log_installed(conn):
+            create_change_triggers(conn, table.lower(), refresh=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drop or rename a column without locking the table for the copy.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    drop = subcommands.add_parser("drop-column", help="rebuild the table without the column")
+    drop.add_argument("table")
+    drop.add_argument("column")
+    drop.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rows copied per transaction")
+    rename = subcommands.add_parser("rename-column", help="rename a column in place")
+    rename.add_argument("table")
+    rename.add_argument("old_name")
+    rename.add_argument("new_name")
+    parser.add_argument("--db", default="food_delivery.db", help="SQLite database file")
+    args = parser.parse_args()
+
+    conn = create_connection(args.db)
+    conn.execute("PRAGMA busy_timeout = 5000")
+    try:
+        if args.command == "drop-column":
+            def report(stage, done, total, elapsed):
+                print(f"{done}/{total} {'rows copied' if stage == 'copy' else 'indexes built'} ({elapsed:.1f}s)")
+
+            copied, dropped_indexes, elapsed = drop_column(conn, args.table, args.column, args.batch_size, progress=report)
+            print(f"Dropped {args.column} from {args.table} in {elapsed:.2f}s ({copied} rows copied).")
+            if dropped_indexes:
+                print(f"Dropped indexes: {', '.join(dropped_indexes)}.")
+        else:
+            rename_column(conn, args.table, args.old_name, args.new_name)
+            print(f"Renamed {args.table}.{args.old_name} to {args.new_name}.")
+    except TableRebuildError as e:
+        print(f"Error: {e}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
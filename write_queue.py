@@ -0,0 +1,163 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from partitions import inserted_row_id
+
+# A group is committed once it holds MAX_BATCH writes or MAX_DELAY seconds
+# have passed since its first write arrived, whichever comes first. With no
+# delay a group is whatever queued up while the previous one was committing,
+# so groups grow with load and a lone write is never held back.
+DEFAULT_MAX_BATCH = 128
+DEFAULT_MAX_DELAY = 0.0
+
+# Attempts to start a group's transaction while another connection holds the lock
+BUSY_RETRIES = 5
+BUSY_BACKOFF_SECONDS = 0.05
+
+DEFAULT_WRITE_TIMEOUT = 30
+
+
+class WriteResult:
+    """
+    Confirmation handed back to a caller once its write is committed.
+    lastrowid is the new order's id for inserts into partitioned orders too.
+    """
+
+    def __init__(self, rowcount, lastrowid, group_size):
+        self.rowcount = rowcount
+        self.lastrowid = lastrowid
+        self.group_size = group_size
+
+
+class PendingWrite:
+    def __init__(self, query, params):
+        self.query = query
+        self.params = tuple(params)
+        self.future = Future()
+
+
+def is_busy(error):
+    message = str(error).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+class WriteQueue:
+    """
+    Single writer thread that takes writes from every session and commits them
+    in groups through the pool's writer connection: one transaction, and one
+    fsync, per group instead of per write. Each write runs in its own savepoint,
+    so a failing one is rolled back and reported to its caller alone.
+    """
+
+    def __init__(self, pool, max_batch=DEFAULT_MAX_BATCH, max_delay=DEFAULT_MAX_DELAY):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.writes = 0
+        self.groups = 0
+        self.largest_group = 0
+        self.busy_retries = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+        self._thread.start()
+
+    def submit(self, query, params=()):
+        """
+        Queue a write and return a Future that resolves to its WriteResult once
+        its group commits, or raises the error the write failed with.
+        """
+        write = PendingWrite(query, params)
+        self._queue.put(write)
+        return write.future
+
+    def execute(self, query, params=(), timeout=DEFAULT_WRITE_TIMEOUT):
+        return self.submit(query, params).result(timeout)
+
+    def stats(self):
+        return {
+            "writes": self.writes,
+            "groups": self.groups,
+            "average_group": self.writes / self.groups if self.groups else 0.0,
+            "largest_group": self.largest_group,
+            "busy_retries": self.busy_retries,
+        }
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            writes, stopping = self._collect()
+            if writes:
+                self._commit(writes)
+
+    def _collect(self):
+        """
+        Block for the first write, then gather more until the window closes.
+        Returns (writes, stopping); close() queues None to stop the thread.
+        """
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        writes = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(writes) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                write = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if write is None:
+                return writes, True
+            writes.append(write)
+        return writes, False
+
+    def _commit(self, writes):
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                with self.pool.writer() as conn:
+                    # Take the write lock up front, so a busy database fails here
+                    # rather than halfway through the group
+                    conn.execute("BEGIN IMMEDIATE")
+                    outcomes = [self._apply(conn, write) for write in writes]
+                break
+            except Exception as e:
+                if is_busy(e) and attempt < BUSY_RETRIES:
+                    self.busy_retries += 1
+                    time.sleep(BUSY_BACKOFF_SECONDS * 2 ** attempt)
+                    continue
+                if len(writes) > 1 and not is_busy(e):
+                    # The commit itself failed (e.g. a deferred constraint), so
+                    # find the culprit by committing the writes one at a time
+                    for write in writes:
+                        self._commit([write])
+                    return
+                for write in writes:
+                    write.future.set_exception(e)
+                return
+
+        self.writes += len(writes)
+        self.groups += 1
+        self.largest_group = max(self.largest_group, len(writes))
+        for write, outcome in zip(writes, outcomes):
+            if isinstance(outcome, Exception):
+                write.future.set_exception(outcome)
+            else:
+                write.future.set_result(WriteResult(outcome[0], outcome[1], len(writes)))
+
+    @staticmethod
+    def _apply(conn, write):
+        conn.execute("SAVEPOINT pending_write")
+        try:
+            cursor = conn.execute(write.query, write.params)
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK TO pending_write")
+            conn.execute("RELEASE pending_write")
+            return e
+        lastrowid = inserted_row_id(conn, write.query, cursor)
+        conn.execute("RELEASE pending_write")
+        return cursor.rowcount, lastrowid